@@ -0,0 +1,249 @@
+"""
+Streaming parsing and validation of bulk request bodies
+
+Rows are read from the request stream one at a time, validated against a
+pydantic model and re-encoded as CSV for COPY ... FROM STDIN. Only the
+validation errors and the current chunk are kept in memory.
+"""
+
+import csv
+import io
+import shutil
+import tempfile
+
+from flask import jsonify
+from pydantic import ValidationError
+
+from api.json_provider import loads
+from api.negotiation import NDJSON, error_response
+from constants.constants import (
+    BULK_MAX_ERRORS,
+    BULK_SPOOL_MEMORY,
+    COPY_CHUNK_SIZE,
+    STATUS_BAD_REQUEST,
+    STATUS_OK,
+)
+from db.db_utils import copy_line
+
+CSV = "text/csv"
+BULK_TYPES = {NDJSON, CSV}
+
+
+def ndjson_rows(stream):
+    """
+    yields (row number, object or error message) for each non-empty line
+    """
+    row_no = 0
+    for line in stream:
+        if not line.strip():
+            continue
+        row_no += 1
+        try:
+            yield row_no, loads(line)
+        except ValueError as err:
+            yield row_no, f"invalid JSON: {err}"
+
+
+def csv_rows(stream):
+    """
+    yields (row number, dict) for each row after the header
+    """
+    text = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+    # cells beyond the header go to an ignored field instead of a None key
+    reader = csv.DictReader(text, restkey="_extra")
+    for row_no, row in enumerate(reader, start=1):
+        yield row_no, row
+
+
+def parse_rows(mimetype, stream):
+    """
+    returns a row iterator over a binary stream, None for other mimetypes
+    """
+    if mimetype == NDJSON:
+        return ndjson_rows(stream)
+    if mimetype == CSV:
+        return csv_rows(stream)
+    return None
+
+
+def read_rows(request):
+    """
+    returns a row iterator over the request body, None for other mimetypes
+    """
+    return parse_rows(request.mimetype, io.BufferedReader(request.stream))
+
+
+def spool_body(request):
+    """
+    copies the request body to a temporary file, kept in memory while small,
+    so a background job can read it after the response was sent
+    """
+    # closed by the job reading it, after this request ended
+    # pylint: disable-next=consider-using-with
+    spool = tempfile.SpooledTemporaryFile(max_size=BULK_SPOOL_MEMORY)
+    shutil.copyfileobj(request.stream, spool, COPY_CHUNK_SIZE)
+    spool.seek(0)
+    return spool
+
+
+class TooManyErrors(ValueError):
+    """
+    Raised to abort the load once max_errors rows failed validation
+    """
+
+
+class RowSource:  # pylint: disable=too-many-instance-attributes
+    """
+    File-like source for COPY ... FROM STDIN
+
+    Each valid row is written as CSV with its row number first, followed by
+    columns in model field order, see copy_line(). Invalid rows are skipped and recorded.
+    """
+
+    def __init__(self, rows, model, max_errors=BULK_MAX_ERRORS):
+        """
+        constructor
+
+        parameter rows = iterator of (row number, dict or error message)
+        parameter model = pydantic model validating each row
+        """
+        self.rows = rows
+        self.model = model
+        self.columns = list(model.model_fields)
+        self.max_errors = max_errors
+        self.errors = []
+        self.count = 0
+        self.aborted = False
+        self.done = False
+        self.text = io.StringIO()
+        self.pending = b""
+
+    def read(self, size=-1):
+        """
+        returns up to size bytes of CSV, b"" at the end of the rows
+        """
+        if size is None or size < 0:
+            size = COPY_CHUNK_SIZE
+        while len(self.pending) < size and not self.done:
+            self._fill(size)
+        data = self.pending[:size]
+        self.pending = self.pending[size:]
+        return data
+
+    def _fill(self, size):
+        """
+        encodes rows until about size bytes are pending
+        """
+        for row_no, row in self.rows:
+            self._add(row_no, row)
+            if self.text.tell() >= size:
+                break
+        else:
+            self.done = True
+        self.pending += self.text.getvalue().encode()
+        self.text.seek(0)
+        self.text.truncate()
+
+    def _add(self, row_no, row):
+        """
+        validates one row and writes it, or records why it was rejected
+        """
+        if isinstance(row, str):
+            self._reject(row_no, [row])
+            return
+        if not isinstance(row, dict):
+            self._reject(row_no, ["expected an object"])
+            return
+        try:
+            item = self.model(**row)
+        except ValidationError as err:
+            self._reject(row_no, describe(err))
+            return
+        self.count += 1
+        self.text.write(
+            copy_line([row_no, *(getattr(item, column) for column in self.columns)])
+        )
+
+    def _reject(self, row_no, errors):
+        """
+        records a rejected row, aborting once there are too many
+        """
+        self.errors.append({"row": row_no, "errors": errors})
+        if len(self.errors) > self.max_errors:
+            self.aborted = True
+            raise TooManyErrors(f"more than {self.max_errors} invalid rows")
+
+
+def describe(err):
+    """
+    returns readable messages for a validation error
+    """
+    return [
+        f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}"
+        for error in err.errors()
+    ]
+
+
+def bulk_result(result, source, key):
+    """
+    returns the service result of a bulk load: the new keys by row number
+    and the rejected rows
+
+    parameter key = column of result rows holding the new key
+    """
+    if source.aborted:
+        return {
+            "status": STATUS_BAD_REQUEST,
+            "error": f"More than {source.max_errors} invalid rows, nothing loaded",
+            "errors": source.errors,
+        }
+    if result["status"] != STATUS_OK:
+        return result
+
+    data = {
+        "inserted": len(result["data"]),
+        "ids": [{"row": row["row"], key: row[key]} for row in result["data"]],
+        "errors": source.errors,
+    }
+    return {"status": 201, "data": data}
+
+
+def bulk_response(result, source, key):
+    """
+    returns the response of a bulk load
+    """
+    result = bulk_result(result, source, key)
+    if source.aborted:
+        return (
+            jsonify(error=result["error"], errors=result["errors"]),
+            STATUS_BAD_REQUEST,
+        )
+    if "error" in result:
+        return error_response(result)
+    return jsonify(status=result["status"], data=result["data"]), result["status"]
+
+
+def counted(rows, progress):
+    """
+    yields rows, reporting each one to progress
+    """
+    for row in rows:
+        yield row
+        progress(1)
+
+
+def bulk_job(mimetype, spool, model, service, key):
+    """
+    returns a job function loading a spooled bulk body through service
+
+    The job's progress counts the rows read; cancelling it aborts the COPY,
+    so nothing is loaded.
+    """
+
+    def run(job):
+        with spool:
+            rows = counted(parse_rows(mimetype, spool), job.progress)
+            source = RowSource(rows, model)
+            return bulk_result(service(source), source, key)
+
+    return run
@@ -0,0 +1,178 @@
+"""
+Columnar Arrow IPC and Parquet responses for analytics exports
+
+Rows are read in batches from a server-side cursor and converted to typed
+column arrays, one record batch (or Parquet row group) per batch.
+pyarrow is optional; without it these endpoints answer 501.
+"""
+
+import logging
+from itertools import islice
+
+import emoji
+from flask import Response, jsonify
+
+from api.negotiation import error_response, release_on_close
+from constants.constants import (
+    ACTOR,
+    COLUMNS,
+    DIRECTOR,
+    GENRE,
+    MOVIE,
+    MOVIE_ACTOR,
+    MOVIE_DIRECTOR,
+    MOVIE_GENRE,
+    MOVIE_REVIEW,
+    STATUS_OK,
+    STREAM_ITERSIZE,
+)
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+ARROW = "arrow"
+PARQUET = "parquet"
+
+MIMETYPES = {
+    ARROW: "application/vnd.apache.arrow.stream",
+    PARQUET: "application/vnd.apache.parquet",
+}
+
+# arrow type of every column that isn't a string; votes and metascore are
+# varchar in the database and stay strings
+TYPES = {
+    MOVIE: {
+        "movie_id": "int64",
+        "movie_year": "date32",
+        "rating": "float64",
+        "runtime": "float64",
+        "revenue": "float64",
+    },
+    ACTOR: {"actor_id": "int64", "age": "int64"},
+    DIRECTOR: {"director_id": "int64"},
+    GENRE: {"genre_id": "int64"},
+    MOVIE_ACTOR: {"movie_id": "int64", "actor_id": "int64"},
+    MOVIE_DIRECTOR: {"movie_id": "int64", "director_id": "int64"},
+    MOVIE_GENRE: {"movie_id": "int64", "genre_id": "int64"},
+    MOVIE_REVIEW: {"review_id": "int64", "movie_id": "int64", "review": "int64"},
+}
+
+
+def arrow_type(name):
+    """
+    returns the pyarrow type for a type name of TYPES
+    """
+    if name == "timestamp":
+        return pyarrow.timestamp("us")
+    return getattr(pyarrow, name)()
+
+
+def schema(table):
+    """
+    returns the arrow schema of table, created_at columns are timestamps
+    """
+    types = dict(TYPES[table], created_at="timestamp")
+    return pyarrow.schema(
+        [(column, arrow_type(types.get(column, "string"))) for column in COLUMNS[table]]
+    )
+
+
+def record_batch(rows, table_schema):
+    """
+    builds a record batch from a list of row dicts
+    """
+    columns = {}
+    for field in table_schema:
+        values = [row[field.name] for row in rows]
+        if pyarrow.types.is_floating(field.type):
+            # numeric columns arrive as Decimal
+            values = [None if value is None else float(value) for value in values]
+        columns[field.name] = values
+    return pyarrow.RecordBatch.from_pydict(columns, schema=table_schema)
+
+
+class _ChunkSink:
+    """
+    Writable file collecting what the arrow writers produce
+    """
+
+    closed = False
+
+    def __init__(self):
+        """
+        constructor
+        """
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        """
+        collects data
+        """
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        """
+        returns the number of bytes written
+        """
+        return self.position
+
+    def flush(self):
+        """
+        nothing to flush, chunks are taken by the response
+        """
+
+    def take(self):
+        """
+        returns and forgets the bytes written since the last call
+        """
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def columnar_response(result, table, fmt):
+    """
+    streams a service row iterator as an Arrow IPC stream or a Parquet file
+    """
+    if pyarrow is None:
+        if hasattr(result.get("data"), "close"):
+            result["data"].close()
+        return jsonify(error="pyarrow is not installed"), 501
+    if result["status"] != STATUS_OK:
+        return error_response(result)
+
+    table_schema = schema(table)
+    rows = result["data"]
+
+    def generate():
+        sink = _ChunkSink()
+        if fmt == PARQUET:
+            writer = pyarrow.parquet.ParquetWriter(sink, table_schema)
+        else:
+            writer = pyarrow.ipc.new_stream(sink, table_schema)
+        try:
+            while True:
+                batch = list(islice(rows, STREAM_ITERSIZE))
+                if not batch:
+                    break
+                writer.write_batch(record_batch(batch, table_schema))
+                yield sink.take()
+            writer.close()
+            yield sink.take()
+        except (pyarrow.ArrowException, TypeError, ValueError):
+            logging.error(emoji.emojize(f"Error exporting {table} :cross_mark:"))
+            raise
+
+    response = Response(
+        generate(),
+        mimetype=MIMETYPES[fmt],
+        headers={"Content-Disposition": f"attachment; filename={table}.{fmt}"},
+    )
+    return release_on_close(response, rows)
@@ -0,0 +1,156 @@
+"""
+Negotiated gzip/brotli response compression
+
+Bodies smaller than COMPRESS_MIN_SIZE (e.g. /health) are sent as they are.
+Compressed bodies are kept in a small cache keyed by encoding and a digest of
+the uncompressed body, so identical payloads, such as cached list and search
+results, are only compressed once. Streamed NDJSON and CSV responses are
+compressed chunk by chunk.
+"""
+
+import gzip
+import hashlib
+import zlib
+
+from flask import request
+
+from cache.cache import Cache, register
+from constants.constants import (
+    CACHE_HARD_TTL,
+    COMPRESS_BROTLI_QUALITY,
+    COMPRESS_CACHE_ENTRIES,
+    COMPRESS_GZIP_LEVEL,
+    COMPRESS_MIN_SIZE,
+)
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = {
+    "application/json",
+    "application/x-ndjson",
+    "text/csv",
+    "text/plain",
+    "text/html",
+}
+
+compressed_cache = register(
+    Cache("compressed", CACHE_HARD_TTL, CACHE_HARD_TTL, COMPRESS_CACHE_ENTRIES)
+)
+
+
+def choose_encoding():
+    """
+    returns the best encoding the client accepts, or None
+    """
+    offers = ["br", "gzip"] if brotli is not None else ["gzip"]
+    return request.accept_encodings.best_match(offers)
+
+
+def compress(body, encoding):
+    """
+    compresses a whole body
+    """
+    if encoding == "br":
+        return brotli.compress(body, quality=COMPRESS_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=COMPRESS_GZIP_LEVEL, mtime=0)
+
+
+def compress_cached(body, encoding):
+    """
+    compresses body, reusing the result for identical bodies
+    """
+    digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+    key = f"{encoding}:{digest}"
+    return compressed_cache.get_or_load(key, lambda: compress(body, encoding))
+
+
+class StreamCompressor:
+    """
+    Incremental compressor flushing after every chunk
+    """
+
+    def __init__(self, encoding):
+        """
+        constructor
+        """
+        self.encoding = encoding
+        if encoding == "br":
+            self.compressor = brotli.Compressor(quality=COMPRESS_BROTLI_QUALITY)
+        else:
+            # wbits=31 writes the gzip header and trailer
+            self.compressor = zlib.compressobj(COMPRESS_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def chunk(self, data):
+        """
+        compresses data so the client can decode it right away
+        """
+        if self.encoding == "br":
+            return self.compressor.process(data) + self.compressor.flush()
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        """
+        returns the end of the compressed stream
+        """
+        if self.encoding == "br":
+            return self.compressor.finish()
+        return self.compressor.flush()
+
+
+def compress_stream(chunks, encoding):
+    """
+    yields the compressed chunks of a streamed body
+    """
+    compressor = StreamCompressor(encoding)
+    try:
+        for chunk in chunks:
+            data = compressor.chunk(chunk.encode() if isinstance(chunk, str) else chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+def compress_response(response):
+    """
+    after_request hook compressing JSON, NDJSON and CSV bodies
+    """
+    if (
+        response.status_code < 200
+        or response.status_code in (204, 304)
+        or response.direct_passthrough
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE
+    ):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = choose_encoding()
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding)
+        response.headers.pop("Content-Length", None)
+        response.headers["Content-Encoding"] = encoding
+        return response
+
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return response
+
+    response.set_data(compress_cached(body, encoding))
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def init_app(app):
+    """
+    registers response compression on the app
+    """
+    app.after_request(compress_response)
@@ -0,0 +1,268 @@
+"""
+Idempotency keys for create and bulk endpoints
+
+A request carrying an Idempotency-Key header claims the key in the
+idempotency_key table before the handler runs, and the response is stored
+under the key afterwards. A retry with the same key gets the stored response
+without running the handler again, from any worker. A retry arriving while
+the first request is still running gets 409, a key reused with a different
+body gets 422. Keys expire after IDEMPOTENCY_TTL seconds; a claim whose
+request never finished can be taken over after IDEMPOTENCY_LOCK_TIMEOUT.
+
+Only successful responses are stored. Any other response releases the key,
+so the request can be retried with the same key: server errors, 409 and 429
+as well as a body reporting a failed service status (the create handlers
+answer 200 with {"status": 500} when the insert fails).
+
+usage: python -m api.idempotency    (installs the idempotency_key table)
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from functools import wraps
+
+import emoji
+from flask import Response, current_app, jsonify, request
+
+from api.negotiation import error_response
+from constants.constants import (
+    IDEMPOTENCY_LOCK_TIMEOUT,
+    IDEMPOTENCY_TTL,
+    SCHEMA_NAME,
+    STATUS_BAD_REQUEST,
+    STATUS_OK,
+)
+from db.Connection import Connection
+from db.db_utils import do_query
+from db.Query import Query
+
+IDEMPOTENCY_KEY = "idempotency_key"
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+# seconds between deletions of expired keys, per process
+PRUNE_INTERVAL = 60
+pruned_at = time.monotonic()
+prune_lock = threading.Lock()
+
+
+def ddl(schema):
+    """
+    returns the statement creating the key table
+    """
+    return f"""
+        CREATE TABLE IF NOT EXISTS {schema}.{IDEMPOTENCY_KEY} (
+            scope text NOT NULL,
+            key text NOT NULL,
+            fingerprint text,
+            status integer,
+            mimetype text,
+            body bytea,
+            created_at timestamptz NOT NULL DEFAULT now(),
+            PRIMARY KEY (scope, key)
+        );
+        CREATE INDEX IF NOT EXISTS {IDEMPOTENCY_KEY}_created_at
+            ON {schema}.{IDEMPOTENCY_KEY} (created_at);"""
+
+
+def claim(scope, key, fingerprint):
+    """
+    claims key for this request, 'data' is empty if another request holds it
+
+    Expired keys and claims left by requests that never finished are taken
+    over.
+    """
+    sql = f"""
+        INSERT INTO {SCHEMA_NAME}.{IDEMPOTENCY_KEY} (scope, key, fingerprint)
+        VALUES (%(scope)s, %(key)s, %(fingerprint)s)
+        ON CONFLICT (scope, key) DO UPDATE
+            SET fingerprint = EXCLUDED.fingerprint, status = NULL,
+                mimetype = NULL, body = NULL, created_at = now()
+            WHERE {IDEMPOTENCY_KEY}.created_at < now() - %(ttl)s * interval '1 second'
+                OR ({IDEMPOTENCY_KEY}.status IS NULL
+                    AND {IDEMPOTENCY_KEY}.created_at
+                        < now() - %(lock_timeout)s * interval '1 second')
+        RETURNING key;"""
+    params = {
+        "scope": scope,
+        "key": key,
+        "fingerprint": fingerprint,
+        "ttl": IDEMPOTENCY_TTL,
+        "lock_timeout": IDEMPOTENCY_LOCK_TIMEOUT,
+    }
+    return do_query(sql, params)
+
+
+def store(scope, key, response):
+    """
+    stores the response of the request holding key
+    """
+    sql = f"""
+        UPDATE {SCHEMA_NAME}.{IDEMPOTENCY_KEY}
+        SET status = %(status)s, mimetype = %(mimetype)s, body = %(body)s
+        WHERE scope = %(scope)s AND key = %(key)s
+        RETURNING key;"""
+    params = {
+        "scope": scope,
+        "key": key,
+        "status": response.status_code,
+        "mimetype": response.mimetype,
+        "body": response.get_data(),
+    }
+    return do_query(sql, params)
+
+
+def release(scope, key):
+    """
+    drops the claim of a request whose response isn't kept
+    """
+    sql = f"""
+        DELETE FROM {SCHEMA_NAME}.{IDEMPOTENCY_KEY}
+        WHERE scope = %(scope)s AND key = %(key)s AND status IS NULL
+        RETURNING key;"""
+    return do_query(sql, {"scope": scope, "key": key})
+
+
+def replay(scope, key, fingerprint):
+    """
+    returns the stored response of key, or why it can't be replayed
+    """
+    sql = f"""
+        SELECT fingerprint, status, mimetype, body
+        FROM {SCHEMA_NAME}.{IDEMPOTENCY_KEY}
+        WHERE scope = %(scope)s AND key = %(key)s;"""
+    result = do_query(sql, {"scope": scope, "key": key})
+    if result["status"] != STATUS_OK:
+        return error_response(result)
+
+    row = result["data"][0] if result["data"] else None
+    if row is not None and row["fingerprint"] != fingerprint:
+        return jsonify(error=f"{HEADER} {key} was used with a different body"), 422
+    if row is None or row["status"] is None:
+        # the first request is still running, or just failed
+        return (
+            jsonify(error=f"A request with {HEADER} {key} is in progress"),
+            409,
+            {"Retry-After": "1"},
+        )
+
+    response = Response(bytes(row["body"]), row["status"], mimetype=row["mimetype"])
+    response.headers[REPLAYED_HEADER] = "true"
+    return response
+
+
+def service_status(response):
+    """
+    returns the status a handler reported: the 'status' of a JSON body when
+    it has one, else the HTTP status
+    """
+    if response.is_json:
+        body = response.get_json(silent=True)
+        if isinstance(body, dict) and isinstance(body.get("status"), int):
+            return body["status"]
+    return response.status_code
+
+
+def keeps(response):
+    """
+    True if response is stored for replay, False if its key is released
+    """
+    if response.is_streamed or not 200 <= response.status_code < 300:
+        return False
+    return 200 <= service_status(response) < 300
+
+
+def prune():
+    """
+    deletes expired keys, at most once per PRUNE_INTERVAL in each process
+    """
+    global pruned_at  # pylint: disable=global-statement
+    with prune_lock:
+        if time.monotonic() - pruned_at < PRUNE_INTERVAL:
+            return
+        pruned_at = time.monotonic()
+    do_query(
+        f"""DELETE FROM {SCHEMA_NAME}.{IDEMPOTENCY_KEY}
+        WHERE created_at < now() - %(ttl)s * interval '1 second'
+        RETURNING key;""",
+        {"ttl": IDEMPOTENCY_TTL},
+    )
+
+
+def idempotent(fingerprint=True):
+    """
+    Decorator making a handler idempotent for requests with an
+    Idempotency-Key header, requests without one run as before
+
+    parameter fingerprint = compare request bodies of retries; off for
+    handlers streaming their body, where the key alone identifies a request
+    """
+
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = request.headers.get(HEADER)
+            if key is None:
+                return func(*args, **kwargs)
+            if not key or len(key) > MAX_KEY_LENGTH:
+                return (
+                    jsonify(error=f"{HEADER} must be 1 to {MAX_KEY_LENGTH} characters"),
+                    STATUS_BAD_REQUEST,
+                )
+
+            scope = f"{request.method} {request.path}"
+            digest = None
+            if fingerprint:
+                digest = hashlib.blake2b(request.get_data(), digest_size=16).hexdigest()
+
+            prune()
+            result = claim(scope, key, digest)
+            if result["status"] != STATUS_OK:
+                return error_response(result)
+            if not result["data"]:
+                return replay(scope, key, digest)
+
+            try:
+                response = current_app.make_response(func(*args, **kwargs))
+            except Exception:
+                release(scope, key)
+                raise
+            if not keeps(response):
+                release(scope, key)
+            elif store(scope, key, response)["status"] != STATUS_OK:
+                logging.error(
+                    emoji.emojize(
+                        f"Could not store response of {HEADER} {key} :cross_mark:"
+                    )
+                )
+            return response
+
+        return wrapper
+
+    return decorate
+
+
+def install(conn_pool):
+    """
+    creates the key table
+    """
+    query = Query(conn_pool)
+    query.execute(ddl(SCHEMA_NAME))
+    query.close()
+    logging.info("%s table installed", IDEMPOTENCY_KEY)
+
+
+def main():
+    """
+    installs the key table in the configured database
+    """
+    logging.basicConfig(level=logging.INFO)
+    install(Connection())
+    print(f"Idempotency key table installed in {SCHEMA_NAME}.{IDEMPOTENCY_KEY}")
+
+
+if __name__ == "__main__":
+    main()
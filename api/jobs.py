@@ -0,0 +1,370 @@
+"""
+In-process background jobs for long bulk operations
+
+A request sent with "Prefer: respond-async" gets 202 and a job ID right away.
+The work then runs on a bounded pool of JOB_WORKERS threads in the web worker
+that accepted it. At most JOB_QUEUE_SIZE more jobs can wait; beyond that,
+new jobs get 429. State, progress, errors and the result are kept in the job
+table, so /jobs/<id> answers from any worker.
+
+A job reports progress through Job.progress, which saves it at most every
+JOB_PROGRESS_INTERVAL seconds and raises Cancelled once the job was asked
+to stop.
+
+Every JOB_HEARTBEAT_INTERVAL seconds each worker touches the rows of its
+unfinished jobs and fails those no worker touched for JOB_HEARTBEAT_TIMEOUT
+seconds: their worker was killed or restarted before it could record how
+they ended.
+
+usage: python -m api.jobs    (installs the job table)
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import emoji
+from flask import jsonify, request, url_for
+
+from api.json_provider import dumps
+from api.negotiation import error_response
+from constants.constants import (
+    JOB_HEARTBEAT_INTERVAL,
+    JOB_HEARTBEAT_TIMEOUT,
+    JOB_MAX_ERRORS,
+    JOB_PROGRESS_INTERVAL,
+    JOB_QUEUE_SIZE,
+    JOB_WORKERS,
+    SCHEMA_NAME,
+    STATUS_ACCEPTED,
+    STATUS_BAD_REQUEST,
+    STATUS_OK,
+    STATUS_TOO_MANY_REQUESTS,
+)
+from db.Connection import Connection
+from db.db_utils import do_query
+from db.Query import Query
+
+JOB = "job"
+PREFER_ASYNC = "respond-async"
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+
+def ddl(schema):
+    """
+    returns the statement creating the job table
+    """
+    return f"""
+        CREATE TABLE IF NOT EXISTS {schema}.{JOB} (
+            job_id bigserial PRIMARY KEY,
+            kind text NOT NULL,
+            state text NOT NULL DEFAULT '{QUEUED}',
+            total bigint,
+            processed bigint NOT NULL DEFAULT 0,
+            errors jsonb NOT NULL DEFAULT '[]',
+            result jsonb,
+            cancel_requested boolean NOT NULL DEFAULT false,
+            created_at timestamptz NOT NULL DEFAULT now(),
+            started_at timestamptz,
+            finished_at timestamptz,
+            updated_at timestamptz NOT NULL DEFAULT now()
+        );"""
+
+
+class Cancelled(Exception):
+    """
+    Raised in a job once it was asked to stop
+    """
+
+
+class Job:
+    """
+    Handle a running job reports its progress through
+    """
+
+    def __init__(self, job_id):
+        """
+        constructor
+        """
+        self.job_id = job_id
+        self.processed = 0
+        self.total = None
+        self.errors = []
+        self.started = False
+        self.reported_at = time.monotonic()
+        self.cancelled = threading.Event()
+
+    def progress(self, count=0, errors=(), total=None):
+        """
+        adds count processed rows and errors, saving them every
+        JOB_PROGRESS_INTERVAL seconds; raises Cancelled once cancelled
+        """
+        self.processed += count
+        if total is not None:
+            self.total = total
+        room = max(JOB_MAX_ERRORS - len(self.errors), 0)
+        self.errors.extend(list(errors)[:room])
+
+        now = time.monotonic()
+        if now - self.reported_at >= JOB_PROGRESS_INTERVAL:
+            self.reported_at = now
+            self.save()
+        if self.cancelled.is_set():
+            raise Cancelled(f"job {self.job_id} was cancelled")
+
+    def save(self, state=None, result=None):
+        """
+        writes progress and, when given, a new state and the result; picks up
+        cancellation requested through any worker
+        """
+        sql = f"""
+            UPDATE {SCHEMA_NAME}.{JOB}
+            SET processed = %(processed)s, total = coalesce(%(total)s, total),
+                errors = %(errors)s::jsonb, state = coalesce(%(state)s, state),
+                result = coalesce(%(result)s::jsonb, result), updated_at = now(),
+                started_at = CASE WHEN %(state)s = '{RUNNING}'
+                    THEN now() ELSE started_at END,
+                finished_at = CASE WHEN %(state)s = ANY(%(finished)s)
+                    THEN now() ELSE finished_at END
+            WHERE job_id = %(job_id)s
+            RETURNING cancel_requested;"""
+        params = {
+            "job_id": self.job_id,
+            "processed": self.processed,
+            "total": self.total,
+            "errors": dumps(self.errors).decode(),
+            "state": state,
+            "result": None if result is None else dumps(result).decode(),
+            "finished": list(FINISHED),
+        }
+        result = do_query(sql, params)
+        if result["status"] == STATUS_OK and result["data"]:
+            if result["data"][0]["cancel_requested"]:
+                self.cancelled.set()
+        return result
+
+
+def outcome(job, result):
+    """
+    returns the final state and the JSON result of a job's service result
+    """
+    if "error" in result:
+        result = {"status": result["status"], "error": str(result["error"])}
+    if job.cancelled.is_set():
+        return CANCELLED, result
+    if result.get("status", STATUS_OK) >= STATUS_BAD_REQUEST:
+        if "error" in result:
+            job.errors.append(result["error"])
+        return FAILED, result
+    return SUCCEEDED, result
+
+
+class JobRunner:
+    """
+    Bounded pool running jobs in the background of a web worker
+    """
+
+    def __init__(self, workers=JOB_WORKERS, max_queued=JOB_QUEUE_SIZE):
+        """
+        constructor
+        """
+        self.workers = workers
+        self.slots = threading.BoundedSemaphore(workers + max_queued)
+        self.executor = None
+        self.app = None
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        # job ID => Job for jobs accepted by this process
+        self.jobs = {}
+
+    def start(self, app):
+        """
+        starts the pool and the heartbeat
+        """
+        self.app = app
+        self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix="job")
+        self.stopped.clear()
+        threading.Thread(target=self.beat, name="job-heartbeat", daemon=True).start()
+
+    def submit(self, kind, func, total=None):
+        """
+        Service function creating a job that runs func(job) in the background
+
+        func returns a service result; 'data' holds the new job ID.
+        """
+        # the slot is held until run() ends the job, so no with block
+        # pylint: disable-next=consider-using-with
+        if self.executor is None or not self.slots.acquire(blocking=False):
+            return {
+                "status": STATUS_TOO_MANY_REQUESTS,
+                "error": "Too many jobs running, retry later",
+            }
+
+        result = do_query(
+            f"""INSERT INTO {SCHEMA_NAME}.{JOB} (kind, total)
+            VALUES (%(kind)s, %(total)s) RETURNING job_id;""",
+            {"kind": kind, "total": total},
+        )
+        if result["status"] != STATUS_OK:
+            self.slots.release()
+            return result
+
+        job = Job(result["data"][0]["job_id"])
+        job.total = total
+        with self.lock:
+            self.jobs[job.job_id] = job
+        self.executor.submit(self.run, job, func)
+        return {"status": STATUS_ACCEPTED, "data": {"job_id": job.job_id}}
+
+    def run(self, job, func):
+        """
+        runs one job and records how it ended, on a pool thread
+        """
+        with self.app.app_context():
+            try:
+                job.started = True
+                job.save(RUNNING)
+                if job.cancelled.is_set():
+                    raise Cancelled(f"job {job.job_id} was cancelled")
+                state, result = outcome(job, func(job))
+                job.save(state, result)
+            except Cancelled:
+                job.save(CANCELLED)
+            except Exception as err:  # pylint: disable=broad-exception-caught
+                logging.exception(
+                    emoji.emojize(f"Job {job.job_id} failed :cross_mark:")
+                )
+                job.errors.append(str(err))
+                job.save(FAILED)
+            finally:
+                with self.lock:
+                    self.jobs.pop(job.job_id, None)
+                self.slots.release()
+
+    def heartbeat(self):
+        """
+        touches the unfinished jobs of this process, then fails the jobs no
+        worker touched for JOB_HEARTBEAT_TIMEOUT seconds
+        """
+        with self.lock:
+            job_ids = list(self.jobs)
+        if job_ids:
+            do_query(
+                f"""UPDATE {SCHEMA_NAME}.{JOB} SET updated_at = now()
+                WHERE job_id = ANY(%(job_ids)s) RETURNING job_id;""",
+                {"job_ids": job_ids},
+            )
+        return do_query(
+            f"""UPDATE {SCHEMA_NAME}.{JOB}
+            SET state = '{FAILED}', finished_at = now(), updated_at = now(),
+                errors = errors || %(error)s::jsonb
+            WHERE NOT state = ANY(%(finished)s)
+                AND updated_at < now() - %(timeout)s * interval '1 second'
+            RETURNING job_id;""",
+            {
+                "error": dumps(["the worker running the job stopped"]).decode(),
+                "finished": list(FINISHED),
+                "timeout": JOB_HEARTBEAT_TIMEOUT,
+            },
+        )
+
+    def beat(self):
+        """
+        runs heartbeat() every JOB_HEARTBEAT_INTERVAL seconds until closed,
+        on the heartbeat thread
+        """
+        while not self.stopped.wait(JOB_HEARTBEAT_INTERVAL):
+            with self.app.app_context():
+                result = self.heartbeat()
+            if result["status"] == STATUS_OK and result["data"]:
+                logging.warning(
+                    "jobs %s failed, their worker stopped",
+                    [row["job_id"] for row in result["data"]],
+                )
+
+    def cancel(self, job_id):
+        """
+        stops a job of this process at its next progress report
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is not None:
+            job.cancelled.set()
+
+    def close(self):
+        """
+        cancels the jobs of this process and waits for the running ones to stop
+        """
+        if self.executor is None:
+            return
+        self.stopped.set()
+        with self.lock:
+            jobs = list(self.jobs.values())
+        for job in jobs:
+            job.cancelled.set()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.executor = None
+
+        # queued jobs never started, their rows are closed here
+        with self.app.app_context():
+            for job in jobs:
+                if not job.started:
+                    job.save(CANCELLED)
+
+
+runner = JobRunner()
+
+
+def wants_async():
+    """
+    True if the client asked for a job instead of waiting for the result
+    """
+    return PREFER_ASYNC in request.headers.get("Prefer", "")
+
+
+def job_response(result):
+    """
+    returns 202 pointing at the new job, or why it couldn't be created
+    """
+    if result["status"] != STATUS_ACCEPTED:
+        body, status = error_response(result)
+        if status == STATUS_TOO_MANY_REQUESTS:
+            return body, status, {"Retry-After": "1"}
+        return body, status
+
+    location = url_for("jobs.get_job", job_id=result["data"]["job_id"])
+    return (
+        jsonify(status=STATUS_ACCEPTED, data=result["data"]),
+        STATUS_ACCEPTED,
+        {"Location": location, "Preference-Applied": PREFER_ASYNC},
+    )
+
+
+def install(conn_pool):
+    """
+    creates the job table
+    """
+    query = Query(conn_pool)
+    query.execute(ddl(SCHEMA_NAME))
+    query.close()
+    logging.info("%s table installed", JOB)
+
+
+def main():
+    """
+    installs the job table in the configured database
+    """
+    logging.basicConfig(level=logging.INFO)
+    install(Connection())
+    print(f"Job table installed in {SCHEMA_NAME}.{JOB}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Fast JSON provider for the Flask app
+
+Uses orjson when it is installed and JSON_BACKEND allows it, and the standard
+library json module otherwise. Both encode the Postgres column types returned
+by psycopg2 (date, datetime, time, Decimal, UUID) natively.
+"""
+
+import json
+import uuid
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from flask.json.provider import JSONProvider
+
+from constants.constants import JSON_BACKEND
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if JSON_BACKEND != "orjson":
+    orjson = None
+
+
+def default(value):
+    """
+    encodes values the JSON backends don't handle themselves
+    """
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+
+    def dumps(obj):
+        """
+        returns obj encoded as UTF-8 JSON bytes
+        """
+        return orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS)
+
+    def loads(data):
+        """
+        decodes JSON from str, bytes or a memoryview
+        """
+        return orjson.loads(data)
+
+else:
+
+    def dumps(obj):
+        """
+        returns obj encoded as UTF-8 JSON bytes
+        """
+        return json.dumps(
+            obj, default=default, ensure_ascii=False, separators=(",", ":")
+        ).encode()
+
+    def loads(data):
+        """
+        decodes JSON from str, bytes or a memoryview
+        """
+        if isinstance(data, memoryview):
+            data = bytes(data)
+        return json.loads(data)
+
+
+class FastJSONProvider(JSONProvider):
+    """
+    Flask JSON provider backed by dumps and loads above
+    """
+
+    mimetype = "application/json"
+
+    def dumps(self, obj, **kwargs):
+        """
+        serializes obj to a JSON string
+        """
+        return dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        """
+        deserializes a JSON string or bytes
+        """
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        """
+        builds a JSON response without an intermediate str
+        """
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj), mimetype=self.mimetype)
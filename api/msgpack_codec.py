@@ -0,0 +1,90 @@
+"""
+MessagePack encoding for service-to-service calls
+
+Dates and decimals use compact extension types instead of strings:
+    date        ext 1, days since 0001-01-01 as a big endian int32
+    Decimal     ext 2, the exact decimal digits as ASCII
+    datetime    the msgpack timestamp type, naive values are taken as UTC
+"""
+
+import struct
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+from flask import Request
+
+from api.json_provider import default
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK = "application/msgpack"
+# mimetypes accepted for request bodies
+MSGPACK_TYPES = {MSGPACK, "application/x-msgpack"}
+
+EXT_DATE = 1
+EXT_DECIMAL = 2
+DATE = struct.Struct(">i")
+
+
+def encode(value):
+    """
+    encodes values msgpack doesn't handle itself
+    """
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return msgpack.Timestamp.from_datetime(value)
+    if isinstance(value, date):
+        return msgpack.ExtType(EXT_DATE, DATE.pack(value.toordinal()))
+    if isinstance(value, Decimal):
+        return msgpack.ExtType(EXT_DECIMAL, str(value).encode("ascii"))
+    return default(value)
+
+
+def decode_ext(code, data):
+    """
+    decodes the extension types written by encode
+    """
+    if code == EXT_DATE:
+        return date.fromordinal(DATE.unpack(data)[0])
+    if code == EXT_DECIMAL:
+        return Decimal(data.decode("ascii"))
+    return msgpack.ExtType(code, data)
+
+
+def packb(obj):
+    """
+    returns obj encoded as msgpack bytes
+    """
+    return msgpack.packb(obj, default=encode, datetime=False)
+
+
+def unpackb(data):
+    """
+    decodes msgpack bytes, timestamps become aware datetimes
+    """
+    return msgpack.unpackb(data, ext_hook=decode_ext, timestamp=3)
+
+
+class MsgpackRequest(Request):
+    """
+    Request whose get_json also decodes msgpack bodies, so handlers and
+    flask_pydantic validation read them like JSON
+    """
+
+    def get_json(self, force=False, silent=False, cache=True):
+        """
+        returns the decoded body for msgpack requests, JSON otherwise
+        """
+        if msgpack is None or self.mimetype not in MSGPACK_TYPES:
+            return super().get_json(force=force, silent=silent, cache=cache)
+
+        try:
+            return unpackb(self.get_data(cache=cache))
+        except (ValueError, ArithmeticError, struct.error) as error:
+            if silent:
+                return None
+            return self.on_json_loading_failed(error)
@@ -0,0 +1,114 @@
+"""
+Content negotiation for read and search endpoints
+"""
+
+from flask import Response, has_request_context, jsonify, request
+
+from api.json_provider import dumps
+from api.msgpack_codec import MSGPACK, msgpack, packb
+from constants.constants import STATUS_OK
+
+JSON = "application/json"
+NDJSON = "application/x-ndjson"
+
+# rows are written to the socket in chunks of about this many bytes
+CHUNK_SIZE = 64 * 1024
+
+
+def accepts(mimetype):
+    """
+    True if the client prefers mimetype over JSON
+    """
+    return request.accept_mimetypes.best_match([JSON, mimetype]) == mimetype
+
+
+def wants_ndjson():
+    """
+    True for requests sent with 'Accept: application/x-ndjson'
+    """
+    return accepts(NDJSON)
+
+
+def wants_msgpack():
+    """
+    True for requests sent with 'Accept: application/msgpack'
+    """
+    return msgpack is not None and has_request_context() and accepts(MSGPACK)
+
+
+def msgpack_response(body, status=200):
+    """
+    returns body encoded as msgpack
+    """
+    return Response(packb(body), status=status, mimetype=MSGPACK)
+
+
+def error_response(result):
+    """
+    returns a failed service result in the error handler's format
+    """
+    return jsonify(error=str(result.get("error"))), result["status"]
+
+
+def result_response(result):
+    """
+    returns a service result whose data isn't a list of rows
+    """
+    if result["status"] != STATUS_OK:
+        return error_response(result)
+
+    body = {"status": result["status"], "data": result["data"]}
+    if wants_msgpack():
+        return msgpack_response(body)
+    return jsonify(body)
+
+
+def ndjson_response(result):
+    """
+    streams a service result as one JSON object per line
+    """
+    if result["status"] != STATUS_OK:
+        return error_response(result)
+
+    def generate(rows):
+        chunk = []
+        size = 0
+        for row in rows:
+            line = dumps(row) + b"\n"
+            chunk.append(line)
+            size += len(line)
+            if size >= CHUNK_SIZE:
+                yield b"".join(chunk)
+                chunk = []
+                size = 0
+        if chunk:
+            yield b"".join(chunk)
+
+    response = Response(generate(result["data"]), mimetype=NDJSON)
+    return release_on_close(response, result["data"])
+
+
+def release_on_close(response, rows):
+    """
+    closes rows, releasing their cursor's connection or cancelling their
+    COPY, when the response is closed. Unlike a generator's finally this also runs for a HEAD request
+    or a client gone before the first chunk.
+    """
+    if hasattr(rows, "close"):
+        response.call_on_close(rows.close)
+    return response
+
+
+def csv_response(result, name):
+    """
+    streams CSV chunks of a service result as a file download
+    """
+    if result["status"] != STATUS_OK:
+        return error_response(result)
+
+    response = Response(
+        result["data"],
+        mimetype="text/csv",
+        headers={"Content-Disposition": f"attachment; filename={name}.csv"},
+    )
+    return release_on_close(response, result["data"])
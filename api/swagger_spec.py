@@ -0,0 +1,66 @@
+"""
+Swagger specification served from a prebuilt body
+
+Building the spec walks every route and parses all handler docstrings, so it
+is built once and encoded to bytes. It is rebuilt only when the registered
+routes change.
+"""
+
+import hashlib
+import threading
+
+from flask import request
+
+from api.json_provider import dumps
+from constants.constants import SWAGGER_MAX_AGE
+
+
+def route_key(app):
+    """
+    returns a fingerprint of the registered routes
+    """
+    return tuple(
+        (rule.rule, rule.endpoint, tuple(sorted(rule.methods or ())))
+        for rule in app.url_map.iter_rules()
+    )
+
+
+class SpecCache:
+    """
+    Encoded spec and its ETag for the current routes
+    """
+
+    def __init__(self, build):
+        """
+        constructor
+
+        parameter build = callable returning the spec dict for an app
+        """
+        self.build = build
+        self.lock = threading.Lock()
+        # (route fingerprint, body, etag)
+        self.built = (None, None, None)
+
+    def get(self, app):
+        """
+        returns the encoded spec and its ETag, building it if routes changed
+        """
+        routes = route_key(app)
+        if self.built[0] != routes:
+            with self.lock:
+                if self.built[0] != routes:
+                    body = dumps(self.build(app))
+                    etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+                    self.built = (routes, body, etag)
+        return self.built[1], self.built[2]
+
+    def response(self, app):
+        """
+        returns the spec with cache headers, or 304 for a matching ETag
+        """
+        body, etag = self.get(app)
+        response = app.response_class(body, mimetype="application/json")
+        response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = SWAGGER_MAX_AGE
+        return response.make_conditional(request)
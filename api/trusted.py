@@ -0,0 +1,114 @@
+"""
+Trusted output mode for read handlers
+
+Rows returned by our own typed SQL are serialized without being validated row
+by row against the response model. They are only shaped the way validation
+would leave them: columns outside the row model are dropped, and numbers the
+database returns as text or Decimal (votes is varchar, rating numeric) are
+converted to the int or float of the model. Each response model is still
+validated on its first response in the process and on a sampled fraction of
+responses after that, so schema drift shows up in the logs.
+"""
+
+import logging
+import random
+import threading
+from typing import get_args
+
+import emoji
+from flask import jsonify
+from pydantic import ValidationError
+
+from api.negotiation import msgpack_response, wants_msgpack
+from constants.constants import TRUSTED_OUTPUT, TRUSTED_SAMPLE_RATE
+
+# response models whose first response was validated
+validated = set()
+# response model => (row fields, {field: int or float})
+shapes = {}
+lock = threading.Lock()
+
+
+def should_validate(model):
+    """
+    True for the first response of model and for sampled responses
+    """
+    with lock:
+        if model not in validated:
+            validated.add(model)
+            return True
+    return random.random() < TRUSTED_SAMPLE_RATE
+
+
+def shape_of(model):
+    """
+    returns the fields of the rows of model and the numeric type of the
+    fields holding a plain int or float
+    """
+    with lock:
+        shape = shapes.get(model)
+    if shape is not None:
+        return shape
+
+    # data: list[RowModel | MessageModel], rows are the first member
+    (members,) = get_args(model.model_fields["data"].annotation)
+    row_model = (get_args(members) or (members,))[0]
+    numbers = {}
+    for name, field in row_model.model_fields.items():
+        kinds = set(get_args(field.annotation) or (field.annotation,))
+        kinds.discard(type(None))
+        if kinds in ({int}, {float}):
+            numbers[name] = kinds.pop()
+
+    shape = (tuple(row_model.model_fields), numbers)
+    with lock:
+        shapes[model] = shape
+    return shape
+
+
+def shaped(row, fields, numbers):
+    """
+    returns row with only fields, numbers converted to their model type
+    """
+    out = {}
+    for name in fields:
+        if name not in row:
+            continue
+        value = row[name]
+        kind = numbers.get(name)
+        if kind is not None and value is not None and not isinstance(value, kind):
+            value = kind(value)
+        out[name] = value
+    return out
+
+
+def respond(model, result, trusted=TRUSTED_OUTPUT):
+    """
+    returns the response for a read service result, as msgpack when the
+    client asks for it
+
+    parameter model = pydantic response model of the blueprint
+    parameter result = {"status": ..., "data": [...]} from the service
+    """
+    if not trusted:
+        response = model(status=result["status"], data=result["data"])
+        if wants_msgpack():
+            return msgpack_response(response.model_dump())
+        return response
+
+    if should_validate(model):
+        try:
+            model(status=result["status"], data=result["data"])
+        except ValidationError:
+            logging.error(
+                emoji.emojize(
+                    f"Trusted rows failed {model.__module__}.{model.__name__} :cross_mark:"
+                )
+            )
+            raise
+
+    fields, numbers = shape_of(model)
+    rows = [shaped(row, fields, numbers) for row in result["data"]]
+    if wants_msgpack():
+        return msgpack_response({"status": result["status"], "data": rows})
+    return jsonify(status=result["status"], data=rows)
@@ -4,8 +4,19 @@ Flask app entry point
 
 import emoji
 from flask import Flask, jsonify
+from flask_cors import CORS
+from flask_swagger import swagger
+from flask_swagger_ui import get_swaggerui_blueprint
 from werkzeug.exceptions import HTTPException, default_exceptions
+
+from api import compression
+from api import jobs
+from api.json_provider import FastJSONProvider
+from api.msgpack_codec import MsgpackRequest
+from api.swagger_spec import SpecCache
 from blueprints.health.blueprint import health_blueprint
+from blueprints.admin.blueprint import admin_blueprint
+from blueprints.jobs.blueprint import jobs_blueprint
 from blueprints.movie.blueprint import movie_blueprint
 from blueprints.actor.blueprint import actor_blueprint
 from blueprints.genre.blueprint import genre_blueprint
@@ -14,57 +25,36 @@ from blueprints.movie_actor.blueprint import movie_actor_blueprint
 from blueprints.movie_genre.blueprint import movie_genre_blueprint
 from blueprints.movie_director.blueprint import movie_director_blueprint
 from blueprints.movie_review.blueprint import movie_review_blueprint
+from blueprints.movie_review.service import review_buffer
+from cache import warmup
+from constants.constants import REVIEW_WRITE_BEHIND
 from db.Connection import Connection
 from logger import logger
-from flask_cors import CORS
-from flask_swagger_ui import get_swaggerui_blueprint
-from flask_swagger import swagger
-
-
-app = Flask(__name__)
-CORS(app)
 
-# logger setup 
-logger = logger.configure_logger("default", "logs/flask.log")
-app.logger = logger
 
-# pushes the application context
-ctx = app.app_context()
-ctx.push()
-
-# creates a Connection instance stores it in app.conn
-conn = Connection()
-app.conn = conn
-
-
-# Swagger specification route
-@app.route("/swagger")
-def swagger_spec():
+def build_spec(app):
     """
     Generate the Swagger API specification
     """
     spec = swagger(app)
 
     # Customize Swagger metadata
-    spec['info']['title'] = "Movies REST API"
-    spec['info']['version'] = "1.0.0"
-    spec['info']['description'] = (
+    spec["info"]["title"] = "Movies REST API"
+    spec["info"]["version"] = "1.0.0"
+    spec["info"]["description"] = (
         "This is a REST API for managing movies and related information. "
         "It allows clients to retrieve and manage movie-related data in a structured way."
     )
-    spec['info']['contact'] = {
+    spec["info"]["contact"] = {
         "name": "Movies API Support",
-        "email": "it.jsoni22@gmail.com"
+        "email": "it.jsoni22@gmail.com",
     }
-    return jsonify(spec)
+    return spec
 
 
 # swagger configs
 SWAGGER_URL = "/api/docs"
 API_URL = "/swagger"
-swaggerui_blueprint = get_swaggerui_blueprint(
-    SWAGGER_URL, API_URL
-)
 
 
 def register_error_handler(app):
@@ -88,21 +78,89 @@ def register_error_handler(app):
         app.register_error_handler(default_exception, handle_error)
 
 
-# registers the blueprints
-app.register_blueprint(health_blueprint)
-app.register_blueprint(movie_blueprint)
-app.register_blueprint(actor_blueprint)
-app.register_blueprint(director_blueprint)
-app.register_blueprint(genre_blueprint)
-app.register_blueprint(movie_actor_blueprint)
-app.register_blueprint(movie_genre_blueprint)
-app.register_blueprint(movie_director_blueprint)
-app.register_blueprint(movie_review_blueprint)
-app.register_blueprint(swaggerui_blueprint, url_prefix=SWAGGER_URL)
+def create_app(start_worker=True):
+    """
+    creates and configures the app
+
+    parameter start_worker = opens the connection pool and starts the cache
+    warm-up; the production launcher does this in each worker after the fork
+    """
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    app.request_class = MsgpackRequest
+    CORS(app)
+    compression.init_app(app)
+
+    # logger setup
+    app.logger = logger.configure_logger("default", "logs/flask.log")
+
+    # built on the first request and again only when the routes change
+    spec_cache = SpecCache(build_spec)
+
+    # Swagger specification route
+    @app.route(API_URL)
+    def swagger_spec():
+        """
+        Serve the Swagger API specification with an ETag
+        """
+        return spec_cache.response(app)
+
+    swaggerui_blueprint = get_swaggerui_blueprint(SWAGGER_URL, API_URL)
+
+    # registers the blueprints
+    app.register_blueprint(health_blueprint)
+    app.register_blueprint(admin_blueprint)
+    app.register_blueprint(jobs_blueprint)
+    app.register_blueprint(movie_blueprint)
+    app.register_blueprint(actor_blueprint)
+    app.register_blueprint(director_blueprint)
+    app.register_blueprint(genre_blueprint)
+    app.register_blueprint(movie_actor_blueprint)
+    app.register_blueprint(movie_genre_blueprint)
+    app.register_blueprint(movie_director_blueprint)
+    app.register_blueprint(movie_review_blueprint)
+    app.register_blueprint(swaggerui_blueprint, url_prefix=SWAGGER_URL)
+
+    # registers the error handler
+    register_error_handler(app)
+
+    if start_worker:
+        init_worker(app)
+
+    return app
+
+
+def init_worker(app, minconn=None, maxconn=None):
+    """
+    opens the connection pool and starts the cache warm-up
+
+    Runs once per process. Connections and threads don't survive a fork, so
+    the launcher calls this in every worker, never in the preloading master.
+    """
+    # creates a Connection instance stores it in app.conn
+    app.conn = Connection(minconn, maxconn)
+
+    # replays recorded hot cache keys before reporting ready
+    warmup.start(app)
+
+    # batches buffered review inserts, flushing what's left on exit
+    if REVIEW_WRITE_BEHIND:
+        review_buffer.start(app)
 
-# registers the error handler
-register_error_handler(app)
+    # runs bulk requests sent with "Prefer: respond-async"
+    jobs.runner.start(app)
+
+
+def close_worker():
+    """
+    cancels the background jobs of this process and flushes the buffered
+    review inserts before it exits
+    """
+    jobs.runner.close()
+    if REVIEW_WRITE_BEHIND:
+        review_buffer.close()
 
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    # development server, see server/launcher.py for production
+    create_app().run(debug=True)
@@ -14,11 +14,26 @@ from blueprints.actor.service import (
     svc_get_by_id,
     svc_in_search,
     svc_post,
+    svc_patch,
     svc_put,
+    svc_changes,
+    svc_bulk_delete,
     svc_delete,
     svc_exact_search,
+    svc_export,
     svc_like_search,
 )
+from constants.constants import ACTOR
+from api.columnar import ARROW, PARQUET, columnar_response
+from api.idempotency import idempotent
+from api.jobs import job_response, runner, wants_async
+from api.negotiation import (
+    csv_response,
+    ndjson_response,
+    result_response,
+    wants_ndjson,
+)
+from api.trusted import respond
 
 
 class ActorItems(BaseModel):
@@ -33,6 +48,17 @@ class ActorItems(BaseModel):
     created_at: Optional[str]
 
 
+class ActorPatchItems(BaseModel):
+    """
+    Actor patch model, only the columns to change
+    """
+
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    age: Optional[int] = None
+    gender: Optional[str] = None
+
+
 class ActorDataModel(BaseModel):
     """
     Actor Data Model
@@ -103,6 +129,14 @@ class PostModel(BaseModel):
     status: int | str
 
 
+class BulkDeleteModel(BaseModel):
+    """
+    Bulk delete model, IDs of the actors to delete
+    """
+
+    ids: list[int]
+
+
 version = os.getenv("VERSION")
 actor_blueprint = Blueprint("actor", __name__, url_prefix=version)
 
@@ -174,8 +208,11 @@ def get_all_records():
                   example: "An error occurred while retrieving actors"
     """
 
+    if wants_ndjson():
+        return ndjson_response(svc_get(stream=True))
+
     result = svc_get()
-    return ResponseModel(status=result["status"], data=result["data"])
+    return respond(ResponseModel, result)
 
 
 @actor_blueprint.route("/actor/<actor_id>", methods=["GET"])
@@ -252,10 +289,11 @@ def get_by_id(actor_id: int):
     """
 
     result = svc_get_by_id(actor_id)
-    return ResponseModel(status=result["status"], data=result["data"])
+    return respond(ResponseModel, result)
 
 
 @actor_blueprint.route("/actor/create", methods=["POST"])
+@idempotent()
 @validate(body=ActorItems)
 def post_actor():
     """
@@ -372,6 +410,54 @@ def put_actor(actor_id: int):
     return ResponseModel(status=result["status"], data=result["data"])
 
 
+@actor_blueprint.route("/actor/<actor_id>", methods=["PATCH"])
+@validate(body=ActorPatchItems)
+def patch_actor(actor_id: int):
+    """
+    A PATCH handler. Updates only the given columns of a record
+    ---
+    tags:
+      - Actor
+    summary: Partially update a actor by ID
+    description: >
+      A PATCH handler that sets only the columns present in the body. The
+      row isn't written when no value differs from the stored one.
+    parameters:
+      - in: path
+        name: actor_id
+        type: integer
+        required: true
+        description: ID of the actor to update
+      - in: body
+        name: body
+        description: Columns to change
+        schema:
+          type: object
+          properties:
+            first_name:
+              type: string
+            last_name:
+              type: string
+            age:
+              type: integer
+            gender:
+              type: string
+    responses:
+      200:
+        description: The actor and whether it changed
+      400:
+        description: Invalid input
+      404:
+        description: Actor not found
+      500:
+        description: Internal server error
+    """
+
+    payload = request.body_params.model_dump(exclude_unset=True)
+    result = svc_patch(payload, actor_id)
+    return result_response(result)
+
+
 @actor_blueprint.route("/actor/<actor_id>", methods=["DELETE"])
 @validate()
 def delete_actor(actor_id: int):
@@ -415,6 +501,62 @@ def delete_actor(actor_id: int):
     return ResponseModel(status=result["status"], data=result["data"])
 
 
+@actor_blueprint.route("/actor/bulk_delete", methods=["POST"])
+@idempotent(fingerprint=False)
+@validate(body=BulkDeleteModel)
+def bulk_delete():
+    """
+    DELETE many records by ID
+    ---
+    tags:
+      - Actor
+    summary: Delete many actors by ID
+    description: >
+      A POST handler that deletes a list of actors with their movie links.
+      IDs are deleted in batches of BULK_DELETE_BATCH, one statement each.
+      With "Prefer: respond-async" the delete runs as a background job.
+    parameters:
+      - in: header
+        name: Prefer
+        type: string
+        description: respond-async to get a job ID right away
+      - in: body
+        name: body
+        schema:
+          type: object
+          properties:
+            ids:
+              type: array
+              items:
+                type: integer
+              description: IDs of the actors to delete
+    responses:
+      200:
+        description: Deleted IDs and the IDs that were not found
+      202:
+        description: Job created, see /jobs/{job_id}
+      400:
+        description: Invalid input
+      429:
+        description: Too many jobs running
+      500:
+        description: Internal server error
+    """
+
+    ids = request.body_params.ids
+
+    if wants_async():
+        result = runner.submit(
+            f"{ACTOR}.bulk_delete",
+            lambda job: svc_bulk_delete(ids, job.progress),
+            total=len(ids),
+        )
+        return job_response(result)
+
+    result = svc_bulk_delete(ids)
+    return result_response(result)
+
+
 @actor_blueprint.route("/actor/exact", methods=["POST"])
 @validate(body=SearchModel)
 def search_by_exact():
@@ -487,9 +629,12 @@ def search_by_exact():
     """
 
     payload = request.get_json()
+    if wants_ndjson():
+        return ndjson_response(svc_exact_search(payload, stream=True))
+
     result = svc_exact_search(payload)
 
-    return ResponseModel(status=result["status"], data=result["data"])
+    return respond(ResponseModel, result)
 
 
 @actor_blueprint.route("/actor/like", methods=["POST"])
@@ -564,9 +709,12 @@ def search_by_like():
     """
 
     payload = request.get_json()
+    if wants_ndjson():
+        return ndjson_response(svc_like_search(payload, stream=True))
+
     result = svc_like_search(payload)
 
-    return ResponseModel(status=result["status"], data=result["data"])
+    return respond(ResponseModel, result)
 
 
 @actor_blueprint.route("/actor/in", methods=["POST"])
@@ -641,6 +789,110 @@ def search_by_in():
     """
 
     payload = request.get_json()
+    if wants_ndjson():
+        return ndjson_response(svc_in_search(payload, stream=True))
+
     result = svc_in_search(payload)
 
-    return ResponseModel(status=result["status"], data=result["data"])
+    return respond(ResponseModel, result)
+
+
+@actor_blueprint.route("/actor/export.csv", methods=["GET"])
+@validate()
+def export_csv():
+    """
+    CSV EXPORT
+    Streams actors as CSV straight from COPY ... TO STDOUT
+    ---
+    tags:
+      - Actor
+    summary: Export actors as CSV
+    description: >
+      A GET handler that streams actors as a CSV file with a header row.
+      Any column can be passed as a query parameter to filter on an exact
+      value, e.g. ?gender=F
+    produces:
+      - text/csv
+    responses:
+      200:
+        description: CSV file of the matching actors
+      400:
+        description: Unknown filter column
+      500:
+        description: Internal server error
+    """
+
+    result = svc_export(request.args.to_dict())
+    return csv_response(result, "actor")
+
+
+@actor_blueprint.route("/actor/export.arrow", methods=["GET"], defaults={"fmt": ARROW})
+@actor_blueprint.route(
+    "/actor/export.parquet", methods=["GET"], defaults={"fmt": PARQUET}
+)
+@validate()
+def export_columnar(fmt: str):
+    """
+    COLUMNAR EXPORT
+    Streams actors as an Arrow IPC stream or a Parquet file
+    ---
+    tags:
+      - Actor
+    summary: Export actors in a columnar format
+    description: >
+      A GET handler that reads actors in batches from a server-side cursor
+      and streams them as typed columns. Query parameters filter on exact
+      column values like the CSV export.
+    produces:
+      - application/vnd.apache.arrow.stream
+      - application/vnd.apache.parquet
+    responses:
+      200:
+        description: Arrow IPC stream or Parquet file of the matching actors
+      400:
+        description: Unknown filter column
+      501:
+        description: pyarrow is not installed
+      500:
+        description: Internal server error
+    """
+
+    result = svc_export(request.args.to_dict(), stream=True)
+    return columnar_response(result, ACTOR, fmt)
+
+
+@actor_blueprint.route("/actor/changes", methods=["GET"])
+@validate()
+def get_changes():
+    """
+    DELTA SYNC
+    Returns actors changed since a sync token
+    ---
+    tags:
+      - Actor
+    summary: Get actors changed since a sync token
+    description: >
+      A GET handler returning the actors inserted or updated and the keys of
+      those deleted since the token of a previous call, with the token for
+      the next call. Without a token every record is returned.
+    parameters:
+      - in: query
+        name: since
+        type: string
+        required: false
+        description: Token returned by the previous call
+    responses:
+      200:
+        description: Upserted rows, deleted keys and the next token
+      400:
+        description: Invalid sync token
+      404:
+        description: Change log not enabled
+      410:
+        description: Sync token older than the retained changes, sync again without one
+      500:
+        description: Internal server error
+    """
+
+    result = svc_changes(request.args.get("since"))
+    return result_response(result)
@@ -2,21 +2,43 @@
 Service file for actor
 """
 
-
-from db.db_utils import do_query
-from constants.constants import ACTOR, SCHEMA_NAME
-
-
-def svc_get():
+from db.db_utils import (
+    bulk_delete_query,
+    copy_query,
+    do_query,
+    filter_clause,
+    patch_query,
+    stream_query,
+)
+from db.change_log import changes_query
+from cache.cache import cached, invalidate
+from cache.snapshot import from_snapshot
+from constants.constants import (
+    COLUMNS,
+    ACTOR,
+    MOVIE_ACTOR,
+    SCHEMA_NAME,
+    STATUS_BAD_REQUEST,
+    STATUS_OK,
+)
+
+
+@cached(ACTOR)
+def svc_get(stream=False):
     """
     A GET service to get all records
     """
     sql = f"SELECT * FROM {SCHEMA_NAME}.{ACTOR};"
+    if stream:
+        return stream_query(sql, {})
+
     result = do_query(sql, {})
 
     return result
 
 
+@from_snapshot(ACTOR)
+@cached(ACTOR)
 def svc_get_by_id(actor_id):
     """
     A GET service to get by ID
@@ -45,6 +67,7 @@ def svc_post(payload):
 
     result = do_query(sql, params)
 
+    invalidate(ACTOR, keys=())
     return result
 
 
@@ -76,6 +99,18 @@ def svc_put(payload, id):
     }
 
     result = do_query(sql, params)
+    invalidate(ACTOR, keys=[id])
+    return result
+
+
+def svc_patch(payload, id):
+    """
+    A PATCH service, writes only the given columns and only if they changed
+    """
+
+    result = patch_query(ACTOR, "actor_id", id, payload)
+    if result["status"] == STATUS_OK and result["data"]["changed"]:
+        invalidate(ACTOR, keys=[id])
     return result
 
 
@@ -90,10 +125,30 @@ def svc_delete(id):
     }
 
     result = do_query(sql, params)
+    invalidate(ACTOR, keys=[id])
+    # the links of the deleted rows cascade, their movies aren't known
+    invalidate(MOVIE_ACTOR)
+    return result
+
+
+def svc_bulk_delete(ids, progress=None):
+    """
+    Bulk DELETE service, actors by ID with their movie links
+    """
+
+    try:
+        result = bulk_delete_query(
+            ACTOR, "actor_id", [MOVIE_ACTOR], ids, progress=progress
+        )
+    finally:
+        # batches deleted before a failure or cancellation are gone too
+        invalidate(ACTOR, keys=ids)
+        invalidate(MOVIE_ACTOR)
     return result
 
 
-def svc_exact_search(payload):
+@cached(ACTOR)
+def svc_exact_search(payload, stream=False):
     """
     An Exact search service
     """
@@ -109,11 +164,15 @@ def svc_exact_search(payload):
     sql = f"SELECT * FROM {SCHEMA_NAME}.{ACTOR} WHERE {exact_clause}"
     params = {"field": field, "value": value}
 
+    if stream:
+        return stream_query(sql, params)
+
     result = do_query(sql, params)
     return result
 
 
-def svc_like_search(payload):
+@cached(ACTOR)
+def svc_like_search(payload, stream=False):
     """
     LIKE Search service
     """
@@ -131,11 +190,15 @@ def svc_like_search(payload):
     sql = f"SELECT * FROM {SCHEMA_NAME}.{ACTOR} WHERE {like_clause};"
     params = {"field": field, "value": value}
 
+    if stream:
+        return stream_query(sql, params)
+
     result = do_query(sql, params)
     return result
 
 
-def svc_in_search(payload):
+@cached(ACTOR)
+def svc_in_search(payload, stream=False):
     """
     In Search service
     """
@@ -154,5 +217,37 @@ def svc_in_search(payload):
     sql = f"SELECT * FROM {SCHEMA_NAME}.{ACTOR} WHERE {field} IN ({in_clause});"
     params = {"field": field, "value": value}
 
+    if stream:
+        return stream_query(sql, params)
+
     result = do_query(sql, params)
     return result
+
+
+def svc_export(filters, stream=False):
+    """
+    Export service, CSV from COPY or a row iterator when streaming
+    """
+
+    try:
+        where_clause, params = filter_clause(ACTOR, filters)
+    except ValueError as err:
+        return {"status": STATUS_BAD_REQUEST, "error": err}
+
+    columns = ", ".join(COLUMNS[ACTOR])
+    sql = f"SELECT {columns} FROM {SCHEMA_NAME}.{ACTOR}{where_clause};"
+
+    if stream:
+        return stream_query(sql, params)
+
+    result = copy_query(sql, params)
+    return result
+
+
+def svc_changes(since):
+    """
+    Delta sync service, rows changed and keys deleted since a sync token
+    """
+
+    result = changes_query(ACTOR, since)
+    return result
@@ -0,0 +1,117 @@
+"""
+blueprint for cache administration
+"""
+
+import hmac
+import os
+from typing import Optional
+from flask import Blueprint, abort, jsonify, request
+from pydantic import BaseModel
+from flask_pydantic import validate
+
+from cache import snapshot
+from cache.cache import caches, invalidate
+from constants.constants import ADMIN_TOKEN, COLUMNS
+
+
+class FlushModel(BaseModel):
+    """Cache flush model, without an entity every entity is flushed"""
+
+    entity: Optional[str] = None
+
+
+version = os.getenv("VERSION")
+admin_blueprint = Blueprint("admin", __name__, url_prefix=version)
+
+
+@admin_blueprint.before_request
+def check_token():
+    """
+    requires the X-Admin-Token header to match ADMIN_TOKEN, the endpoints
+    don't exist while no token is configured
+    """
+    if not ADMIN_TOKEN:
+        abort(404)
+    token = request.headers.get("X-Admin-Token", "")
+    if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        abort(403)
+
+
+@admin_blueprint.route("/admin/cache", methods=["GET"])
+def cache_stats():
+    """
+    A GET handler. Returns statistics for every cache
+    ---
+    tags:
+      - Admin
+    summary: Cache statistics
+    description: Entries, estimated bytes, hit/miss/eviction counts, average load time and top keys per cache.
+    parameters:
+      - in: query
+        name: top
+        type: integer
+        required: false
+        description: Number of top keys by hits to return (default 10)
+    responses:
+      200:
+        description: Statistics by cache name
+      403:
+        description: Missing or wrong admin token
+      404:
+        description: No admin token configured
+    """
+    top = request.args.get("top", 10, type=int)
+    data = {name: cache.stats(top) for name, cache in caches.items()}
+    if snapshot.reader is not None:
+        data["snapshot"] = snapshot.reader.stats()
+
+    return jsonify(status=200, data=data)
+
+
+@admin_blueprint.route("/admin/cache/flush", methods=["POST"])
+@validate(body=FlushModel, get_json_params={"silent": True})
+def cache_flush():
+    """
+    A POST handler. Flushes the cached reads of an entity on every worker
+    ---
+    tags:
+      - Admin
+    summary: Flush caches
+    description: >
+      Drops the cached reads of one entity, or of every entity without a
+      body, from every cache of every worker on the node, like a write
+      would. Workers on other nodes keep theirs until the TTLs run out.
+    parameters:
+      - in: body
+        name: body
+        required: false
+        schema:
+          type: object
+          properties:
+            entity:
+              type: string
+              description: Entity whose entries are dropped (e.g. movie)
+    responses:
+      200:
+        description: Number of entries this worker dropped by cache name
+      403:
+        description: Missing or wrong admin token
+      404:
+        description: Unknown entity, or no admin token configured
+    """
+    payload = request.body_params
+
+    entities = list(COLUMNS)
+    if payload.entity:
+        if payload.entity not in COLUMNS:
+            abort(404)
+        entities = [payload.entity]
+
+    # counted in this worker, invalidate() then reaches the other workers
+    data = {
+        name: sum(cache.invalidate(f"{entity}:") for entity in entities)
+        for name, cache in caches.items()
+    }
+    invalidate(*entities)
+
+    return jsonify(status=200, data=data)
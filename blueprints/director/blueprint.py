@@ -13,10 +13,24 @@ from blueprints.director.service import (
     svc_in_search,
     svc_post,
     svc_put,
+    svc_changes,
+    svc_bulk_delete,
     svc_delete,
     svc_exact_search,
+    svc_export,
     svc_like_search,
 )
+from constants.constants import DIRECTOR
+from api.columnar import ARROW, PARQUET, columnar_response
+from api.idempotency import idempotent
+from api.jobs import job_response, runner, wants_async
+from api.negotiation import (
+    csv_response,
+    ndjson_response,
+    result_response,
+    wants_ndjson,
+)
+from api.trusted import respond
 
 
 class DirectorItems(BaseModel):
@@ -97,6 +111,14 @@ class PostModel(BaseModel):
     status: int | str
 
 
+class BulkDeleteModel(BaseModel):
+    """
+    Bulk delete model, IDs of the directors to delete
+    """
+
+    ids: list[int]
+
+
 version = os.getenv("VERSION")
 director_blueprint = Blueprint("director", __name__, url_prefix=version)
 
@@ -159,9 +181,12 @@ def get_all_records():
                   description: Error message
                   example: "An error occurred while retrieving directors"
     """
+    if wants_ndjson():
+        return ndjson_response(svc_get(stream=True))
+
     result = svc_get()
 
-    return ResponseModel(status=result["status"], data=result["data"])
+    return respond(ResponseModel, result)
 
 
 @director_blueprint.route("/director/<director_id>", methods=["GET"])
@@ -238,10 +263,11 @@ def get_by_id(director_id: int):
     """
 
     result = svc_get_by_id(director_id)
-    return ResponseModel(status=result["status"], data=result["data"])
+    return respond(ResponseModel, result)
 
 
 @director_blueprint.route("/director/create", methods=["POST"])
+@idempotent()
 @validate(body=DirectorItems)
 def post_director():
     """
@@ -389,6 +415,62 @@ def delete_director(director_id: int):
     return ResponseModel(status=result["status"], data=result["data"])
 
 
+@director_blueprint.route("/director/bulk_delete", methods=["POST"])
+@idempotent(fingerprint=False)
+@validate(body=BulkDeleteModel)
+def bulk_delete():
+    """
+    DELETE many records by ID
+    ---
+    tags:
+      - Director
+    summary: Delete many directors by ID
+    description: >
+      A POST handler that deletes a list of directors with their movie links.
+      IDs are deleted in batches of BULK_DELETE_BATCH, one statement each.
+      With "Prefer: respond-async" the delete runs as a background job.
+    parameters:
+      - in: header
+        name: Prefer
+        type: string
+        description: respond-async to get a job ID right away
+      - in: body
+        name: body
+        schema:
+          type: object
+          properties:
+            ids:
+              type: array
+              items:
+                type: integer
+              description: IDs of the directors to delete
+    responses:
+      200:
+        description: Deleted IDs and the IDs that were not found
+      202:
+        description: Job created, see /jobs/{job_id}
+      400:
+        description: Invalid input
+      429:
+        description: Too many jobs running
+      500:
+        description: Internal server error
+    """
+
+    ids = request.body_params.ids
+
+    if wants_async():
+        result = runner.submit(
+            f"{DIRECTOR}.bulk_delete",
+            lambda job: svc_bulk_delete(ids, job.progress),
+            total=len(ids),
+        )
+        return job_response(result)
+
+    result = svc_bulk_delete(ids)
+    return result_response(result)
+
+
 @director_blueprint.route("/director/exact", methods=["POST"])
 @validate(body=SearchModel)
 def search_by_exact():
@@ -455,9 +537,12 @@ def search_by_exact():
     """
 
     payload = request.get_json()
+    if wants_ndjson():
+        return ndjson_response(svc_exact_search(payload, stream=True))
+
     result = svc_exact_search(payload)
 
-    return ResponseModel(status=result["status"], data=result["data"])
+    return respond(ResponseModel, result)
 
 
 @director_blueprint.route("/director/like", methods=["POST"])
@@ -526,9 +611,12 @@ def search_by_like():
     """
 
     payload = request.get_json()
+    if wants_ndjson():
+        return ndjson_response(svc_like_search(payload, stream=True))
+
     result = svc_like_search(payload)
 
-    return ResponseModel(status=result["status"], data=result["data"])
+    return respond(ResponseModel, result)
 
 
 @director_blueprint.route("/director/in", methods=["POST"])
@@ -597,6 +685,112 @@ def search_by_in():
     """
 
     payload = request.get_json()
+    if wants_ndjson():
+        return ndjson_response(svc_in_search(payload, stream=True))
+
     result = svc_in_search(payload)
 
-    return ResponseModel(status=result["status"], data=result["data"])
+    return respond(ResponseModel, result)
+
+
+@director_blueprint.route("/director/export.csv", methods=["GET"])
+@validate()
+def export_csv():
+    """
+    CSV EXPORT
+    Streams directors as CSV straight from COPY ... TO STDOUT
+    ---
+    tags:
+      - Director
+    summary: Export directors as CSV
+    description: >
+      A GET handler that streams directors as a CSV file with a header row.
+      Any column can be passed as a query parameter to filter on an exact
+      value, e.g. ?last_name=Nolan
+    produces:
+      - text/csv
+    responses:
+      200:
+        description: CSV file of the matching directors
+      400:
+        description: Unknown filter column
+      500:
+        description: Internal server error
+    """
+
+    result = svc_export(request.args.to_dict())
+    return csv_response(result, "director")
+
+
+@director_blueprint.route(
+    "/director/export.arrow", methods=["GET"], defaults={"fmt": ARROW}
+)
+@director_blueprint.route(
+    "/director/export.parquet", methods=["GET"], defaults={"fmt": PARQUET}
+)
+@validate()
+def export_columnar(fmt: str):
+    """
+    COLUMNAR EXPORT
+    Streams directors as an Arrow IPC stream or a Parquet file
+    ---
+    tags:
+      - Director
+    summary: Export directors in a columnar format
+    description: >
+      A GET handler that reads directors in batches from a server-side cursor
+      and streams them as typed columns. Query parameters filter on exact
+      column values like the CSV export.
+    produces:
+      - application/vnd.apache.arrow.stream
+      - application/vnd.apache.parquet
+    responses:
+      200:
+        description: Arrow IPC stream or Parquet file of the matching directors
+      400:
+        description: Unknown filter column
+      501:
+        description: pyarrow is not installed
+      500:
+        description: Internal server error
+    """
+
+    result = svc_export(request.args.to_dict(), stream=True)
+    return columnar_response(result, DIRECTOR, fmt)
+
+
+@director_blueprint.route("/director/changes", methods=["GET"])
+@validate()
+def get_changes():
+    """
+    DELTA SYNC
+    Returns directors changed since a sync token
+    ---
+    tags:
+      - Director
+    summary: Get directors changed since a sync token
+    description: >
+      A GET handler returning the directors inserted or updated and the keys of
+      those deleted since the token of a previous call, with the token for
+      the next call. Without a token every record is returned.
+    parameters:
+      - in: query
+        name: since
+        type: string
+        required: false
+        description: Token returned by the previous call
+    responses:
+      200:
+        description: Upserted rows, deleted keys and the next token
+      400:
+        description: Invalid sync token
+      404:
+        description: Change log not enabled
+      410:
+        description: Sync token older than the retained changes, sync again without one
+      500:
+        description: Internal server error
+    """
+
+    result = svc_changes(request.args.get("since"))
+    return result_response(result)
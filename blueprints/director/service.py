@@ -1,19 +1,40 @@
 """Service file for director"""
 
-from db.db_utils import do_query
-from constants.constants import DIRECTOR, SCHEMA_NAME
-
-
-def svc_get():
+from db.db_utils import (
+    bulk_delete_query,
+    copy_query,
+    do_query,
+    filter_clause,
+    stream_query,
+)
+from db.change_log import changes_query
+from cache.cache import cached, invalidate
+from cache.snapshot import from_snapshot
+from constants.constants import (
+    COLUMNS,
+    DIRECTOR,
+    MOVIE_DIRECTOR,
+    SCHEMA_NAME,
+    STATUS_BAD_REQUEST,
+)
+
+
+@cached(DIRECTOR)
+def svc_get(stream=False):
     """
     A GET service to get all records
     """
     sql = f"SELECT * FROM {SCHEMA_NAME}.{DIRECTOR};"
+    if stream:
+        return stream_query(sql, {})
+
     result = do_query(sql, {})
 
     return result
 
 
+@from_snapshot(DIRECTOR)
+@cached(DIRECTOR)
 def svc_get_by_id(director_id):
     """
     A GET service to get by ID
@@ -40,6 +61,7 @@ def svc_post(payload):
 
     result = do_query(sql, params)
 
+    invalidate(DIRECTOR, keys=())
     return result
 
 
@@ -67,6 +89,7 @@ def svc_put(payload, id):
     }
 
     result = do_query(sql, params)
+    invalidate(DIRECTOR, keys=[id])
     return result
 
 
@@ -83,10 +106,30 @@ def svc_delete(id):
     }
 
     result = do_query(sql, params)
+    invalidate(DIRECTOR, keys=[id])
+    # the links of the deleted rows cascade, their movies aren't known
+    invalidate(MOVIE_DIRECTOR)
+    return result
+
+
+def svc_bulk_delete(ids, progress=None):
+    """
+    Bulk DELETE service, directors by ID with their movie links
+    """
+
+    try:
+        result = bulk_delete_query(
+            DIRECTOR, "director_id", [MOVIE_DIRECTOR], ids, progress=progress
+        )
+    finally:
+        # batches deleted before a failure or cancellation are gone too
+        invalidate(DIRECTOR, keys=ids)
+        invalidate(MOVIE_DIRECTOR)
     return result
 
 
-def svc_exact_search(payload):
+@cached(DIRECTOR)
+def svc_exact_search(payload, stream=False):
     """
     An Exact search service
     """
@@ -102,11 +145,15 @@ def svc_exact_search(payload):
     sql = f"SELECT * FROM {SCHEMA_NAME}.{DIRECTOR} WHERE {exact_clause}"
     params = {"field": field, "value": value}
 
+    if stream:
+        return stream_query(sql, params)
+
     result = do_query(sql, params)
     return result
 
 
-def svc_like_search(payload):
+@cached(DIRECTOR)
+def svc_like_search(payload, stream=False):
     """
     LIKE Search service
     """
@@ -124,11 +171,15 @@ def svc_like_search(payload):
     sql = f"SELECT * FROM {SCHEMA_NAME}.{DIRECTOR} WHERE {like_clause};"
     params = {"field": field, "value": value}
 
+    if stream:
+        return stream_query(sql, params)
+
     result = do_query(sql, params)
     return result
 
 
-def svc_in_search(payload):
+@cached(DIRECTOR)
+def svc_in_search(payload, stream=False):
     """
     In Search service
     """
@@ -147,5 +198,37 @@ def svc_in_search(payload):
     sql = f"SELECT * FROM {SCHEMA_NAME}.{DIRECTOR} WHERE {field} IN ({in_clause});"
     params = {"field": field, "value": value}
 
+    if stream:
+        return stream_query(sql, params)
+
     result = do_query(sql, params)
     return result
+
+
+def svc_export(filters, stream=False):
+    """
+    Export service, CSV from COPY or a row iterator when streaming
+    """
+
+    try:
+        where_clause, params = filter_clause(DIRECTOR, filters)
+    except ValueError as err:
+        return {"status": STATUS_BAD_REQUEST, "error": err}
+
+    columns = ", ".join(COLUMNS[DIRECTOR])
+    sql = f"SELECT {columns} FROM {SCHEMA_NAME}.{DIRECTOR}{where_clause};"
+
+    if stream:
+        return stream_query(sql, params)
+
+    result = copy_query(sql, params)
+    return result
+
+
+def svc_changes(since):
+    """
+    Delta sync service, rows changed and keys deleted since a sync token
+    """
+
+    result = changes_query(DIRECTOR, since)
+    return result
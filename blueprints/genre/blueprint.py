@@ -9,8 +9,11 @@ from flask_pydantic import validate
 from flask import Blueprint, request
 from pydantic import BaseModel
 from blueprints.genre.service import (
+    svc_changes,
+    svc_bulk_delete,
     svc_delete,
     svc_exact_search,
+    svc_export,
     svc_get,
     svc_get_by_id,
     svc_in_search,
@@ -18,6 +21,17 @@ from blueprints.genre.service import (
     svc_post,
     svc_put,
 )
+from constants.constants import GENRE
+from api.columnar import ARROW, PARQUET, columnar_response
+from api.idempotency import idempotent
+from api.jobs import job_response, runner, wants_async
+from api.negotiation import (
+    csv_response,
+    ndjson_response,
+    result_response,
+    wants_ndjson,
+)
+from api.trusted import respond
 
 
 class GenreItems(BaseModel):
@@ -98,6 +112,14 @@ class PostModel(BaseModel):
     status: int | str
 
 
+class BulkDeleteModel(BaseModel):
+    """
+    Bulk delete model, IDs of the genres to delete
+    """
+
+    ids: list[int]
+
+
 version = os.getenv("VERSION")
 genre_blueprint = Blueprint("genre", __name__, url_prefix=version)
 
@@ -156,8 +178,11 @@ def get_all_records():
                   description: Error message
                   example: "An error occurred while retrieving genres"
     """
+    if wants_ndjson():
+        return ndjson_response(svc_get(stream=True))
+
     result = svc_get()
-    return ResponseModel(status=result["status"], data=result["data"])
+    return respond(ResponseModel, result)
 
 
 @genre_blueprint.route("/genre/<genre_id>", methods=["GET"])
@@ -222,10 +247,11 @@ def get_by_id(genre_id: int):
     """
 
     result = svc_get_by_id(genre_id)
-    return ResponseModel(status=result["status"], data=result["data"])
+    return respond(ResponseModel, result)
 
 
 @genre_blueprint.route("/genre/create", methods=["POST"])
+@idempotent()
 @validate(body=GenreItems)
 def post_record():
     """
@@ -362,6 +388,62 @@ def delete_record(genre_id: int):
     return ResponseModel(status=result["status"])
 
 
+@genre_blueprint.route("/genre/bulk_delete", methods=["POST"])
+@idempotent(fingerprint=False)
+@validate(body=BulkDeleteModel)
+def bulk_delete():
+    """
+    DELETE many records by ID
+    ---
+    tags:
+      - Genre
+    summary: Delete many genres by ID
+    description: >
+      A POST handler that deletes a list of genres with their movie links.
+      IDs are deleted in batches of BULK_DELETE_BATCH, one statement each.
+      With "Prefer: respond-async" the delete runs as a background job.
+    parameters:
+      - in: header
+        name: Prefer
+        type: string
+        description: respond-async to get a job ID right away
+      - in: body
+        name: body
+        schema:
+          type: object
+          properties:
+            ids:
+              type: array
+              items:
+                type: integer
+              description: IDs of the genres to delete
+    responses:
+      200:
+        description: Deleted IDs and the IDs that were not found
+      202:
+        description: Job created, see /jobs/{job_id}
+      400:
+        description: Invalid input
+      429:
+        description: Too many jobs running
+      500:
+        description: Internal server error
+    """
+
+    ids = request.body_params.ids
+
+    if wants_async():
+        result = runner.submit(
+            f"{GENRE}.bulk_delete",
+            lambda job: svc_bulk_delete(ids, job.progress),
+            total=len(ids),
+        )
+        return job_response(result)
+
+    result = svc_bulk_delete(ids)
+    return result_response(result)
+
+
 @genre_blueprint.route("/genre/in", methods=["POST"])
 @validate(body=InModel)
 def search_by_in():
@@ -425,9 +507,12 @@ def search_by_in():
     """
 
     payload = request.get_json()
+    if wants_ndjson():
+        return ndjson_response(svc_in_search(payload, stream=True))
+
     result = svc_in_search(payload)
 
-    return ResponseModel(status=result["status"], data=result["data"])
+    return respond(ResponseModel, result)
 
 
 @genre_blueprint.route("/genre/like", methods=["POST"])
@@ -493,9 +578,12 @@ def search_by_like():
     """
 
     payload = request.get_json()
+    if wants_ndjson():
+        return ndjson_response(svc_like_search(payload, stream=True))
+
     result = svc_like_search(payload)
 
-    return ResponseModel(status=result["status"], data=result["data"])
+    return respond(ResponseModel, result)
 
 
 @genre_blueprint.route("/genre/exact", methods=["POST"])
@@ -561,6 +649,110 @@ def search_by_exact():
     """
 
     payload = request.get_json()
+    if wants_ndjson():
+        return ndjson_response(svc_exact_search(payload, stream=True))
+
     result = svc_exact_search(payload)
 
-    return ResponseModel(status=result["status"], data=result["data"])
+    return respond(ResponseModel, result)
+
+
+@genre_blueprint.route("/genre/export.csv", methods=["GET"])
+@validate()
+def export_csv():
+    """
+    CSV EXPORT
+    Streams genres as CSV straight from COPY ... TO STDOUT
+    ---
+    tags:
+      - Genre
+    summary: Export genres as CSV
+    description: >
+      A GET handler that streams genres as a CSV file with a header row.
+      Any column can be passed as a query parameter to filter on an exact
+      value, e.g. ?name=Drama
+    produces:
+      - text/csv
+    responses:
+      200:
+        description: CSV file of the matching genres
+      400:
+        description: Unknown filter column
+      500:
+        description: Internal server error
+    """
+
+    result = svc_export(request.args.to_dict())
+    return csv_response(result, "genre")
+
+
+@genre_blueprint.route("/genre/export.arrow", methods=["GET"], defaults={"fmt": ARROW})
+@genre_blueprint.route(
+    "/genre/export.parquet", methods=["GET"], defaults={"fmt": PARQUET}
+)
+@validate()
+def export_columnar(fmt: str):
+    """
+    COLUMNAR EXPORT
+    Streams genres as an Arrow IPC stream or a Parquet file
+    ---
+    tags:
+      - Genre
+    summary: Export genres in a columnar format
+    description: >
+      A GET handler that reads genres in batches from a server-side cursor
+      and streams them as typed columns. Query parameters filter on exact
+      column values like the CSV export.
+    produces:
+      - application/vnd.apache.arrow.stream
+      - application/vnd.apache.parquet
+    responses:
+      200:
+        description: Arrow IPC stream or Parquet file of the matching genres
+      400:
+        description: Unknown filter column
+      501:
+        description: pyarrow is not installed
+      500:
+        description: Internal server error
+    """
+
+    result = svc_export(request.args.to_dict(), stream=True)
+    return columnar_response(result, GENRE, fmt)
+
+
+@genre_blueprint.route("/genre/changes", methods=["GET"])
+@validate()
+def get_changes():
+    """
+    DELTA SYNC
+    Returns genres changed since a sync token
+    ---
+    tags:
+      - Genre
+    summary: Get genres changed since a sync token
+    description: >
+      A GET handler returning the genres inserted or updated and the keys of
+      those deleted since the token of a previous call, with the token for
+      the next call. Without a token every record is returned.
+    parameters:
+      - in: query
+        name: since
+        type: string
+        required: false
+        description: Token returned by the previous call
+    responses:
+      200:
+        description: Upserted rows, deleted keys and the next token
+      400:
+        description: Invalid sync token
+      404:
+        description: Change log not enabled
+      410:
+        description: Sync token older than the retained changes, sync again without one
+      500:
+        description: Internal server error
+    """
+
+    result = svc_changes(request.args.get("since"))
+    return result_response(result)
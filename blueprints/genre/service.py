@@ -2,21 +2,42 @@
 Genre table service
 """
 
-from constants.constants import SCHEMA_NAME, GENRE
-from db.db_utils import do_query
-
-
-def svc_get():
+from constants.constants import (
+    COLUMNS,
+    SCHEMA_NAME,
+    GENRE,
+    MOVIE_GENRE,
+    STATUS_BAD_REQUEST,
+)
+from db.db_utils import (
+    bulk_delete_query,
+    copy_query,
+    do_query,
+    filter_clause,
+    stream_query,
+)
+from db.change_log import changes_query
+from cache.cache import cached, invalidate
+from cache.snapshot import from_snapshot
+
+
+@cached(GENRE)
+def svc_get(stream=False):
     """
     Get All service
     """
 
     sql = f"SELECT * FROM {SCHEMA_NAME}.{GENRE}"
 
+    if stream:
+        return stream_query(sql, {})
+
     result = do_query(sql, {})
     return result
 
 
+@from_snapshot(GENRE)
+@cached(GENRE)
 def svc_get_by_id(id):
     """
     Get all by id service
@@ -39,6 +60,7 @@ def svc_post(payload):
     params = [name]
 
     result = do_query(sql, params)
+    invalidate(GENRE, keys=())
     return result
 
 
@@ -55,6 +77,7 @@ def svc_put(id, payload):
     params = {"name": name, "created_at": created_at, "genre_id": id}
 
     result = do_query(sql, params)
+    invalidate(GENRE, keys=[id])
     return result
 
 
@@ -67,10 +90,30 @@ def svc_delete(id):
     params = [id]
 
     result = do_query(sql, params)
+    invalidate(GENRE, keys=[id])
+    # the links of the deleted rows cascade, their movies aren't known
+    invalidate(MOVIE_GENRE)
+    return result
+
+
+def svc_bulk_delete(ids, progress=None):
+    """
+    Bulk DELETE service, genres by ID with their movie links
+    """
+
+    try:
+        result = bulk_delete_query(
+            GENRE, "genre_id", [MOVIE_GENRE], ids, progress=progress
+        )
+    finally:
+        # batches deleted before a failure or cancellation are gone too
+        invalidate(GENRE, keys=ids)
+        invalidate(MOVIE_GENRE)
     return result
 
 
-def svc_in_search(payload):
+@cached(GENRE)
+def svc_in_search(payload, stream=False):
     """
     In Search service
     """
@@ -89,11 +132,15 @@ def svc_in_search(payload):
     sql = f"SELECT * FROM {SCHEMA_NAME}.{GENRE} WHERE {field} IN ({in_clause});"
     params = {"field": field, "value": value}
 
+    if stream:
+        return stream_query(sql, params)
+
     result = do_query(sql, params)
     return result
 
 
-def svc_like_search(payload):
+@cached(GENRE)
+def svc_like_search(payload, stream=False):
     """
     Like Search service
     """
@@ -111,11 +158,15 @@ def svc_like_search(payload):
     sql = f"SELECT * FROM {SCHEMA_NAME}.{GENRE} WHERE {like_clause}"
     params = {"field": field, "value": value}
 
+    if stream:
+        return stream_query(sql, params)
+
     result = do_query(sql, params)
     return result
 
 
-def svc_exact_search(payload):
+@cached(GENRE)
+def svc_exact_search(payload, stream=False):
     """
     Exact search service
     """
@@ -131,5 +182,37 @@ def svc_exact_search(payload):
     sql = f"SELECT * FROM {SCHEMA_NAME}.{GENRE} WHERE {search_condition};"
     params = {"field": field, "value": value}
 
+    if stream:
+        return stream_query(sql, params)
+
     result = do_query(sql, params)
     return result
+
+
+def svc_export(filters, stream=False):
+    """
+    Export service, CSV from COPY or a row iterator when streaming
+    """
+
+    try:
+        where_clause, params = filter_clause(GENRE, filters)
+    except ValueError as err:
+        return {"status": STATUS_BAD_REQUEST, "error": err}
+
+    columns = ", ".join(COLUMNS[GENRE])
+    sql = f"SELECT {columns} FROM {SCHEMA_NAME}.{GENRE}{where_clause};"
+
+    if stream:
+        return stream_query(sql, params)
+
+    result = copy_query(sql, params)
+    return result
+
+
+def svc_changes(since):
+    """
+    Delta sync service, rows changed and keys deleted since a sync token
+    """
+
+    result = changes_query(GENRE, since)
+    return result
@@ -5,6 +5,7 @@ blueprint for health check
 import os
 from flask import Blueprint, jsonify
 from db.db_utils import do_query
+from cache import warmup
 
 
 version = os.getenv("VERSION")
@@ -30,3 +31,15 @@ def health_check():
         return jsonify(db_health="NOT OK", status=500)
 
     return jsonify(message="OK", database_health="OK", status=200)
+
+
+@health_blueprint.route("/ready", methods=["GET"])
+def readiness_check():
+    """
+    a GET handler reporting ready once the cache warm-up has finished
+    """
+
+    if not warmup.ready.is_set():
+        return jsonify(message="WARMING UP", status=503), 503
+
+    return jsonify(message="READY", status=200)
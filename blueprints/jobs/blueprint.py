@@ -0,0 +1,78 @@
+"""
+blueprint for background jobs
+"""
+
+import os
+from flask import Blueprint
+from flask_pydantic import validate
+
+from blueprints.jobs.service import svc_cancel, svc_get
+from api.negotiation import result_response
+
+version = os.getenv("VERSION")
+jobs_blueprint = Blueprint("jobs", __name__, url_prefix=version)
+
+
+@jobs_blueprint.route("/jobs/<job_id>", methods=["GET"])
+@validate()
+def get_job(job_id: int):
+    """
+    A GET handler. Returns the state of a background job
+    ---
+    tags:
+      - Jobs
+    summary: Get a job by ID
+    description: >
+      State (queued, running, succeeded, failed or cancelled), rows processed
+      out of total, rows per second, errors and, once finished, the result of
+      a job started with "Prefer: respond-async".
+    parameters:
+      - in: path
+        name: job_id
+        type: integer
+        required: true
+        description: ID of the job
+    responses:
+      200:
+        description: The job
+      404:
+        description: Job not found
+      500:
+        description: Internal server error
+    """
+
+    result = svc_get(job_id)
+    return result_response(result)
+
+
+@jobs_blueprint.route("/jobs/<job_id>/cancel", methods=["POST"])
+@validate()
+def cancel_job(job_id: int):
+    """
+    A POST handler. Cancels a background job
+    ---
+    tags:
+      - Jobs
+    summary: Cancel a job by ID
+    description: >
+      Asks a queued or running job to stop. A running job stops at its next
+      progress report; work it already committed stays.
+    parameters:
+      - in: path
+        name: job_id
+        type: integer
+        required: true
+        description: ID of the job
+    responses:
+      200:
+        description: Cancellation requested
+      404:
+        description: Job not found
+      409:
+        description: Job already finished
+      500:
+        description: Internal server error
+    """
+
+    result = svc_cancel(job_id)
+    return result_response(result)
@@ -0,0 +1,59 @@
+"""
+Service file for background jobs
+"""
+
+from api.jobs import FINISHED, JOB, runner
+from constants.constants import (
+    SCHEMA_NAME,
+    STATUS_CONFLICT,
+    STATUS_NOT_FOUND,
+    STATUS_OK,
+)
+from db.db_utils import do_query
+
+
+def svc_get(job_id):
+    """
+    GET service, a job's state, progress and throughput
+    """
+
+    sql = f"""
+        SELECT job_id, kind, state, total, processed, errors, result,
+            cancel_requested, created_at, started_at, finished_at, updated_at,
+            round(processed / NULLIF(extract(epoch FROM
+                coalesce(finished_at, now()) - started_at), 0), 1) AS rows_per_second
+        FROM {SCHEMA_NAME}.{JOB} WHERE job_id = %(job_id)s;"""
+
+    result = do_query(sql, {"job_id": job_id})
+    if result["status"] != STATUS_OK:
+        return result
+    if not result["data"]:
+        return {"status": STATUS_NOT_FOUND, "error": f"No job {job_id}"}
+    return {"status": STATUS_OK, "data": result["data"][0]}
+
+
+def svc_cancel(job_id):
+    """
+    Cancel service, asks a queued or running job to stop
+    """
+
+    sql = f"""
+        UPDATE {SCHEMA_NAME}.{JOB} SET cancel_requested = true, updated_at = now()
+        WHERE job_id = %(job_id)s AND state NOT IN {FINISHED}
+        RETURNING job_id, state, cancel_requested;"""
+
+    result = do_query(sql, {"job_id": job_id})
+    if result["status"] != STATUS_OK:
+        return result
+    if not result["data"]:
+        found = svc_get(job_id)
+        if found["status"] != STATUS_OK:
+            return found
+        return {
+            "status": STATUS_CONFLICT,
+            "error": f"Job {job_id} already {found['data']['state']}",
+        }
+
+    # a job of this worker stops right away, others at their next report
+    runner.cancel(job_id)
+    return {"status": STATUS_OK, "data": result["data"][0]}
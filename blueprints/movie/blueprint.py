@@ -5,20 +5,44 @@ blueprint for movie table
 from datetime import date, datetime
 import os
 from typing import Optional
-from flask import Blueprint, request
+from flask import Blueprint, abort, request
 from pydantic import BaseModel
 from flask_pydantic import validate
 
 from blueprints.movie.service import (
+    svc_changes,
+    svc_bulk,
+    svc_bulk_delete,
     svc_delete,
     svc_exact_search,
+    svc_export,
     svc_get,
     svc_get_by_id,
     svc_in_search,
     svc_like_search,
     svc_post,
+    svc_patch,
     svc_put,
 )
+from constants.constants import MOVIE
+from api.bulk import (
+    BULK_TYPES,
+    RowSource,
+    bulk_job,
+    bulk_response,
+    read_rows,
+    spool_body,
+)
+from api.columnar import ARROW, PARQUET, columnar_response
+from api.idempotency import idempotent
+from api.jobs import job_response, runner, wants_async
+from api.negotiation import (
+    csv_response,
+    ndjson_response,
+    result_response,
+    wants_ndjson,
+)
+from api.trusted import respond
 
 
 class MovieItem(BaseModel):
@@ -26,7 +50,7 @@ class MovieItem(BaseModel):
 
     title: str
     description: str
-    movie_year: str
+    movie_year: str | date
     rating: float
     runtime: float
     votes: int
@@ -35,6 +59,32 @@ class MovieItem(BaseModel):
     created_at: Optional[str]
 
 
+class MoviePatchItem(BaseModel):
+    """Movie patch model, only the columns to change"""
+
+    title: Optional[str] = None
+    description: Optional[str] = None
+    movie_year: Optional[str | date] = None
+    rating: Optional[float] = None
+    runtime: Optional[float] = None
+    votes: Optional[int] = None
+    revenue: Optional[float] = None
+    metascore: Optional[int] = None
+
+
+class BulkMovieItem(BaseModel):
+    """Movie bulk row model, created_at is set by the database"""
+
+    title: str
+    description: str
+    movie_year: date
+    rating: float
+    runtime: float
+    votes: int
+    revenue: float
+    metascore: int
+
+
 class MovieDataModel(BaseModel):
     """Movie data model"""
 
@@ -95,6 +145,14 @@ class PostModel(BaseModel):
     status: int | str
 
 
+class BulkDeleteModel(BaseModel):
+    """
+    Bulk delete model, IDs of the movies to delete
+    """
+
+    ids: list[int]
+
+
 version = os.getenv("VERSION")
 movie_blueprint = Blueprint("movie", __name__, url_prefix=version)
 
@@ -155,9 +213,12 @@ def get_all_records():
       500:
         description: Internal server error
     """
+    if wants_ndjson():
+        return ndjson_response(svc_get(stream=True))
+
     result = svc_get()
 
-    return ResponseModel(status=result["status"], data=result["data"])
+    return respond(ResponseModel, result)
 
 
 @movie_blueprint.route("/movie/<movie_id>", methods=["GET"])
@@ -226,10 +287,11 @@ def get_by_id(movie_id: int):
     """
     result = svc_get_by_id(movie_id)
 
-    return ResponseModel(status=result["status"], data=result["data"])
+    return respond(ResponseModel, result)
 
 
 @movie_blueprint.route("/movie/create", methods=["POST"])
+@idempotent()
 @validate(body=MovieItem)
 def post_movie():
     """
@@ -308,6 +370,68 @@ def post_movie():
     return PostModel(status=status)
 
 
+@movie_blueprint.route("/movie/bulk", methods=["POST"])
+@idempotent(fingerprint=False)
+def post_bulk():
+    """
+    A POST handler. Creates many movie records at once
+    ---
+    tags:
+      - Movie
+    summary: Bulk create movies
+    description: >
+      A POST handler that streams an NDJSON or CSV body of movies, validates
+      each row and loads the valid ones with COPY into a staging table before
+      inserting them in one statement. Rows use the fields of /movie/create
+      without created_at; a CSV body starts with a header row. Invalid rows
+      are skipped and reported, more than BULK_MAX_ERRORS of them cancel the
+      whole load. With "Prefer: respond-async" the body is spooled and loaded
+      by a background job.
+    consumes:
+      - application/x-ndjson
+      - text/csv
+    parameters:
+      - in: header
+        name: Prefer
+        type: string
+        description: respond-async to get a job ID right away
+      - in: body
+        name: body
+        description: One movie per line
+        schema:
+          type: string
+    responses:
+      201:
+        description: Number of movies inserted, new movie_id by row number and rejected rows
+      400:
+        description: Too many invalid rows, nothing was inserted
+      202:
+        description: Job created, see /jobs/{job_id}
+      415:
+        description: Body is neither NDJSON nor CSV
+      429:
+        description: Too many jobs running
+      500:
+        description: Internal server error
+    """
+    if request.mimetype not in BULK_TYPES:
+        abort(415)
+
+    if wants_async():
+        run = bulk_job(
+            request.mimetype, spool_body(request), BulkMovieItem, svc_bulk, "movie_id"
+        )
+        result = runner.submit(f"{MOVIE}.bulk", run)
+        return job_response(result)
+
+    rows = read_rows(request)
+
+    source = RowSource(rows, BulkMovieItem)
+    result = svc_bulk(source)
+
+    return bulk_response(result, source, "movie_id")
+
+
 @movie_blueprint.route("/movie/<movie_id>", methods=["PUT"])
 @validate(body=MovieItem)
 def put_movie(movie_id: int):
@@ -385,6 +509,66 @@ def put_movie(movie_id: int):
     return ResponseModel(status=result["status"], data=result["data"])
 
 
+@movie_blueprint.route("/movie/<movie_id>", methods=["PATCH"])
+@validate(body=MoviePatchItem)
+def patch_movie(movie_id: int):
+    """
+    A PATCH handler. Updates only the given columns of a record
+    ---
+    tags:
+      - Movie
+    summary: Partially update a movie by ID
+    description: >
+      A PATCH handler that sets only the columns present in the body. The
+      row isn't written when no value differs from the stored one.
+    parameters:
+      - in: path
+        name: movie_id
+        type: integer
+        required: true
+        description: ID of the movie to update
+      - in: body
+        name: body
+        description: Columns to change
+        schema:
+          type: object
+          properties:
+            title:
+              type: string
+            description:
+              type: string
+            movie_year:
+              type: string
+              format: date
+            rating:
+              type: number
+              format: float
+            runtime:
+              type: number
+              format: float
+            votes:
+              type: integer
+            revenue:
+              type: number
+              format: float
+            metascore:
+              type: integer
+    responses:
+      200:
+        description: The movie and whether it changed
+      400:
+        description: Invalid input
+      404:
+        description: Movie not found
+      500:
+        description: Internal server error
+    """
+
+    payload = request.body_params.model_dump(exclude_unset=True)
+    result = svc_patch(payload, movie_id)
+    return result_response(result)
+
+
 @movie_blueprint.route("/movie/<movie_id>", methods=["DELETE"])
 @validate()
 def delete_movie(movie_id: int):
@@ -415,6 +599,62 @@ def delete_movie(movie_id: int):
     return ResponseModel(status=result["status"], data=result["data"])
 
 
+@movie_blueprint.route("/movie/bulk_delete", methods=["POST"])
+@idempotent(fingerprint=False)
+@validate(body=BulkDeleteModel)
+def bulk_delete():
+    """
+    DELETE many records by ID
+    ---
+    tags:
+      - Movie
+    summary: Delete many movies by ID
+    description: >
+      A POST handler that deletes a list of movies with their reviews and actor, director and genre links.
+      IDs are deleted in batches of BULK_DELETE_BATCH, one statement each.
+      With "Prefer: respond-async" the delete runs as a background job.
+    parameters:
+      - in: header
+        name: Prefer
+        type: string
+        description: respond-async to get a job ID right away
+      - in: body
+        name: body
+        schema:
+          type: object
+          properties:
+            ids:
+              type: array
+              items:
+                type: integer
+              description: IDs of the movies to delete
+    responses:
+      200:
+        description: Deleted IDs and the IDs that were not found
+      202:
+        description: Job created, see /jobs/{job_id}
+      400:
+        description: Invalid input
+      429:
+        description: Too many jobs running
+      500:
+        description: Internal server error
+    """
+
+    ids = request.body_params.ids
+
+    if wants_async():
+        result = runner.submit(
+            f"{MOVIE}.bulk_delete",
+            lambda job: svc_bulk_delete(ids, job.progress),
+            total=len(ids),
+        )
+        return job_response(result)
+
+    result = svc_bulk_delete(ids)
+    return result_response(result)
+
+
 @movie_blueprint.route("/movie/exact", methods=["POST"])
 @validate(body=SearchModel)
 def search_exact():
@@ -504,8 +744,11 @@ def search_exact():
     # request object
     payload = request.get_json()
 
+    if wants_ndjson():
+        return ndjson_response(svc_exact_search(payload, stream=True))
+
     result = svc_exact_search(payload)
-    return ResponseModel(status=result["status"], data=result["data"])
+    return respond(ResponseModel, result)
 
 
 @movie_blueprint.route("/movie/like", methods=["POST"])
@@ -597,8 +840,11 @@ def like_search():
 
     payload = request.get_json()
 
+    if wants_ndjson():
+        return ndjson_response(svc_like_search(payload, stream=True))
+
     result = svc_like_search(payload)
-    return ResponseModel(status=result["status"], data=result["data"])
+    return respond(ResponseModel, result)
 
 
 @movie_blueprint.route("/movie/in", methods=["POST"])
@@ -689,5 +935,109 @@ def in_search():
 
     payload = request.get_json()
 
+    if wants_ndjson():
+        return ndjson_response(svc_in_search(payload, stream=True))
+
     result = svc_in_search(payload)
-    return ResponseModel(status=result["status"], data=result["data"])
+    return respond(ResponseModel, result)
+
+
+@movie_blueprint.route("/movie/export.csv", methods=["GET"])
+@validate()
+def export_csv():
+    """
+    CSV EXPORT
+    Streams movies as CSV straight from COPY ... TO STDOUT
+    ---
+    tags:
+      - Movie
+    summary: Export movies as CSV
+    description: >
+      A GET handler that streams movies as a CSV file with a header row.
+      Any column can be passed as a query parameter to filter on an exact
+      value, e.g. ?movie_year=2014-01-01
+    produces:
+      - text/csv
+    responses:
+      200:
+        description: CSV file of the matching movies
+      400:
+        description: Unknown filter column
+      500:
+        description: Internal server error
+    """
+
+    result = svc_export(request.args.to_dict())
+    return csv_response(result, "movie")
+
+
+@movie_blueprint.route("/movie/export.arrow", methods=["GET"], defaults={"fmt": ARROW})
+@movie_blueprint.route(
+    "/movie/export.parquet", methods=["GET"], defaults={"fmt": PARQUET}
+)
+@validate()
+def export_columnar(fmt: str):
+    """
+    COLUMNAR EXPORT
+    Streams movies as an Arrow IPC stream or a Parquet file
+    ---
+    tags:
+      - Movie
+    summary: Export movies in a columnar format
+    description: >
+      A GET handler that reads movies in batches from a server-side cursor
+      and streams them as typed columns. Query parameters filter on exact
+      column values like the CSV export.
+    produces:
+      - application/vnd.apache.arrow.stream
+      - application/vnd.apache.parquet
+    responses:
+      200:
+        description: Arrow IPC stream or Parquet file of the matching movies
+      400:
+        description: Unknown filter column
+      501:
+        description: pyarrow is not installed
+      500:
+        description: Internal server error
+    """
+
+    result = svc_export(request.args.to_dict(), stream=True)
+    return columnar_response(result, MOVIE, fmt)
+
+
+@movie_blueprint.route("/movie/changes", methods=["GET"])
+@validate()
+def get_changes():
+    """
+    DELTA SYNC
+    Returns movies changed since a sync token
+    ---
+    tags:
+      - Movie
+    summary: Get movies changed since a sync token
+    description: >
+      A GET handler returning the movies inserted or updated and the keys of
+      those deleted since the token of a previous call, with the token for
+      the next call. Without a token every record is returned.
+    parameters:
+      - in: query
+        name: since
+        type: string
+        required: false
+        description: Token returned by the previous call
+    responses:
+      200:
+        description: Upserted rows, deleted keys and the next token
+      400:
+        description: Invalid sync token
+      404:
+        description: Change log not enabled
+      410:
+        description: Sync token older than the retained changes, sync again without one
+      500:
+        description: Internal server error
+    """
+
+    result = svc_changes(request.args.get("since"))
+    return result_response(result)
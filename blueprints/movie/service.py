@@ -2,28 +2,51 @@
 Service file for movie
 """
 
-
-from db.db_utils import do_query
+from db.db_utils import (
+    bulk_delete_query,
+    copy_in_query,
+    copy_query,
+    delete_sql,
+    do_query,
+    filter_clause,
+    patch_query,
+    stream_query,
+)
+from db.change_log import changes_query
+from cache.cache import cached, invalidate
+from cache.snapshot import from_snapshot
 from constants.constants import (
+    COLUMNS,
     MOVIE_ACTOR,
     MOVIE_DIRECTOR,
     MOVIE_GENRE,
     MOVIE_REVIEW,
     SCHEMA_NAME,
     MOVIE,
+    STATUS_BAD_REQUEST,
+    STATUS_OK,
 )
 
+# tables referencing movie_id, emptied along with the movies
+DEPENDENTS = (MOVIE_REVIEW, MOVIE_ACTOR, MOVIE_DIRECTOR, MOVIE_GENRE)
+
 
-def svc_get():
+@cached(MOVIE)
+def svc_get(stream=False):
     """
     A GET service to get all records
     """
     sql = f"SELECT * FROM {SCHEMA_NAME}.{MOVIE};"
+    if stream:
+        return stream_query(sql, {})
+
     result = do_query(sql, {})
 
     return result
 
 
+@from_snapshot(MOVIE)
+@cached(MOVIE)
 def svc_get_by_id(id):
     """
     A GET service to get by ID
@@ -58,6 +81,36 @@ def svc_post(payload):
 
     result = do_query(sql, params)
 
+    invalidate(MOVIE, keys=())
+    return result
+
+
+def svc_bulk(source):
+    """
+    A bulk POST service, COPY into a staging table then one INSERT
+
+    parameter source = file-like CSV of row number and source.columns
+    """
+
+    columns = ", ".join(source.columns)
+    staging = f"{MOVIE}_staging"
+
+    # ids are drawn from the movie sequence while loading, so each input row
+    # can be matched with its new movie_id
+    setup_sql = f"""
+        CREATE TEMP TABLE {staging} ON COMMIT DROP AS
+            SELECT 0 AS row_no, {columns} FROM {SCHEMA_NAME}.{MOVIE} WITH NO DATA;
+        ALTER TABLE {staging} ADD COLUMN movie_id bigint
+            DEFAULT nextval(pg_get_serial_sequence('{SCHEMA_NAME}.{MOVIE}', 'movie_id'));"""
+    copy_sql = f"COPY {staging} (row_no, {columns}) FROM STDIN WITH CSV"
+    merge_sql = f"""
+        INSERT INTO {SCHEMA_NAME}.{MOVIE} (movie_id, {columns})
+            SELECT movie_id, {columns} FROM {staging};
+        SELECT row_no AS "row", movie_id FROM {staging} ORDER BY row_no;"""
+
+    result = copy_in_query(setup_sql, copy_sql, source, merge_sql)
+
+    invalidate(MOVIE, keys=())
     return result
 
 
@@ -100,6 +153,18 @@ def svc_put(payload, id):
 
     result = do_query(sql, params)
 
+    invalidate(MOVIE, keys=[id])
+    return result
+
+
+def svc_patch(payload, id):
+    """
+    A PATCH service, writes only the given columns and only if they changed
+    """
+
+    result = patch_query(MOVIE, "movie_id", id, payload)
+    if result["status"] == STATUS_OK and result["data"]["changed"]:
+        invalidate(MOVIE, keys=[id])
     return result
 
 
@@ -108,55 +173,32 @@ def svc_delete(movie_id):
     A DELETE service
     """
 
-    # deletes from the child table first and then deletes from parent table
-    movie_review_sql = (
-        # child table
-        f"""
-        DELETE FROM {SCHEMA_NAME}.{MOVIE_REVIEW} WHERE movie_id = %(movie_id)s;
-        """
-    )
-
-    movie_actor_sql = (
-        # child table
-        f"""
-        DELETE FROM {SCHEMA_NAME}.{MOVIE_ACTOR} WHERE movie_id = %(movie_id)s;
-        """
-    )
-
-    movie_director_sql = (
-        # child table
-        f"""
-        DELETE FROM {SCHEMA_NAME}.{MOVIE_DIRECTOR} WHERE movie_id = %(movie_id)s;
-        """
-    )
-
-    movie_genre_sql = (
-        # child table
-        f"""
-        DELETE FROM {SCHEMA_NAME}.{MOVIE_GENRE} WHERE movie_id = %(movie_id)s;
-        """
-    )
-
-    # parent table
-    parent_table_sql = f"""DELETE FROM {SCHEMA_NAME}.{MOVIE} WHERE movie_id = %(movie_id)s
-        RETURNING *;
-        """
+    # deletes from the child tables and the parent table in one statement
+    sql = delete_sql(MOVIE, "movie_id", DEPENDENTS)
+    params = {"ids": [movie_id]}
 
-    # parameters for SQL
-    params = {"movie_id": movie_id}
+    result = do_query(sql, params)
+    invalidate(MOVIE, *DEPENDENTS, keys=[movie_id])
+    return result
 
-    # execute child table query
-    do_query(movie_review_sql, params)
-    do_query(movie_actor_sql, params)
-    do_query(movie_director_sql, params)
-    do_query(movie_genre_sql, params)
 
-    # execute parent table query
-    result = do_query(parent_table_sql, params)
+def svc_bulk_delete(ids, progress=None):
+    """
+    Bulk DELETE service, movies by ID with their reviews and links
+    """
+
+    try:
+        result = bulk_delete_query(
+            MOVIE, "movie_id", DEPENDENTS, ids, progress=progress
+        )
+    finally:
+        # batches deleted before a failure or cancellation are gone too
+        invalidate(MOVIE, *DEPENDENTS, keys=ids)
     return result
 
 
-def svc_exact_search(payload):
+@cached(MOVIE)
+def svc_exact_search(payload, stream=False):
     """
     EXACT search service
     """
@@ -173,11 +215,15 @@ def svc_exact_search(payload):
     sql = f"SELECT * FROM {SCHEMA_NAME}.{MOVIE} WHERE {search_condition}"
     params = {"field": field, "value": value}
 
+    if stream:
+        return stream_query(sql, params)
+
     result = do_query(sql, params)
     return result
 
 
-def svc_like_search(payload):
+@cached(MOVIE)
+def svc_like_search(payload, stream=False):
     """
     LIKE search service
     """
@@ -195,11 +241,15 @@ def svc_like_search(payload):
 
     params = {"field": field, "value": value}
 
+    if stream:
+        return stream_query(sql, params)
+
     result = do_query(sql, params)
     return result
 
 
-def svc_in_search(payload):
+@cached(MOVIE)
+def svc_in_search(payload, stream=False):
     """
     IN search service
     """
@@ -220,5 +270,37 @@ def svc_in_search(payload):
 
     params = {"field": field, "value": value}
 
+    if stream:
+        return stream_query(sql, params)
+
     result = do_query(sql, params)
     return result
+
+
+def svc_export(filters, stream=False):
+    """
+    Export service, CSV from COPY or a row iterator when streaming
+    """
+
+    try:
+        where_clause, params = filter_clause(MOVIE, filters)
+    except ValueError as err:
+        return {"status": STATUS_BAD_REQUEST, "error": err}
+
+    columns = ", ".join(COLUMNS[MOVIE])
+    sql = f"SELECT {columns} FROM {SCHEMA_NAME}.{MOVIE}{where_clause};"
+
+    if stream:
+        return stream_query(sql, params)
+
+    result = copy_query(sql, params)
+    return result
+
+
+def svc_changes(since):
+    """
+    Delta sync service, rows changed and keys deleted since a sync token
+    """
+
+    result = changes_query(MOVIE, since)
+    return result
@@ -2,21 +2,44 @@
 service file for movie_actor
 """
 
-from constants.constants import SCHEMA_NAME, MOVIE_ACTOR
-from db.db_utils import do_query
-
-
-def svc_get():
+from constants.constants import (
+    COLUMNS,
+    SCHEMA_NAME,
+    ACTOR,
+    MOVIE,
+    MOVIE_ACTOR,
+    STATUS_BAD_REQUEST,
+)
+from db.db_utils import (
+    bulk_link_query,
+    copy_query,
+    do_query,
+    filter_clause,
+    replace_links_query,
+    stream_query,
+)
+from db.change_log import changes_query
+from cache.cache import cached, invalidate
+from cache.snapshot import from_snapshot
+
+
+@cached(MOVIE_ACTOR)
+def svc_get(stream=False):
     """
     Get service
     """
 
     sql = f"SELECT * FROM {SCHEMA_NAME}.{MOVIE_ACTOR};"
 
+    if stream:
+        return stream_query(sql, {})
+
     result = do_query(sql, {})
     return result
 
 
+@from_snapshot(MOVIE_ACTOR)
+@cached(MOVIE_ACTOR)
 def svc_get_by_id(ids_):
     """
     GET by ID service
@@ -42,6 +65,19 @@ def svc_post(payload):
     params = [movie_id, actor_id]
 
     result = do_query(sql, params)
+    invalidate(MOVIE_ACTOR, keys=[movie_id])
+    return result
+
+
+def svc_bulk_post(pairs):
+    """
+    Bulk POST service, links many (movie_id, actor_id) pairs at once
+    """
+
+    result = bulk_link_query(
+        MOVIE_ACTOR, ("movie_id", "actor_id"), (MOVIE, ACTOR), pairs
+    )
+    invalidate(MOVIE_ACTOR, keys=sorted({pair[0] for pair in pairs}))
     return result
 
 
@@ -57,21 +93,51 @@ def svc_put(ids_, payload):
     movie_id = payload["movie_id"]
     actor_id = payload["actor_id"]
 
-    # deletes the record
-    delete_stat_sql = f"""DELETE FROM {SCHEMA_NAME}.{MOVIE_ACTOR} 
-            WHERE movie_id = %(movie_id)s AND actor_id = %(actor_id)s
-            RETURNING *;"""
-    delete_sql_params = {"movie_id": ids[0], "actor_id": ids[1]}
+    # moves the link in one statement: the old pair is deleted and the new
+    # one inserted unless it exists already, in which case it is returned
+    # as it is instead of being rewritten
+    sql = f"""
+        WITH removed AS (
+            DELETE FROM {SCHEMA_NAME}.{MOVIE_ACTOR}
+            WHERE movie_id = %(old_movie_id)s AND actor_id = %(old_actor_id)s
+                AND (movie_id, actor_id) <> (%(movie_id)s, %(actor_id)s)
+        ),
+        inserted AS (
+            INSERT INTO {SCHEMA_NAME}.{MOVIE_ACTOR}(movie_id, actor_id)
+            VALUES (%(movie_id)s, %(actor_id)s)
+            ON CONFLICT DO NOTHING
+            RETURNING *
+        )
+        SELECT * FROM inserted
+        UNION ALL
+        SELECT * FROM {SCHEMA_NAME}.{MOVIE_ACTOR}
+        WHERE movie_id = %(movie_id)s AND actor_id = %(actor_id)s
+            AND NOT EXISTS (SELECT 1 FROM inserted);"""
+    params = {
+        "old_movie_id": ids[0],
+        "old_actor_id": ids[1],
+        "movie_id": movie_id,
+        "actor_id": actor_id,
+    }
+
+    result = do_query(sql, params)
+    invalidate(MOVIE_ACTOR, keys=[ids[0], movie_id])
+    return result
 
-    insert_stat_sql = f"""INSERT INTO {SCHEMA_NAME}.{MOVIE_ACTOR}(movie_id, actor_id)
-                        VALUES(%s, %s) RETURNING *;"""
-    insert_sql_params = [movie_id, actor_id]
 
-    # executes the query to delete the record from the table
-    do_query(delete_stat_sql, delete_sql_params)
+def svc_replace(movie_id, actor_ids):
+    """
+    Replace service, makes actor_ids the full set of links of a movie
+    """
 
-    # inserts the new record to the table
-    result = do_query(insert_stat_sql, insert_sql_params)
+    result = replace_links_query(
+        MOVIE_ACTOR,
+        ("movie_id", "actor_id"),
+        (MOVIE, ACTOR),
+        movie_id,
+        actor_ids,
+    )
+    invalidate(MOVIE_ACTOR, keys=[movie_id])
     return result
 
 
@@ -90,6 +156,7 @@ def svc_delete(ids_):
     params = [movie_id, actor_id]
 
     result = do_query(sql, params)
+    invalidate(MOVIE_ACTOR, keys=[movie_id])
     return result
 
 
@@ -105,10 +172,12 @@ def svc_delete_movie(movie_id):
     params = [movie_id]
 
     result = do_query(sql, params)
+    invalidate(MOVIE_ACTOR, keys=[movie_id])
     return result
 
 
-def svc_exact_search(payload):
+@cached(MOVIE_ACTOR)
+def svc_exact_search(payload, stream=False):
     """
     EXACT search service
     """
@@ -124,5 +193,37 @@ def svc_exact_search(payload):
     sql = f"SELECT * FROM {SCHEMA_NAME}.{MOVIE_ACTOR} WHERE {search_condition};"
     params = {"field": field, "value": value}
 
+    if stream:
+        return stream_query(sql, params)
+
     result = do_query(sql, params)
     return result
+
+
+def svc_export(filters, stream=False):
+    """
+    Export service, CSV from COPY or a row iterator when streaming
+    """
+
+    try:
+        where_clause, params = filter_clause(MOVIE_ACTOR, filters)
+    except ValueError as err:
+        return {"status": STATUS_BAD_REQUEST, "error": err}
+
+    columns = ", ".join(COLUMNS[MOVIE_ACTOR])
+    sql = f"SELECT {columns} FROM {SCHEMA_NAME}.{MOVIE_ACTOR}{where_clause};"
+
+    if stream:
+        return stream_query(sql, params)
+
+    result = copy_query(sql, params)
+    return result
+
+
+def svc_changes(since):
+    """
+    Delta sync service, rows changed and keys deleted since a sync token
+    """
+
+    result = changes_query(MOVIE_ACTOR, since)
+    return result
@@ -2,23 +2,36 @@
 blueprint for movie_director
 """
 
-
 from datetime import date, datetime
 import os
 from typing import Optional
 from flask import Blueprint, request
-from pydantic import BaseModel
+from pydantic import BaseModel, model_validator
 from flask_pydantic import validate
 
 from blueprints.movie_director.service import (
+    svc_bulk_post,
+    svc_changes,
     svc_delete,
     svc_delete_movie,
     svc_get,
     svc_get_by_id,
     svc_post,
     svc_put,
+    svc_replace,
     svc_exact_search,
+    svc_export,
+)
+from constants.constants import MOVIE_DIRECTOR
+from api.columnar import ARROW, PARQUET, columnar_response
+from api.idempotency import idempotent
+from api.negotiation import (
+    csv_response,
+    ndjson_response,
+    result_response,
+    wants_ndjson,
 )
+from api.trusted import respond
 
 
 class MovieDirectorDataModel(BaseModel):
@@ -73,6 +86,44 @@ class PostModel(BaseModel):
     status: int
 
 
+class PairModel(BaseModel):
+    """
+    Movie and director ID pair model
+    """
+
+    movie_id: int
+    director_id: int
+
+
+class BulkModel(BaseModel):
+    """
+    Bulk link model, a movie with director IDs and/or a list of pairs
+    """
+
+    movie_id: Optional[int] = None
+    director_ids: list[int] = []
+    pairs: list[PairModel] = []
+
+    @model_validator(mode="after")
+    def check_items(self):
+        """
+        requires movie_id with director_ids and at least one item
+        """
+        if self.director_ids and self.movie_id is None:
+            raise ValueError("movie_id is required with director_ids")
+        if not self.director_ids and not self.pairs:
+            raise ValueError("no director_ids or pairs given")
+        return self
+
+
+class ReplaceModel(BaseModel):
+    """
+    Replace model, the complete list of director IDs of a movie
+    """
+
+    director_ids: list[int]
+
+
 version = os.getenv("VERSION")
 movie_director_blueprint = Blueprint("movie_director", __name__, url_prefix=version)
 
@@ -112,8 +163,11 @@ def get_all_records():
         description: Internal server error
     """
 
+    if wants_ndjson():
+        return ndjson_response(svc_get(stream=True))
+
     result = svc_get()
-    return ResponseModel(status=result["status"], data=result["data"])
+    return respond(ResponseModel, result)
 
 
 @movie_director_blueprint.route(
@@ -165,10 +219,11 @@ def get_by_id(movie_id: int, director_id: int):
     pkeys = f"{pkeys}, {director_id}"
 
     result = svc_get_by_id(pkeys)
-    return ResponseModel(status=result["status"], data=result["data"])
+    return respond(ResponseModel, result)
 
 
 @movie_director_blueprint.route("/movie_director/create", methods=["POST"])
+@idempotent()
 @validate(body=MovieDirectorDataModel)
 def post_record():
     """
@@ -224,6 +279,67 @@ def post_record():
     return PostModel(status=status)
 
 
+@movie_director_blueprint.route("/movie_director/bulk", methods=["POST"])
+@idempotent()
+@validate(body=BulkModel)
+def post_bulk():
+    """
+    POST many records at once
+
+    ---
+    tags:
+      - Movie Director
+    summary: Create many movie-director relationships
+    description: >
+      A POST handler that links a movie to a list of directors, or inserts a
+      list of movie and director pairs, with a single statement. Unknown IDs,
+      duplicates and existing links are skipped and reported per item.
+    parameters:
+      - in: body
+        name: body
+        schema:
+          type: object
+          properties:
+            movie_id:
+              type: integer
+              description: ID of the movie linked to director_ids
+            director_ids:
+              type: array
+              items:
+                type: integer
+              description: IDs of the directors to link to movie_id
+            pairs:
+              type: array
+              items:
+                type: object
+                properties:
+                  movie_id:
+                    type: integer
+                  director_id:
+                    type: integer
+              description: Movie and director ID pairs to link
+    responses:
+      200:
+        description: Number of records inserted and one item per pair with its error, if any
+      400:
+        description: Invalid input
+      500:
+        description: Internal server error
+    """
+
+    payload = request.get_json()
+    pairs = [
+        (payload["movie_id"], director_id)
+        for director_id in payload.get("director_ids", [])
+    ]
+    pairs += [
+        (pair["movie_id"], pair["director_id"]) for pair in payload.get("pairs", [])
+    ]
+
+    result = svc_bulk_post(pairs)
+    return result_response(result)
+
+
 @movie_director_blueprint.route(
     "/movie_director/<movie_id>/<director_id>", methods=["PUT"]
 )
@@ -397,6 +513,52 @@ def delete_movie(movie_id: int):
     return ResponseModel(status=result["status"], data=result["data"])
 
 
+@movie_director_blueprint.route("/movie_director/movie/<movie_id>", methods=["PUT"])
+@validate(body=ReplaceModel)
+def replace_movie(movie_id: int):
+    """
+    A PUT handler. Replaces the full set of directors of a movie
+
+    ---
+    tags:
+      - Movie Director
+    summary: Replace all directors of a movie
+    description: >
+      A PUT handler that makes director_ids the complete list of directors linked
+      to the movie. Only the difference is applied, in one transaction:
+      links missing from the list are deleted and new ones inserted.
+    parameters:
+      - in: path
+        name: movie_id
+        type: integer
+        required: true
+        description: ID of the movie
+      - in: body
+        name: body
+        schema:
+          type: object
+          required:
+            - director_ids
+          properties:
+            director_ids:
+              type: array
+              items:
+                type: integer
+              description: IDs of every director of the movie
+    responses:
+      200:
+        description: IDs of the directors added and removed
+      400:
+        description: Unknown movie or director IDs, nothing was changed
+      500:
+        description: Internal server error
+    """
+
+    payload = request.get_json()
+    result = svc_replace(movie_id, payload["director_ids"])
+    return result_response(result)
+
+
 @movie_director_blueprint.route("/movie_director/exact", methods=["POST"])
 @validate(body=SearchModel)
 def search_exact():
@@ -469,5 +631,111 @@ def search_exact():
     # request object
     payload = request.get_json()
 
+    if wants_ndjson():
+        return ndjson_response(svc_exact_search(payload, stream=True))
+
     result = svc_exact_search(payload)
-    return ResponseModel(status=result["status"], data=result["data"])
+    return respond(ResponseModel, result)
+
+
+@movie_director_blueprint.route("/movie_director/export.csv", methods=["GET"])
+@validate()
+def export_csv():
+    """
+    CSV EXPORT
+    Streams movie-director records as CSV straight from COPY ... TO STDOUT
+    ---
+    tags:
+      - Movie Director
+    summary: Export movie-director records as CSV
+    description: >
+      A GET handler that streams movie-director records as a CSV file with a header row.
+      Any column can be passed as a query parameter to filter on an exact
+      value, e.g. ?movie_id=1
+    produces:
+      - text/csv
+    responses:
+      200:
+        description: CSV file of the matching movie-director records
+      400:
+        description: Unknown filter column
+      500:
+        description: Internal server error
+    """
+
+    result = svc_export(request.args.to_dict())
+    return csv_response(result, "movie_director")
+
+
+@movie_director_blueprint.route(
+    "/movie_director/export.arrow", methods=["GET"], defaults={"fmt": ARROW}
+)
+@movie_director_blueprint.route(
+    "/movie_director/export.parquet", methods=["GET"], defaults={"fmt": PARQUET}
+)
+@validate()
+def export_columnar(fmt: str):
+    """
+    COLUMNAR EXPORT
+    Streams movie-director records as an Arrow IPC stream or a Parquet file
+    ---
+    tags:
+      - Movie Director
+    summary: Export movie-director records in a columnar format
+    description: >
+      A GET handler that reads movie-director records in batches from a server-side cursor
+      and streams them as typed columns. Query parameters filter on exact
+      column values like the CSV export.
+    produces:
+      - application/vnd.apache.arrow.stream
+      - application/vnd.apache.parquet
+    responses:
+      200:
+        description: Arrow IPC stream or Parquet file of the matching movie-director records
+      400:
+        description: Unknown filter column
+      501:
+        description: pyarrow is not installed
+      500:
+        description: Internal server error
+    """
+
+    result = svc_export(request.args.to_dict(), stream=True)
+    return columnar_response(result, MOVIE_DIRECTOR, fmt)
+
+
+@movie_director_blueprint.route("/movie_director/changes", methods=["GET"])
+@validate()
+def get_changes():
+    """
+    DELTA SYNC
+    Returns movie-director records changed since a sync token
+    ---
+    tags:
+      - Movie Director
+    summary: Get movie-director records changed since a sync token
+    description: >
+      A GET handler returning the movie-director records inserted or updated and the keys of
+      those deleted since the token of a previous call, with the token for
+      the next call. Without a token every record is returned.
+    parameters:
+      - in: query
+        name: since
+        type: string
+        required: false
+        description: Token returned by the previous call
+    responses:
+      200:
+        description: Upserted rows, deleted keys and the next token
+      400:
+        description: Invalid sync token
+      404:
+        description: Change log not enabled
+      410:
+        description: Sync token older than the retained changes, sync again without one
+      500:
+        description: Internal server error
+    """
+
+    result = svc_changes(request.args.get("since"))
+    return result_response(result)
@@ -2,21 +2,44 @@
 service file for movie_director
 """
 
-from constants.constants import SCHEMA_NAME, MOVIE_DIRECTOR
-from db.db_utils import do_query
-
-
-def svc_get():
+from constants.constants import (
+    COLUMNS,
+    SCHEMA_NAME,
+    DIRECTOR,
+    MOVIE,
+    MOVIE_DIRECTOR,
+    STATUS_BAD_REQUEST,
+)
+from db.db_utils import (
+    bulk_link_query,
+    copy_query,
+    do_query,
+    filter_clause,
+    replace_links_query,
+    stream_query,
+)
+from db.change_log import changes_query
+from cache.cache import cached, invalidate
+from cache.snapshot import from_snapshot
+
+
+@cached(MOVIE_DIRECTOR)
+def svc_get(stream=False):
     """
     Get service
     """
 
     sql = f"SELECT * FROM {SCHEMA_NAME}.{MOVIE_DIRECTOR};"
 
+    if stream:
+        return stream_query(sql, {})
+
     result = do_query(sql, {})
     return result
 
 
+@from_snapshot(MOVIE_DIRECTOR)
+@cached(MOVIE_DIRECTOR)
 def svc_get_by_id(ids_):
     """
     GET by ID service
@@ -45,6 +68,19 @@ def svc_post(payload):
     params = [movie_id, director_id]
 
     result = do_query(sql, params)
+    invalidate(MOVIE_DIRECTOR, keys=[movie_id])
+    return result
+
+
+def svc_bulk_post(pairs):
+    """
+    Bulk POST service, links many (movie_id, director_id) pairs at once
+    """
+
+    result = bulk_link_query(
+        MOVIE_DIRECTOR, ("movie_id", "director_id"), (MOVIE, DIRECTOR), pairs
+    )
+    invalidate(MOVIE_DIRECTOR, keys=sorted({pair[0] for pair in pairs}))
     return result
 
 
@@ -60,20 +96,51 @@ def svc_put(ids_, payload):
     movie_id = payload["movie_id"]
     director_id = payload["director_id"]
 
-    # deletes the record
-    delete_stat_sql = f"""DELETE FROM {SCHEMA_NAME}.{MOVIE_DIRECTOR} 
-                        WHERE movie_id = %(movie_id)s AND director_id = %(director_id)s;"""
-    delete_sql_params = {"movie_id": ids[0], "director_id": ids[1]}
+    # moves the link in one statement: the old pair is deleted and the new
+    # one inserted unless it exists already, in which case it is returned
+    # as it is instead of being rewritten
+    sql = f"""
+        WITH removed AS (
+            DELETE FROM {SCHEMA_NAME}.{MOVIE_DIRECTOR}
+            WHERE movie_id = %(old_movie_id)s AND director_id = %(old_director_id)s
+                AND (movie_id, director_id) <> (%(movie_id)s, %(director_id)s)
+        ),
+        inserted AS (
+            INSERT INTO {SCHEMA_NAME}.{MOVIE_DIRECTOR}(movie_id, director_id)
+            VALUES (%(movie_id)s, %(director_id)s)
+            ON CONFLICT DO NOTHING
+            RETURNING *
+        )
+        SELECT * FROM inserted
+        UNION ALL
+        SELECT * FROM {SCHEMA_NAME}.{MOVIE_DIRECTOR}
+        WHERE movie_id = %(movie_id)s AND director_id = %(director_id)s
+            AND NOT EXISTS (SELECT 1 FROM inserted);"""
+    params = {
+        "old_movie_id": ids[0],
+        "old_director_id": ids[1],
+        "movie_id": movie_id,
+        "director_id": director_id,
+    }
+
+    result = do_query(sql, params)
+    invalidate(MOVIE_DIRECTOR, keys=[ids[0], movie_id])
+    return result
 
-    insert_stat_sql = f"""INSERT INTO {SCHEMA_NAME}.{MOVIE_DIRECTOR}(movie_id, director_id)
-                        VALUES(%s, %s) RETURNING *;"""
-    insert_sql_params = [movie_id, director_id]
 
-    # executes the query to delete the record from the table
-    do_query(delete_stat_sql, delete_sql_params)
+def svc_replace(movie_id, director_ids):
+    """
+    Replace service, makes director_ids the full set of links of a movie
+    """
 
-    # inserts the new record to the table
-    result = do_query(insert_stat_sql, insert_sql_params)
+    result = replace_links_query(
+        MOVIE_DIRECTOR,
+        ("movie_id", "director_id"),
+        (MOVIE, DIRECTOR),
+        movie_id,
+        director_ids,
+    )
+    invalidate(MOVIE_DIRECTOR, keys=[movie_id])
     return result
 
 
@@ -92,6 +159,7 @@ def svc_delete(ids_):
     params = [movie_id, director_id]
 
     result = do_query(sql, params)
+    invalidate(MOVIE_DIRECTOR, keys=[movie_id])
     return result
 
 
@@ -107,10 +175,12 @@ def svc_delete_movie(movie_id):
     params = [movie_id]
 
     result = do_query(sql, params)
+    invalidate(MOVIE_DIRECTOR, keys=[movie_id])
     return result
 
 
-def svc_exact_search(payload):
+@cached(MOVIE_DIRECTOR)
+def svc_exact_search(payload, stream=False):
     """
     EXACT search service
     """
@@ -127,5 +197,37 @@ def svc_exact_search(payload):
               WHERE {search_condition};"""
     params = {"field": field, "value": value}
 
+    if stream:
+        return stream_query(sql, params)
+
     result = do_query(sql, params)
     return result
+
+
+def svc_export(filters, stream=False):
+    """
+    Export service, CSV from COPY or a row iterator when streaming
+    """
+
+    try:
+        where_clause, params = filter_clause(MOVIE_DIRECTOR, filters)
+    except ValueError as err:
+        return {"status": STATUS_BAD_REQUEST, "error": err}
+
+    columns = ", ".join(COLUMNS[MOVIE_DIRECTOR])
+    sql = f"SELECT {columns} FROM {SCHEMA_NAME}.{MOVIE_DIRECTOR}{where_clause};"
+
+    if stream:
+        return stream_query(sql, params)
+
+    result = copy_query(sql, params)
+    return result
+
+
+def svc_changes(since):
+    """
+    Delta sync service, rows changed and keys deleted since a sync token
+    """
+
+    result = changes_query(MOVIE_DIRECTOR, since)
+    return result
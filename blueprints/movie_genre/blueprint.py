@@ -2,22 +2,35 @@
 blueprint for movie_genre
 """
 
-
 import os
 from datetime import date, datetime
 from typing import Optional
 from flask import Blueprint, request
-from pydantic import BaseModel
+from pydantic import BaseModel, model_validator
 from flask_pydantic import validate
 from blueprints.movie_genre.service import (
+    svc_bulk_post,
+    svc_changes,
     svc_delete,
     svc_delete_movie,
     svc_exact_search,
+    svc_export,
     svc_get,
     svc_get_by_id,
     svc_post,
     svc_put,
+    svc_replace,
+)
+from constants.constants import MOVIE_GENRE
+from api.columnar import ARROW, PARQUET, columnar_response
+from api.idempotency import idempotent
+from api.negotiation import (
+    csv_response,
+    ndjson_response,
+    result_response,
+    wants_ndjson,
 )
+from api.trusted import respond
 
 
 class MovieGenreDataModel(BaseModel):
@@ -72,6 +85,44 @@ class PostModel(BaseModel):
     status: int
 
 
+class PairModel(BaseModel):
+    """
+    Movie and genre ID pair model
+    """
+
+    movie_id: int
+    genre_id: int
+
+
+class BulkModel(BaseModel):
+    """
+    Bulk link model, a movie with genre IDs and/or a list of pairs
+    """
+
+    movie_id: Optional[int] = None
+    genre_ids: list[int] = []
+    pairs: list[PairModel] = []
+
+    @model_validator(mode="after")
+    def check_items(self):
+        """
+        requires movie_id with genre_ids and at least one item
+        """
+        if self.genre_ids and self.movie_id is None:
+            raise ValueError("movie_id is required with genre_ids")
+        if not self.genre_ids and not self.pairs:
+            raise ValueError("no genre_ids or pairs given")
+        return self
+
+
+class ReplaceModel(BaseModel):
+    """
+    Replace model, the complete list of genre IDs of a movie
+    """
+
+    genre_ids: list[int]
+
+
 version = os.getenv("VERSION")
 movie_genre_blueprint = Blueprint("movie_genre", __name__, url_prefix=version)
 
@@ -118,8 +169,11 @@ def get_all_records():
         description: Internal server error
     """
 
+    if wants_ndjson():
+        return ndjson_response(svc_get(stream=True))
+
     result = svc_get()
-    return ResponseModel(status=result["status"], data=result["data"])
+    return respond(ResponseModel, result)
 
 
 @movie_genre_blueprint.route("/movie_genre/<movie_id>/<genre_id>", methods=["GET"])
@@ -177,10 +231,11 @@ def get_by_id(movie_id: int, genre_id: int):
     pkeys = f"{pkeys}, {genre_id}"
 
     result = svc_get_by_id(pkeys)
-    return ResponseModel(status=result["status"], data=result["data"])
+    return respond(ResponseModel, result)
 
 
 @movie_genre_blueprint.route("/movie_genre/create", methods=["POST"])
+@idempotent()
 @validate(body=MovieGenreDataModel)
 def post_record():
     """
@@ -239,6 +294,64 @@ def post_record():
     return PostModel(status=status)
 
 
+@movie_genre_blueprint.route("/movie_genre/bulk", methods=["POST"])
+@idempotent()
+@validate(body=BulkModel)
+def post_bulk():
+    """
+    POST many records at once
+
+    ---
+    tags:
+      - Movie Genre
+    summary: Create many movie-genre relationships
+    description: >
+      A POST handler that links a movie to a list of genres, or inserts a
+      list of movie and genre pairs, with a single statement. Unknown IDs,
+      duplicates and existing links are skipped and reported per item.
+    parameters:
+      - in: body
+        name: body
+        schema:
+          type: object
+          properties:
+            movie_id:
+              type: integer
+              description: ID of the movie linked to genre_ids
+            genre_ids:
+              type: array
+              items:
+                type: integer
+              description: IDs of the genres to link to movie_id
+            pairs:
+              type: array
+              items:
+                type: object
+                properties:
+                  movie_id:
+                    type: integer
+                  genre_id:
+                    type: integer
+              description: Movie and genre ID pairs to link
+    responses:
+      200:
+        description: Number of records inserted and one item per pair with its error, if any
+      400:
+        description: Invalid input
+      500:
+        description: Internal server error
+    """
+
+    payload = request.get_json()
+    pairs = [
+        (payload["movie_id"], genre_id) for genre_id in payload.get("genre_ids", [])
+    ]
+    pairs += [(pair["movie_id"], pair["genre_id"]) for pair in payload.get("pairs", [])]
+
+    result = svc_bulk_post(pairs)
+    return result_response(result)
+
+
 @movie_genre_blueprint.route("/movie_genre/<movie_id>/<genre_id>", methods=["PUT"])
 @validate(body=MovieGenreDataModel)
 def put_record(movie_id: int, genre_id: int):
@@ -407,6 +520,52 @@ def delete_movie(movie_id: int):
     return ResponseModel(status=result["status"], data=result["data"])
 
 
+@movie_genre_blueprint.route("/movie_genre/movie/<movie_id>", methods=["PUT"])
+@validate(body=ReplaceModel)
+def replace_movie(movie_id: int):
+    """
+    A PUT handler. Replaces the full set of genres of a movie
+
+    ---
+    tags:
+      - Movie Genre
+    summary: Replace all genres of a movie
+    description: >
+      A PUT handler that makes genre_ids the complete list of genres linked
+      to the movie. Only the difference is applied, in one transaction:
+      links missing from the list are deleted and new ones inserted.
+    parameters:
+      - in: path
+        name: movie_id
+        type: integer
+        required: true
+        description: ID of the movie
+      - in: body
+        name: body
+        schema:
+          type: object
+          required:
+            - genre_ids
+          properties:
+            genre_ids:
+              type: array
+              items:
+                type: integer
+              description: IDs of every genre of the movie
+    responses:
+      200:
+        description: IDs of the genres added and removed
+      400:
+        description: Unknown movie or genre IDs, nothing was changed
+      500:
+        description: Internal server error
+    """
+
+    payload = request.get_json()
+    result = svc_replace(movie_id, payload["genre_ids"])
+    return result_response(result)
+
+
 @movie_genre_blueprint.route("/movie_genre/exact", methods=["POST"])
 @validate(body=SearchModel)
 def search_exact():
@@ -480,5 +639,111 @@ def search_exact():
     # request object
     payload = request.get_json()
 
+    if wants_ndjson():
+        return ndjson_response(svc_exact_search(payload, stream=True))
+
     result = svc_exact_search(payload)
-    return ResponseModel(status=result["status"], data=result["data"])
+    return respond(ResponseModel, result)
+
+
+@movie_genre_blueprint.route("/movie_genre/export.csv", methods=["GET"])
+@validate()
+def export_csv():
+    """
+    CSV EXPORT
+    Streams movie-genre records as CSV straight from COPY ... TO STDOUT
+    ---
+    tags:
+      - Movie Genre
+    summary: Export movie-genre records as CSV
+    description: >
+      A GET handler that streams movie-genre records as a CSV file with a header row.
+      Any column can be passed as a query parameter to filter on an exact
+      value, e.g. ?genre_id=3
+    produces:
+      - text/csv
+    responses:
+      200:
+        description: CSV file of the matching movie-genre records
+      400:
+        description: Unknown filter column
+      500:
+        description: Internal server error
+    """
+
+    result = svc_export(request.args.to_dict())
+    return csv_response(result, "movie_genre")
+
+
+@movie_genre_blueprint.route(
+    "/movie_genre/export.arrow", methods=["GET"], defaults={"fmt": ARROW}
+)
+@movie_genre_blueprint.route(
+    "/movie_genre/export.parquet", methods=["GET"], defaults={"fmt": PARQUET}
+)
+@validate()
+def export_columnar(fmt: str):
+    """
+    COLUMNAR EXPORT
+    Streams movie-genre records as an Arrow IPC stream or a Parquet file
+    ---
+    tags:
+      - Movie Genre
+    summary: Export movie-genre records in a columnar format
+    description: >
+      A GET handler that reads movie-genre records in batches from a server-side cursor
+      and streams them as typed columns. Query parameters filter on exact
+      column values like the CSV export.
+    produces:
+      - application/vnd.apache.arrow.stream
+      - application/vnd.apache.parquet
+    responses:
+      200:
+        description: Arrow IPC stream or Parquet file of the matching movie-genre records
+      400:
+        description: Unknown filter column
+      501:
+        description: pyarrow is not installed
+      500:
+        description: Internal server error
+    """
+
+    result = svc_export(request.args.to_dict(), stream=True)
+    return columnar_response(result, MOVIE_GENRE, fmt)
+
+
+@movie_genre_blueprint.route("/movie_genre/changes", methods=["GET"])
+@validate()
+def get_changes():
+    """
+    DELTA SYNC
+    Returns movie-genre records changed since a sync token
+    ---
+    tags:
+      - Movie Genre
+    summary: Get movie-genre records changed since a sync token
+    description: >
+      A GET handler returning the movie-genre records inserted or updated and the keys of
+      those deleted since the token of a previous call, with the token for
+      the next call. Without a token every record is returned.
+    parameters:
+      - in: query
+        name: since
+        type: string
+        required: false
+        description: Token returned by the previous call
+    responses:
+      200:
+        description: Upserted rows, deleted keys and the next token
+      400:
+        description: Invalid sync token
+      404:
+        description: Change log not enabled
+      410:
+        description: Sync token older than the retained changes, sync again without one
+      500:
+        description: Internal server error
+    """
+
+    result = svc_changes(request.args.get("since"))
+    return result_response(result)
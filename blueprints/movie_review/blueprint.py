@@ -3,23 +3,44 @@ blueprint for movie_genre
 """
 
 
+import math
 import os
 
 from datetime import date, datetime
 from typing import Optional
-from flask import Blueprint, request
+from flask import Blueprint, jsonify, request
 from pydantic import BaseModel
 from flask_pydantic import validate
 from blueprints.movie_review.service import (
+    svc_ack,
+    svc_changes,
     svc_delete,
     svc_delete_movie,
     svc_exact_search,
+    svc_export,
     svc_get,
     svc_get_by_id,
     svc_in_search,
     svc_post,
+    svc_post_buffered,
     svc_put,
 )
+from constants.constants import (
+    MOVIE_REVIEW,
+    REVIEW_WRITE_BEHIND,
+    STATUS_ACCEPTED,
+    WRITE_BEHIND_INTERVAL,
+)
+from api.columnar import ARROW, PARQUET, columnar_response
+from api.idempotency import idempotent
+from api.negotiation import (
+    csv_response,
+    error_response,
+    ndjson_response,
+    result_response,
+    wants_ndjson,
+)
+from api.trusted import respond
 
 
 class MovieReviewItems(BaseModel):
@@ -149,8 +170,11 @@ def get_all_records():
         description: Internal server error
     """
 
+    if wants_ndjson():
+        return ndjson_response(svc_get(stream=True))
+
     result = svc_get()
-    return ResponseModel(status=result["status"], data=result["data"])
+    return respond(ResponseModel, result)
 
 
 @movie_review_blueprint.route("/movie_review/<movie_id>/<review_id>", methods=["GET"])
@@ -215,10 +239,11 @@ def get_by_id(movie_id: int, review_id: int):
     pkeys = f"{pkeys}, {review_id}"
 
     result = svc_get_by_id(pkeys)
-    return ResponseModel(status=result["status"], data=result["data"])
+    return respond(ResponseModel, result)
 
 
 @movie_review_blueprint.route("/movie_review/create", methods=["POST"])
+@idempotent()
 @validate(body=MovieReviewItems)
 def post_record():
     """
@@ -227,7 +252,10 @@ def post_record():
     tags:
       - Movie Review
     summary: Create a new movie review
-    description: A POST handler that creates a new movie review record.
+    description: >
+      A POST handler that creates a new movie review record. With
+      REVIEW_WRITE_BEHIND set the review is queued for a batched insert and
+      an ack token is returned, see /movie_review/ack/{token}.
     parameters:
       - in: body
         name: body
@@ -260,13 +288,25 @@ def post_record():
                 status:
                   type: integer
                   description: HTTP status code
+      202:
+        description: Review queued, data.ack is the token confirming the insert
       400:
         description: Invalid input
+      429:
+        description: Review buffer is full, retry after Retry-After seconds
       500:
         description: Internal server error
     """
 
     payload = request.get_json()
+
+    if REVIEW_WRITE_BEHIND:
+        result = svc_post_buffered(payload)
+        if result["status"] != STATUS_ACCEPTED:
+            body, status = error_response(result)
+            return body, status, {"Retry-After": math.ceil(WRITE_BEHIND_INTERVAL)}
+        return jsonify(status=STATUS_ACCEPTED, data=result["data"]), STATUS_ACCEPTED
+
     result = svc_post(payload)
 
     if result["status"] == 200:
@@ -277,6 +317,39 @@ def post_record():
     return PostModel(status=status)
 
 
+@movie_review_blueprint.route("/movie_review/ack/<token>", methods=["GET"])
+def get_ack(token):
+    """
+    GET the state of a buffered review
+    ---
+    tags:
+      - Movie Review
+    summary: Confirm a buffered review was persisted
+    description: >
+      Returns pending, failed with the error, or persisted with the review
+      ID, for an ack token returned by /movie_review/create.
+    parameters:
+      - in: path
+        name: token
+        type: string
+        format: uuid
+        required: true
+        description: Ack token of the review
+    responses:
+      200:
+        description: State of the review
+      400:
+        description: Invalid token
+      404:
+        description: Unknown or expired token
+      500:
+        description: Internal server error
+    """
+
+    result = svc_ack(token)
+    return result_response(result)
+
+
 @movie_review_blueprint.route("/movie_review/<review_id>", methods=["PUT"])
 @validate(body=MovieReviewItems)
 def put_record(review_id: int):
@@ -525,9 +598,12 @@ def search_by_in():
     """
 
     payload = request.get_json()
+    if wants_ndjson():
+        return ndjson_response(svc_in_search(payload, stream=True))
+
     result = svc_in_search(payload)
 
-    return ResponseModel(status=result["status"], data=result["data"])
+    return respond(ResponseModel, result)
 
 
 @movie_review_blueprint.route("/movie_review/exact", methods=["POST"])
@@ -607,5 +683,111 @@ def search_exact():
     # request object
     payload = request.get_json()
 
+    if wants_ndjson():
+        return ndjson_response(svc_exact_search(payload, stream=True))
+
     result = svc_exact_search(payload)
-    return ResponseModel(status=result["status"], data=result["data"])
+    return respond(ResponseModel, result)
+
+
+@movie_review_blueprint.route("/movie_review/export.csv", methods=["GET"])
+@validate()
+def export_csv():
+    """
+    CSV EXPORT
+    Streams movie reviews as CSV straight from COPY ... TO STDOUT
+    ---
+    tags:
+      - Movie Review
+    summary: Export movie reviews as CSV
+    description: >
+      A GET handler that streams movie reviews as a CSV file with a header row.
+      Any column can be passed as a query parameter to filter on an exact
+      value, e.g. ?movie_id=1
+    produces:
+      - text/csv
+    responses:
+      200:
+        description: CSV file of the matching movie reviews
+      400:
+        description: Unknown filter column
+      500:
+        description: Internal server error
+    """
+
+    result = svc_export(request.args.to_dict())
+    return csv_response(result, "movie_review")
+
+
+@movie_review_blueprint.route(
+    "/movie_review/export.arrow", methods=["GET"], defaults={"fmt": ARROW}
+)
+@movie_review_blueprint.route(
+    "/movie_review/export.parquet", methods=["GET"], defaults={"fmt": PARQUET}
+)
+@validate()
+def export_columnar(fmt: str):
+    """
+    COLUMNAR EXPORT
+    Streams movie reviews as an Arrow IPC stream or a Parquet file
+    ---
+    tags:
+      - Movie Review
+    summary: Export movie reviews in a columnar format
+    description: >
+      A GET handler that reads movie reviews in batches from a server-side cursor
+      and streams them as typed columns. Query parameters filter on exact
+      column values like the CSV export.
+    produces:
+      - application/vnd.apache.arrow.stream
+      - application/vnd.apache.parquet
+    responses:
+      200:
+        description: Arrow IPC stream or Parquet file of the matching movie reviews
+      400:
+        description: Unknown filter column
+      501:
+        description: pyarrow is not installed
+      500:
+        description: Internal server error
+    """
+
+    result = svc_export(request.args.to_dict(), stream=True)
+    return columnar_response(result, MOVIE_REVIEW, fmt)
+
+
+@movie_review_blueprint.route("/movie_review/changes", methods=["GET"])
+@validate()
+def get_changes():
+    """
+    DELTA SYNC
+    Returns movie reviews changed since a sync token
+    ---
+    tags:
+      - Movie Review
+    summary: Get movie reviews changed since a sync token
+    description: >
+      A GET handler returning the movie reviews inserted or updated and the keys of
+      those deleted since the token of a previous call, with the token for
+      the next call. Without a token every record is returned.
+    parameters:
+      - in: query
+        name: since
+        type: string
+        required: false
+        description: Token returned by the previous call
+    responses:
+      200:
+        description: Upserted rows, deleted keys and the next token
+      400:
+        description: Invalid sync token
+      404:
+        description: Change log not enabled
+      410:
+        description: Sync token older than the retained changes, sync again without one
+      500:
+        description: Internal server error
+    """
+
+    result = svc_changes(request.args.get("since"))
+    return result_response(result)
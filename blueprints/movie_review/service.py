@@ -3,21 +3,40 @@ Service file for movie_review
 """
 
 
-from constants.constants import SCHEMA_NAME, MOVIE_REVIEW
-from db.db_utils import do_query
-
-
-def svc_get():
+import uuid
+
+from constants.constants import (
+    COLUMNS,
+    SCHEMA_NAME,
+    MOVIE,
+    MOVIE_REVIEW,
+    STATUS_ACCEPTED,
+    STATUS_BAD_REQUEST,
+    STATUS_OK,
+    STATUS_TOO_MANY_REQUESTS,
+)
+from db.db_utils import copy_query, do_query, filter_clause, stream_query
+from db.change_log import changes_query
+from db.write_behind import WRITE_ACK, FlushFailed, WriteBehind
+from cache.cache import cached, invalidate
+
+
+@cached(MOVIE_REVIEW)
+def svc_get(stream=False):
     """
     Get service
     """
 
     sql = f"SELECT * FROM {SCHEMA_NAME}.{MOVIE_REVIEW};"
 
+    if stream:
+        return stream_query(sql, {})
+
     result = do_query(sql, {})
     return result
 
 
+@cached(MOVIE_REVIEW)
 def svc_get_by_id(ids_):
     """
     GET by ID service
@@ -44,6 +63,98 @@ def svc_post(payload):
     params = [movie_id, review]
 
     result = do_query(sql, params)
+    invalidate(MOVIE_REVIEW)
+    return result
+
+
+def insert_reviews(batch):
+    """
+    inserts buffered reviews and their ack tokens in one statement, skipping
+    reviews of unknown movies; returns the tokens inserted
+
+    parameter batch = [(token, payload), ...]
+    """
+
+    # review IDs are drawn up front so each ack gets the ID of its own row
+    sql = f"""
+        WITH input AS (
+            SELECT i.token, i.movie_id, i.review, nextval(
+                pg_get_serial_sequence('{SCHEMA_NAME}.{MOVIE_REVIEW}', 'review_id')
+            ) AS review_id
+            FROM unnest(%(tokens)s::uuid[], %(movie_ids)s::bigint[], %(reviews)s)
+                AS i(token, movie_id, review)
+            JOIN {SCHEMA_NAME}.{MOVIE} m ON m.movie_id = i.movie_id
+        ),
+        inserted AS (
+            INSERT INTO {SCHEMA_NAME}.{MOVIE_REVIEW} (review_id, movie_id, review)
+            SELECT review_id, movie_id, review FROM input
+        )
+        INSERT INTO {SCHEMA_NAME}.{WRITE_ACK} (token, entity, row_key)
+        SELECT token, %(entity)s, review_id FROM input
+        RETURNING token;"""
+    params = {
+        "tokens": [token for token, _ in batch],
+        "movie_ids": [payload["movie_id"] for _, payload in batch],
+        "reviews": [payload["review"] for _, payload in batch],
+        "entity": MOVIE_REVIEW,
+    }
+
+    return do_query(sql, params)
+
+
+def flush_reviews(batch):
+    """
+    writes a batch of buffered reviews, returns {token: error} for the
+    reviews of unknown movies
+
+    Those are left out by the insert itself, so a failing statement means
+    the database couldn't take the batch: FlushFailed has it retried whole.
+    """
+
+    result = insert_reviews(batch)
+    if result["status"] != STATUS_OK:
+        raise FlushFailed(str(result["error"]))
+    if result["data"]:
+        invalidate(MOVIE_REVIEW)
+
+    inserted = {str(row["token"]) for row in result["data"]}
+    return {
+        token: f"Unknown movie {payload['movie_id']}"
+        for token, payload in batch
+        if token not in inserted
+    }
+
+
+review_buffer = WriteBehind(MOVIE_REVIEW, flush_reviews)
+
+
+def svc_post_buffered(payload):
+    """
+    POST service queueing the review for a batched insert
+    """
+
+    token = review_buffer.submit(
+        {"movie_id": payload["movie_id"], "review": payload["review"]}
+    )
+    if token is None:
+        return {
+            "status": STATUS_TOO_MANY_REQUESTS,
+            "error": "Review buffer is full, retry later",
+        }
+    return {"status": STATUS_ACCEPTED, "data": {"ack": token}}
+
+
+def svc_ack(token):
+    """
+    Ack service, whether a buffered review was persisted
+    """
+
+    try:
+        token = str(uuid.UUID(token))
+    except ValueError:
+        return {"status": STATUS_BAD_REQUEST, "error": f"Invalid ack token {token}"}
+
+    result = review_buffer.status(token)
     return result
 
 
@@ -68,6 +179,7 @@ def svc_put(id, payload):
     }
 
     result = do_query(sql, params)
+    invalidate(MOVIE_REVIEW)
     return result
 
 
@@ -86,6 +198,7 @@ def svc_delete(ids_):
     params = [movie_id, review_id]
 
     result = do_query(sql, params)
+    invalidate(MOVIE_REVIEW)
     return result
 
 
@@ -101,10 +214,12 @@ def svc_delete_movie(movie_id):
     params = [movie_id]
 
     result = do_query(sql, params)
+    invalidate(MOVIE_REVIEW)
     return result
 
 
-def svc_in_search(payload):
+@cached(MOVIE_REVIEW)
+def svc_in_search(payload, stream=False):
     """
     In Search service
     """
@@ -123,11 +238,15 @@ def svc_in_search(payload):
     sql = f"SELECT * FROM {SCHEMA_NAME}.{MOVIE_REVIEW} WHERE {field} IN ({in_clause});"
     params = {"field": field, "value": value}
 
+    if stream:
+        return stream_query(sql, params)
+
     result = do_query(sql, params)
     return result
 
 
-def svc_exact_search(payload):
+@cached(MOVIE_REVIEW)
+def svc_exact_search(payload, stream=False):
     """
     EXACT search service
     """
@@ -144,5 +263,37 @@ def svc_exact_search(payload):
               WHERE {search_condition};"""
     params = {"field": field, "value": value}
 
+    if stream:
+        return stream_query(sql, params)
+
     result = do_query(sql, params)
     return result
+
+
+def svc_export(filters, stream=False):
+    """
+    Export service, CSV from COPY or a row iterator when streaming
+    """
+
+    try:
+        where_clause, params = filter_clause(MOVIE_REVIEW, filters)
+    except ValueError as err:
+        return {"status": STATUS_BAD_REQUEST, "error": err}
+
+    columns = ", ".join(COLUMNS[MOVIE_REVIEW])
+    sql = f"SELECT {columns} FROM {SCHEMA_NAME}.{MOVIE_REVIEW}{where_clause};"
+
+    if stream:
+        return stream_query(sql, params)
+
+    result = copy_query(sql, params)
+    return result
+
+
+def svc_changes(since):
+    """
+    Delta sync service, rows changed and keys deleted since a sync token
+    """
+
+    result = changes_query(MOVIE_REVIEW, since)
+    return result
@@ -0,0 +1,188 @@
+"""
+Invalidations shared by the workers of a node
+
+Every gunicorn worker keeps its own caches, so a write handled by one worker
+has to reach the others. invalidate() publishes its entities, and the keys
+when they are known, to a small memory-mapped file:
+
+    header  magic, cursor (events ever written), horizon
+    ring    the last CACHE_SIGNAL_SLOTS events: entity, kind, key, write time
+
+Each worker remembers the cursor it has applied and, before serving a cached
+read, applies the events written since, which costs one 8 byte read when
+there are none. Writers and readers of new events flock the file. The horizon is
+the write time of the newest event pushed out of the ring: a worker that fell
+more than a ring behind, or just started, can't tell what it missed before
+the horizon and treats every entity as written at that time.
+
+Workers on other nodes don't share the file; their caches rely on the TTLs.
+Without fcntl, or with CACHE_SIGNAL_PATH set to an empty string,
+invalidations stay local to the worker.
+"""
+
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+
+import emoji
+
+from constants.constants import CACHE_SIGNAL_PATH, CACHE_SIGNAL_SLOTS, COLUMNS
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+MAGIC = b"MVSIG001"
+HEADER = struct.Struct("<8sQQ")
+EVENT = struct.Struct("<IIqQ")
+
+# entity => index stored in the ring
+ENTITIES = list(COLUMNS)
+INDEX = {entity: idx for idx, entity in enumerate(ENTITIES)}
+
+# event kinds: rows unknown, one row by key, only new rows
+WHOLE, KEY, NEW = 0, 1, 2
+
+
+def events(entities, keys, written_at):
+    """
+    returns the events of a write as [(entity, kind, key, written at)]
+
+    parameter keys = keys of the rows written, () if rows were only added,
+    None if unknown
+    """
+    if keys is not None:
+        try:
+            keys = [int(key) for key in keys]
+        except (TypeError, ValueError):
+            keys = None
+    if keys is None:
+        return [(entity, WHOLE, 0, written_at) for entity in entities]
+    if not keys:
+        return [(entity, NEW, 0, written_at) for entity in entities]
+    return [(entity, KEY, key, written_at) for entity in entities for key in keys]
+
+
+class Broadcast:
+    """
+    Ring of invalidation events in a file mapped by every worker
+    """
+
+    def __init__(self, path, slots=CACHE_SIGNAL_SLOTS):
+        """
+        constructor
+        """
+        self.path = path
+        self.slots = slots
+        self.lock = threading.Lock()
+        # the mapping of this process, a forked worker maps the file again
+        self.pid = None
+        self.fd = None
+        self.mmap = None
+        self.seen = 0
+
+    def _open(self):
+        """
+        maps the file in this process, creating it when missing, and starts
+        from the events still in the ring
+        """
+        size = HEADER.size + EVENT.size * self.slots
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(fd).st_size != size:
+                os.ftruncate(fd, size)
+            mapped = mmap.mmap(fd, size)
+            if mapped[: len(MAGIC)] != MAGIC:
+                # a new file, or one laid out for another ring size
+                mapped[:] = bytes(size)
+                HEADER.pack_into(mapped, 0, MAGIC, 0, 0)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        self.fd = fd
+        self.mmap = mapped
+        self.pid = os.getpid()
+        self.seen = 0
+
+    def _mapped(self):
+        """
+        returns the mapping of this process, None if it can't be used
+        """
+        if fcntl is None:
+            return None
+        if self.pid != os.getpid():
+            try:
+                self._open()
+            except (OSError, ValueError):
+                logging.error(emoji.emojize(f"Could not map {self.path} :cross_mark:"))
+                return None
+        return self.mmap
+
+    def publish(self, entities, keys=None):
+        """
+        appends the events of a write, see events(). Returns False if they
+        couldn't be written.
+        """
+        if any(entity not in INDEX for entity in entities):
+            return False
+        with self.lock:
+            mapped = self._mapped()
+            if mapped is None:
+                return False
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                _, cursor, horizon = HEADER.unpack_from(mapped, 0)
+                for entity, kind, key, written_at in events(
+                    entities, keys, time.time_ns()
+                ):
+                    offset = HEADER.size + EVENT.size * (cursor % self.slots)
+                    if cursor >= self.slots:
+                        horizon = max(horizon, EVENT.unpack_from(mapped, offset)[3])
+                    EVENT.pack_into(
+                        mapped, offset, INDEX[entity], kind, key, written_at
+                    )
+                    cursor += 1
+                # the events are in place before the cursor counts them
+                HEADER.pack_into(mapped, 0, MAGIC, cursor, horizon)
+            finally:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+        return True
+
+    def poll(self):
+        """
+        returns the events written since the last poll, see events()
+        """
+        with self.lock:
+            mapped = self._mapped()
+            if mapped is None:
+                return []
+            if HEADER.unpack_from(mapped, 0)[1] == self.seen:
+                return []
+
+            fcntl.flock(self.fd, fcntl.LOCK_SH)
+            try:
+                _, cursor, horizon = HEADER.unpack_from(mapped, 0)
+                start = max(self.seen, cursor - self.slots)
+                found = []
+                for position in range(start, cursor):
+                    offset = HEADER.size + EVENT.size * (position % self.slots)
+                    idx, kind, key, written_at = EVENT.unpack_from(mapped, offset)
+                    found.append((ENTITIES[idx], kind, key, written_at))
+            finally:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+            if start > self.seen:
+                # events were pushed out of the ring before they were read
+                found = events(ENTITIES, None, horizon) + found
+            self.seen = cursor
+            return found
+
+
+broadcast = None
+if CACHE_SIGNAL_PATH and fcntl is not None:
+    broadcast = Broadcast(CACHE_SIGNAL_PATH)
@@ -0,0 +1,422 @@
+"""
+Read cache with stale-while-revalidate refresh
+
+Each worker has its own caches. invalidate() reaches the other workers of
+the node through cache.broadcast, and every cached read first applies the
+invalidations published since the last one, so a write in one worker is
+seen by the next read in any other. Workers on other nodes keep serving
+their entries until CACHE_HARD_TTL.
+"""
+
+import json
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+import emoji
+from flask import current_app, has_app_context
+
+from cache.broadcast import broadcast, events
+from constants.constants import (
+    CACHE_HARD_TTL,
+    CACHE_MAX_ENTRIES,
+    CACHE_REFRESH_WORKERS,
+    CACHE_SOFT_TTL,
+    NEGATIVE_CACHE_MAX_ENTRIES,
+    NEGATIVE_CACHE_MAX_KEY_LENGTH,
+    NEGATIVE_CACHE_TTL,
+    STATUS_OK,
+)
+
+
+class CacheEntry:  # pylint: disable=too-few-public-methods
+    """
+    A cached value, the time it was stored and how often it was read
+    """
+
+    __slots__ = ("value", "stored_at", "hits")
+
+    def __init__(self, value, stored_at, hits=0):
+        """
+        constructor
+        """
+        self.value = value
+        self.stored_at = stored_at
+        self.hits = hits
+
+
+class Cache:  # pylint: disable=too-many-instance-attributes
+    """
+    Bounded LRU cache with a soft and a hard TTL
+
+    An entry younger than soft_ttl is fresh. An entry between soft_ttl and
+    hard_ttl is still returned, and a single background refresh is scheduled
+    for it. An entry older than hard_ttl is dropped and loaded synchronously.
+    """
+
+    def __init__(self, name, soft_ttl, hard_ttl, max_entries, refresh_workers=0):
+        """
+        constructor
+        """
+        self.name = name
+        self.soft_ttl = soft_ttl
+        self.hard_ttl = hard_ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # keys with a background refresh in flight
+        self.refreshing = set()
+        # bumped on every invalidation so in-flight loads don't store old data
+        self.generation = 0
+        self.counters = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "loads": 0,
+            "load_time": 0.0,
+        }
+        self.executor = None
+        if refresh_workers > 0:
+            self.executor = ThreadPoolExecutor(
+                max_workers=refresh_workers, thread_name_prefix=f"{name}-refresh"
+            )
+
+    def get(self, key):
+        """
+        returns the cached value or None, without scheduling a refresh
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+            if time.monotonic() - entry.stored_at >= self.hard_ttl:
+                del self.entries[key]
+                self.counters["expirations"] += 1
+                self.counters["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            entry.hits += 1
+            self.counters["hits"] += 1
+            return entry.value
+
+    def set(self, key, value, generation=None):
+        """
+        stores a value, evicting the least recently used entry when full
+        """
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            # a refreshed entry keeps its hit count
+            previous = self.entries.get(key)
+            hits = previous.hits if previous is not None else 0
+            self.entries[key] = CacheEntry(value, time.monotonic(), hits)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def get_or_load(self, key, loader, cacheable=lambda value: True):
+        """
+        returns the cached value for key, calling loader on a miss
+
+        parameter loader = zero argument callable producing the value
+        parameter cacheable = predicate deciding whether a loaded value is stored
+        """
+        if self.hard_ttl <= 0:
+            return loader()
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                age = time.monotonic() - entry.stored_at
+                if age < self.hard_ttl:
+                    self.entries.move_to_end(key)
+                    entry.hits += 1
+                    self.counters["hits"] += 1
+                    if age >= self.soft_ttl:
+                        self.counters["stale_hits"] += 1
+                        self._schedule_refresh(key, loader, cacheable)
+                    return entry.value
+                del self.entries[key]
+                self.counters["expirations"] += 1
+            self.counters["misses"] += 1
+            generation = self.generation
+
+        value = self._load(loader)
+        if cacheable(value):
+            self.set(key, value, generation)
+        return value
+
+    def top_keys(self, limit):
+        """
+        returns up to limit keys ordered by hits, most read first
+        """
+        with self.lock:
+            ranked = sorted(
+                self.entries.items(), key=lambda item: item[1].hits, reverse=True
+            )
+        return [(key, entry.hits) for key, entry in ranked[:limit]]
+
+    def invalidate(self, prefix):
+        """
+        drops every entry whose key starts with prefix, returns the count
+        """
+        with self.lock:
+            self.generation += 1
+            keys = [key for key in self.entries if key.startswith(prefix)]
+            for key in keys:
+                del self.entries[key]
+        return len(keys)
+
+    def clear(self):
+        """
+        drops every entry
+        """
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+
+    def stats(self, top=10):
+        """
+        returns entry count, estimated bytes, counters and the top keys
+        """
+        with self.lock:
+            items = list(self.entries.items())
+            counters = dict(self.counters)
+        loads = counters.pop("loads")
+        load_time = counters.pop("load_time")
+        return {
+            "entries": len(items),
+            "max_entries": self.max_entries,
+            "bytes": sum(_sizeof(key) + _sizeof(entry.value) for key, entry in items),
+            "soft_ttl": self.soft_ttl,
+            "hard_ttl": self.hard_ttl,
+            **counters,
+            "loads": loads,
+            "avg_load_ms": round(1000 * load_time / loads, 3) if loads else 0.0,
+            "top_keys": [
+                {"key": key, "hits": hits} for key, hits in self.top_keys(top)
+            ],
+        }
+
+    def _load(self, loader):
+        """
+        calls loader and records how long it took
+        """
+        started = time.perf_counter()
+        try:
+            return loader()
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                self.counters["loads"] += 1
+                self.counters["load_time"] += elapsed
+
+    def _schedule_refresh(self, key, loader, cacheable):
+        """
+        submits a background refresh for key, called with the lock held
+        """
+        if self.executor is None or key in self.refreshing:
+            return
+        self.refreshing.add(key)
+        app = None
+        if has_app_context():
+            # pylint: disable=protected-access
+            app = current_app._get_current_object()
+        self.executor.submit(
+            self._refresh, key, loader, cacheable, app, self.generation
+        )
+
+    def _refresh(self, key, loader, cacheable, app, generation):
+        """
+        reloads key on a refresh worker; loader checks out its own connection
+        """
+        try:
+            if app is not None:
+                with app.app_context():
+                    value = self._load(loader)
+            else:
+                value = self._load(loader)
+            if cacheable(value):
+                self.set(key, value, generation)
+        except Exception:  # pylint: disable=broad-exception-caught
+            logging.exception(
+                emoji.emojize(f"Cache refresh failed for {key} :cross_mark:")
+            )
+        finally:
+            with self.lock:
+                self.refreshing.discard(key)
+
+
+def _sizeof(value):
+    """
+    estimates the memory used by value and everything it contains
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_sizeof(key) + _sizeof(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(_sizeof(item) for item in value)
+    return size
+
+
+# all caches by name
+caches = {}
+
+# callables notified with the events of every invalidation
+listeners = []
+
+# cached services by 'entity:name', used to replay recorded keys
+loaders = {}
+
+
+def register(cache):
+    """
+    registers a cache so it can be invalidated by entity
+    """
+    caches[cache.name] = cache
+    return cache
+
+
+read_cache = register(
+    Cache(
+        "read",
+        CACHE_SOFT_TTL,
+        CACHE_HARD_TTL,
+        CACHE_MAX_ENTRIES,
+        CACHE_REFRESH_WORKERS,
+    )
+)
+
+# remembers lookups that found nothing; values are only a marker so the
+# size is bounded by the entry count and the key length limit
+negative_cache = register(
+    Cache(
+        "negative",
+        NEGATIVE_CACHE_TTL,
+        NEGATIVE_CACHE_TTL,
+        NEGATIVE_CACHE_MAX_ENTRIES,
+    )
+)
+
+
+def make_key(entity, name, args):
+    """
+    builds a cache key such as 'movie:svc_like_search:[{...}]'
+    """
+    return f"{entity}:{name}:{json.dumps(args, sort_keys=True, default=str)}"
+
+
+def is_ok(result):
+    """
+    only successful query results are cached
+    """
+    return result.get("status") == STATUS_OK
+
+
+def is_found(result):
+    """
+    successful results with at least one row
+    """
+    return is_ok(result) and bool(result.get("data"))
+
+
+def is_empty(result):
+    """
+    successful results without rows
+    """
+    return is_ok(result) and not result.get("data")
+
+
+def not_found(key):
+    """
+    returns an empty result if key is negatively cached, otherwise None
+    """
+    if negative_cache.get(key) is None:
+        return None
+    return {"status": STATUS_OK, "data": []}
+
+
+def load_negative(key, loader):
+    """
+    runs loader and negatively caches an empty result
+    """
+    generation = negative_cache.generation
+    result = loader()
+    if is_empty(result) and len(key) <= NEGATIVE_CACHE_MAX_KEY_LENGTH:
+        negative_cache.set(key, True, generation)
+    return result
+
+
+def cached(entity):
+    """
+    Decorator caching a read service with stale-while-revalidate
+
+    Empty results go to the short lived negative cache instead. Calls with
+    keyword options, such as stream=True, bypass the cache.
+    """
+
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if kwargs:
+                return func(*args, **kwargs)
+            sync()
+            key = make_key(entity, func.__name__, list(args))
+            result = not_found(key)
+            if result is not None:
+                return result
+            return load_negative(
+                key,
+                lambda: read_cache.get_or_load(key, lambda: func(*args), is_found),
+            )
+
+        loaders[f"{entity}:{func.__name__}"] = wrapper
+        return wrapper
+
+    return decorate
+
+
+def apply(written):
+    """
+    drops the cached reads of the entities in the events written, see
+    cache.broadcast.events(), from the caches of this worker
+    """
+    entities = list(dict.fromkeys(event[0] for event in written))
+    for cache in caches.values():
+        for entity in entities:
+            cache.invalidate(f"{entity}:")
+    for listener in listeners:
+        listener(written)
+
+
+def sync():
+    """
+    applies the invalidations other workers published since the last call
+    """
+    if broadcast is None:
+        return
+    found = broadcast.poll()
+    if found:
+        apply(found)
+
+
+def invalidate(*entities, keys=None):
+    """
+    drops the cached reads of the given entities from every cache of every
+    worker on the node
+
+    parameter keys = keys of the rows written, () if rows were only added,
+    None if unknown; the snapshot keeps serving the other rows
+    """
+    if broadcast is not None and broadcast.publish(entities, keys):
+        sync()
+    else:
+        apply(events(entities, keys, time.time_ns()))
@@ -0,0 +1,379 @@
+"""
+Memory-mapped snapshot of the reference tables
+
+Every worker on a node maps the same read-only file, so lookups by ID are
+served from shared pages instead of per-process copies or the database.
+
+File layout (little endian):
+    header      magic, build time in ns, table count
+    directory   per table: name, row count and section offsets
+    keys        sorted int64 keys, one per row
+    offsets     uint64 row offsets into the data section, row count + 1
+    data        compact JSON rows
+
+A snapshot is only as fresh as its build. Writes made through the API mark
+the keys they touched dirty in every worker of the node (see
+cache.broadcast), and those keys are read from the database until a newer
+snapshot is published. Writes made outside the API aren't seen, so a
+snapshot older than SNAPSHOT_MAX_AGE seconds isn't served at all.
+
+usage: python -m cache.snapshot --out /path/to/reference.snap
+"""
+
+import argparse
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from functools import wraps
+
+import emoji
+
+from api.json_provider import dumps, loads
+from cache.broadcast import KEY, WHOLE
+from cache.cache import listeners, sync
+from constants.constants import (
+    ACTOR,
+    DIRECTOR,
+    GENRE,
+    MOVIE,
+    MOVIE_ACTOR,
+    MOVIE_DIRECTOR,
+    MOVIE_GENRE,
+    SCHEMA_NAME,
+    SNAPSHOT_CHECK_INTERVAL,
+    SNAPSHOT_MAX_AGE,
+    SNAPSHOT_MAX_DIRTY_KEYS,
+    SNAPSHOT_PATH,
+    STATUS_OK,
+)
+from db.Connection import Connection
+from db.Query import Query
+
+MAGIC = b"MVSNAP01"
+HEADER = struct.Struct("<8sQI")
+DIRECTORY = struct.Struct("<32sQQQQQ")
+
+# table => (key column, second key column for link tables)
+TABLES = {
+    GENRE: ("genre_id", None),
+    DIRECTOR: ("director_id", None),
+    ACTOR: ("actor_id", None),
+    MOVIE: ("movie_id", None),
+    MOVIE_ACTOR: ("movie_id", "actor_id"),
+    MOVIE_DIRECTOR: ("movie_id", "director_id"),
+    MOVIE_GENRE: ("movie_id", "genre_id"),
+}
+
+
+def _align(offset):
+    """
+    rounds offset up to the next multiple of 8
+    """
+    return (offset + 7) & ~7
+
+
+def write_snapshot(path, tables, built_at):
+    """
+    writes tables to path and atomically replaces any previous snapshot
+
+    parameter tables = {name: [(key, encoded row bytes), ...]}
+    parameter built_at = time in ns when the rows were read
+    """
+    layout = []
+    offset = HEADER.size + DIRECTORY.size * len(tables)
+    for name, rows in tables.items():
+        rows.sort(key=lambda row: row[0])
+        keys_off = _align(offset)
+        offsets_off = keys_off + 8 * len(rows)
+        data_off = offsets_off + 8 * (len(rows) + 1)
+        data_len = sum(len(row[1]) for row in rows)
+        layout.append((name, rows, keys_off, offsets_off, data_off, data_len))
+        offset = data_off + data_len
+
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, built_at, len(tables)))
+        for name, rows, keys_off, offsets_off, data_off, data_len in layout:
+            file.write(
+                DIRECTORY.pack(
+                    name.encode(), len(rows), keys_off, offsets_off, data_off, data_len
+                )
+            )
+        for name, rows, keys_off, offsets_off, data_off, data_len in layout:
+            file.write(b"\0" * (keys_off - file.tell()))
+            file.write(struct.pack(f"<{len(rows)}q", *(row[0] for row in rows)))
+            row_offsets = [0]
+            for row in rows:
+                row_offsets.append(row_offsets[-1] + len(row[1]))
+            file.write(struct.pack(f"<{len(row_offsets)}Q", *row_offsets))
+            for row in rows:
+                file.write(row[1])
+        file.flush()
+        os.fsync(file.fileno())
+
+    # readers see either the old or the new file, never a partial one
+    os.replace(tmp_path, path)
+
+
+class Snapshot:
+    """
+    A read-only mapping of a snapshot file
+    """
+
+    def __init__(self, path):
+        """
+        constructor
+        """
+        with open(path, "rb") as file:
+            self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.built_at, count = HEADER.unpack_from(self.mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a snapshot file")
+
+        view = self.view = memoryview(self.mmap)
+        self.tables = {}
+        for idx in range(count):
+            name, rows, keys_off, offsets_off, data_off, _ = DIRECTORY.unpack_from(
+                self.mmap, HEADER.size + idx * DIRECTORY.size
+            )
+            # casts are views over the mapped pages, nothing is copied
+            keys = view[keys_off : keys_off + 8 * rows].cast("q")
+            offsets = view[offsets_off : offsets_off + 8 * (rows + 1)].cast("Q")
+            self.tables[name.rstrip(b"\0").decode()] = (keys, offsets, data_off)
+
+    def rows(self, table, key):
+        """
+        returns all rows of table stored under key
+        """
+        keys, offsets, data_off = self.tables[table]
+        low = bisect_left(keys, key)
+        high = bisect_right(keys, key, low)
+        return [
+            loads(self.view[data_off + offsets[idx] : data_off + offsets[idx + 1]])
+            for idx in range(low, high)
+        ]
+
+
+class SnapshotReader:  # pylint: disable=too-many-instance-attributes
+    """
+    Maps the published snapshot and swaps to newer versions as they appear
+    """
+
+    def __init__(
+        self,
+        path,
+        check_interval,
+        max_age=SNAPSHOT_MAX_AGE,
+        max_dirty_keys=SNAPSHOT_MAX_DIRTY_KEYS,
+    ):
+        """
+        constructor
+        """
+        self.path = path
+        self.check_interval = check_interval
+        self.max_age = max_age
+        self.max_dirty_keys = max_dirty_keys
+        self.snapshot = None
+        self.identity = None
+        self.checked_at = None
+        self.lock = threading.Lock()
+        # table or (table, key) => time in ns of the last write
+        self.dirty = {}
+        # table => number of (table, key) entries in dirty
+        self.dirty_keys = {}
+
+    def current(self):
+        """
+        returns the mapped snapshot, checking for a newer file at most once
+        per check_interval
+        """
+        now = time.monotonic()
+        if self.checked_at is None or now - self.checked_at >= self.check_interval:
+            self.checked_at = now
+            self._reload()
+        return self.snapshot
+
+    def _reload(self):
+        """
+        maps the file again if it was replaced since the last check
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            if identity == self.identity:
+                return
+            try:
+                # the previous mapping is released once no lookup holds it
+                self.snapshot = Snapshot(self.path)
+                self.identity = identity
+                # writes the new snapshot includes are forgotten
+                self.dirty = {
+                    name: written_at
+                    for name, written_at in self.dirty.items()
+                    if written_at >= self.snapshot.built_at
+                }
+                self.dirty_keys = {}
+                for name in self.dirty:
+                    if isinstance(name, tuple):
+                        self.dirty_keys[name[0]] = self.dirty_keys.get(name[0], 0) + 1
+            except (OSError, ValueError, struct.error):
+                logging.error(
+                    emoji.emojize(f"Could not map snapshot {self.path} :cross_mark:")
+                )
+
+    def mark_dirty(self, written):
+        """
+        stops serving the rows written, see cache.broadcast.events(), until
+        a newer snapshot; a write of unknown rows, or of more than
+        max_dirty_keys rows of a table, stops the whole table
+        """
+        with self.lock:
+            for table, kind, key, written_at in written:
+                if table not in TABLES or kind not in (WHOLE, KEY):
+                    continue
+                name = table if kind == WHOLE else (table, key)
+                if kind == KEY and name not in self.dirty:
+                    self.dirty_keys[table] = self.dirty_keys.get(table, 0) + 1
+                self.dirty[name] = max(self.dirty.get(name, 0), written_at)
+                if self.dirty_keys.get(table, 0) > self.max_dirty_keys:
+                    self._collapse(table)
+
+    def _collapse(self, table):
+        """
+        replaces the dirty keys of table with one entry for the whole table,
+        so dirty stays bounded while no newer snapshot is published
+        """
+        names = [
+            name for name in self.dirty if isinstance(name, tuple) and name[0] == table
+        ]
+        written_at = max(self.dirty.pop(name) for name in names)
+        self.dirty[table] = max(self.dirty.get(table, 0), written_at)
+        self.dirty_keys[table] = 0
+
+    def is_dirty(self, snapshot, table, key):
+        """
+        True if the snapshot can't answer for key of table
+        """
+        if time.time_ns() - snapshot.built_at > self.max_age * 1e9:
+            return True
+        return (
+            self.dirty.get(table, 0) >= snapshot.built_at
+            or self.dirty.get((table, key), 0) >= snapshot.built_at
+        )
+
+    def stats(self):
+        """
+        returns the mapped version, size and row count per table
+        """
+        snapshot = self.current()
+        if snapshot is None:
+            return {"path": str(self.path), "mapped": False}
+        return {
+            "path": str(self.path),
+            "mapped": True,
+            "built_at": snapshot.built_at,
+            "bytes": len(snapshot.mmap),
+            "tables": {
+                name: len(keys) for name, (keys, _, _) in snapshot.tables.items()
+            },
+            "dirty": sorted(
+                name
+                for name, written_at in self.dirty.items()
+                if isinstance(name, str) and written_at >= snapshot.built_at
+            ),
+            "dirty_keys": sum(
+                1
+                for name, written_at in self.dirty.items()
+                if isinstance(name, tuple) and written_at >= snapshot.built_at
+            ),
+        }
+
+    def rows(self, table, key):
+        """
+        returns rows of table for key, or None if the snapshot can't answer
+        """
+        snapshot = self.current()
+        if snapshot is None or table not in snapshot.tables:
+            return None
+        if self.is_dirty(snapshot, table, key):
+            return None
+        return snapshot.rows(table, key)
+
+
+reader = None
+if SNAPSHOT_PATH:
+    reader = SnapshotReader(SNAPSHOT_PATH, SNAPSHOT_CHECK_INTERVAL)
+    listeners.append(reader.mark_dirty)
+
+
+def from_snapshot(table):
+    """
+    Decorator serving a lookup by ID from the snapshot, falling back to the
+    wrapped service for rows the snapshot doesn't have
+    """
+
+    def decorate(func):
+        @wraps(func)
+        def wrapper(ids_):
+            if reader is None:
+                return func(ids_)
+            try:
+                ids = [int(id_) for id_ in str(ids_).split(",")]
+            except ValueError:
+                return func(ids_)
+
+            # writes of other workers first
+            sync()
+            rows = reader.rows(table, ids[0])
+            second_key = TABLES[table][1]
+            if rows and second_key is not None and len(ids) > 1:
+                rows = [row for row in rows if row[second_key] == ids[1]]
+            if rows:
+                return {"status": STATUS_OK, "data": rows}
+            return func(ids_)
+
+        return wrapper
+
+    return decorate
+
+
+def build_snapshot(conn_pool, path):
+    """
+    reads the reference tables and publishes a new snapshot at path
+    """
+    built_at = time.time_ns()
+    tables = {}
+    for table, (key, second_key) in TABLES.items():
+        order = key if second_key is None else f"{key}, {second_key}"
+        query = Query(conn_pool)
+        query.execute(f"SELECT * FROM {SCHEMA_NAME}.{table} ORDER BY {order};")
+        tables[table] = [(row[key], dumps(row)) for row in query.fetch()]
+        query.close()
+        logging.info("snapshot: %s => %s rows", table, len(tables[table]))
+
+    write_snapshot(path, tables, built_at)
+    return tables
+
+
+def main():
+    """
+    builds and publishes a snapshot from the configured database
+    """
+    parser = argparse.ArgumentParser(description="Build the reference snapshot")
+    parser.add_argument("--out", default=SNAPSHOT_PATH, required=not SNAPSHOT_PATH)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    build_snapshot(Connection(), args.out)
+    print(f"Snapshot written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
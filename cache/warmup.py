@@ -0,0 +1,151 @@
+"""
+Cache warm-up from recorded hot keys
+
+Every WARMUP_INTERVAL seconds each worker saves its hottest read cache keys
+and their hits to its own file, WARMUP_FILE suffixed with its pid. On startup
+the files updated within WARMUP_MAX_AGE seconds are merged, hits added up
+across workers, and the hottest keys are replayed in the background so a
+fresh deploy doesn't start with cold caches. Older files are deleted.
+"""
+
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import emoji
+
+from cache.cache import loaders, read_cache
+from constants.constants import (
+    WARMUP_CONCURRENCY,
+    WARMUP_FILE,
+    WARMUP_INTERVAL,
+    WARMUP_KEYS,
+    WARMUP_MAX_AGE,
+)
+
+# set once recorded keys were replayed, reported by the readiness check
+ready = threading.Event()
+
+
+def recorded(path):
+    """
+    returns the hot key files saved next to path by every worker
+    """
+    found = glob.glob(f"{glob.escape(path)}.*")
+    return [name for name in found if name.rsplit(".", 1)[1].isdigit()]
+
+
+def save_hot_keys(path, limit, max_age=WARMUP_MAX_AGE):
+    """
+    writes the hottest read cache keys of this worker with their hits, and
+    deletes the files no worker updated for max_age seconds
+    """
+    keys = dict(read_cache.top_keys(limit))
+    if not keys:
+        return 0
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    own_path = f"{path}.{os.getpid()}"
+    with open(f"{own_path}.tmp", "w", encoding="utf-8") as file:
+        json.dump(keys, file)
+    os.replace(f"{own_path}.tmp", own_path)
+
+    for name in recorded(path):
+        try:
+            if time.time() - os.path.getmtime(name) > max_age:
+                os.remove(name)
+        except OSError:
+            pass
+    return len(keys)
+
+
+def load_hot_keys(path, limit, max_age=WARMUP_MAX_AGE):
+    """
+    returns up to limit keys recorded by the workers within max_age
+    seconds, most read first across all of them
+    """
+    hits = Counter()
+    for name in recorded(path):
+        try:
+            if time.time() - os.path.getmtime(name) > max_age:
+                continue
+            with open(name, encoding="utf-8") as file:
+                keys = json.load(file)
+        except (OSError, ValueError):
+            continue
+        if not isinstance(keys, dict):
+            continue
+        for key, count in keys.items():
+            if isinstance(count, int):
+                hits[key] += count
+    return [key for key, _ in hits.most_common(limit)]
+
+
+def replay_key(key, app=None):
+    """
+    calls the cached service behind key so its result is cached again
+    """
+    entity, name, args = key.split(":", 2)
+    loader = loaders.get(f"{entity}:{name}")
+    if loader is None:
+        return False
+    if app is not None:
+        with app.app_context():
+            loader(*json.loads(args))
+    else:
+        loader(*json.loads(args))
+    return True
+
+
+def replay(path, concurrency, app=None, limit=WARMUP_KEYS):
+    """
+    replays the hottest recorded keys with at most concurrency queries in
+    flight
+    """
+
+    def run(key):
+        try:
+            return replay_key(key, app)
+        except Exception:  # pylint: disable=broad-exception-caught
+            logging.exception(emoji.emojize(f"Warm-up failed for {key} :cross_mark:"))
+            return False
+
+    keys = load_hot_keys(path, limit)
+    with ThreadPoolExecutor(
+        max_workers=max(concurrency, 1), thread_name_prefix="warmup"
+    ) as executor:
+        warmed = sum(executor.map(run, keys))
+    return warmed
+
+
+def record(path, interval, limit):
+    """
+    saves the hot keys every interval seconds, runs on a daemon thread
+    """
+    while True:
+        time.sleep(interval)
+        try:
+            save_hot_keys(path, limit)
+        except OSError:
+            logging.error(emoji.emojize("Could not save hot keys :cross_mark:"))
+
+
+def start(app):
+    """
+    replays recorded keys in the background, then starts recording
+    """
+
+    def run():
+        warmed = replay(WARMUP_FILE, WARMUP_CONCURRENCY, app)
+        app.logger.info(emoji.emojize(f"Warmed {warmed} cache keys :fire:"))
+        ready.set()
+        record(WARMUP_FILE, WARMUP_INTERVAL, WARMUP_KEYS)
+
+    threading.Thread(target=run, name="warmup", daemon=True).start()
@@ -5,6 +5,12 @@ import os
 SCHEMA_NAME = os.getenv("SCHEMA")
 
 STATUS_OK = 200
+STATUS_ACCEPTED = 202
+STATUS_BAD_REQUEST = 400
+STATUS_NOT_FOUND = 404
+STATUS_CONFLICT = 409
+STATUS_GONE = 410
+STATUS_TOO_MANY_REQUESTS = 429
 STATUS_ERR = 500
 
 MOVIE = "movie"
@@ -16,3 +22,148 @@ MOVIE_GENRE = "movie_genre"
 DIRECTOR = "director"
 MOVIE_DIRECTOR = "movie_director"
 MOVIE_REVIEW = "movie_review"
+
+# columns of every table, used to validate filters and partial payloads
+COLUMNS = {
+    MOVIE: (
+        "movie_id",
+        "title",
+        "description",
+        "movie_year",
+        "rating",
+        "runtime",
+        "votes",
+        "revenue",
+        "metascore",
+        "created_at",
+    ),
+    ACTOR: ("actor_id", "first_name", "last_name", "gender", "age", "created_at"),
+    DIRECTOR: ("director_id", "first_name", "last_name", "created_at"),
+    GENRE: ("genre_id", "name", "created_at"),
+    MOVIE_ACTOR: ("movie_id", "actor_id", "created_at"),
+    MOVIE_DIRECTOR: ("movie_id", "director_id", "created_at"),
+    MOVIE_GENRE: ("movie_id", "genre_id", "created_at"),
+    MOVIE_REVIEW: ("review_id", "movie_id", "review", "created_at"),
+}
+
+# read cache (stale-while-revalidate) settings, in seconds
+CACHE_SOFT_TTL = float(os.getenv("CACHE_SOFT_TTL", "5"))
+CACHE_HARD_TTL = float(os.getenv("CACHE_HARD_TTL", "60"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+CACHE_REFRESH_WORKERS = int(os.getenv("CACHE_REFRESH_WORKERS", "2"))
+
+# file the workers of a node share invalidations through, empty to keep them
+# local, and how many recent invalidations it holds
+CACHE_SIGNAL_PATH = os.getenv("CACHE_SIGNAL_PATH", "logs/cache_signal")
+CACHE_SIGNAL_SLOTS = int(os.getenv("CACHE_SIGNAL_SLOTS", "4096"))
+
+# negative cache for not-found lookups and empty searches
+NEGATIVE_CACHE_TTL = float(os.getenv("NEGATIVE_CACHE_TTL", "10"))
+NEGATIVE_CACHE_MAX_ENTRIES = int(os.getenv("NEGATIVE_CACHE_MAX_ENTRIES", "10000"))
+NEGATIVE_CACHE_MAX_KEY_LENGTH = int(os.getenv("NEGATIVE_CACHE_MAX_KEY_LENGTH", "512"))
+
+# memory-mapped snapshot of reference tables, disabled when no path is set
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH")
+SNAPSHOT_CHECK_INTERVAL = float(os.getenv("SNAPSHOT_CHECK_INTERVAL", "5"))
+# seconds a snapshot is served after its build
+SNAPSHOT_MAX_AGE = float(os.getenv("SNAPSHOT_MAX_AGE", "3600"))
+# rows of a table written since the snapshot before the whole table is dirty
+SNAPSHOT_MAX_DIRTY_KEYS = int(os.getenv("SNAPSHOT_MAX_DIRTY_KEYS", "10000"))
+
+# cache warm-up from recorded hot keys
+WARMUP_FILE = os.getenv("WARMUP_FILE", "logs/hot_keys.json")
+WARMUP_INTERVAL = float(os.getenv("WARMUP_INTERVAL", "60"))
+WARMUP_KEYS = int(os.getenv("WARMUP_KEYS", "100"))
+WARMUP_CONCURRENCY = int(os.getenv("WARMUP_CONCURRENCY", "4"))
+# seconds after which the hot keys saved by a worker that stopped are ignored
+WARMUP_MAX_AGE = float(os.getenv("WARMUP_MAX_AGE", "3600"))
+
+# token required by the admin endpoints, which answer 404 while it is unset
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# JSON encoder used by the app: "orjson" or "json" (stdlib)
+JSON_BACKEND = os.getenv("JSON_BACKEND", "orjson")
+
+# trusted output: read rows skip per-row pydantic validation after the first
+# response of each model, except for a sampled fraction of responses
+TRUSTED_OUTPUT = os.getenv("TRUSTED_OUTPUT", "false").lower() in ("1", "true", "yes")
+TRUSTED_SAMPLE_RATE = float(os.getenv("TRUSTED_SAMPLE_RATE", "0.01"))
+
+# rows fetched per round trip by server-side cursors when streaming
+STREAM_ITERSIZE = int(os.getenv("STREAM_ITERSIZE", "2000"))
+
+# COPY ... TO STDOUT output is handed to the response in chunks of this size
+COPY_CHUNK_SIZE = int(os.getenv("COPY_CHUNK_SIZE", "65536"))
+COPY_QUEUE_SIZE = int(os.getenv("COPY_QUEUE_SIZE", "16"))
+
+# response compression
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "5"))
+COMPRESS_CACHE_ENTRIES = int(os.getenv("COMPRESS_CACHE_ENTRIES", "64"))
+
+# seconds clients may reuse the Swagger spec before revalidating its ETag
+SWAGGER_MAX_AGE = int(os.getenv("SWAGGER_MAX_AGE", "86400"))
+
+# production server, see server/launcher.py
+WEB_BIND = os.getenv("WEB_BIND", "0.0.0.0:5000")
+# 0 starts one worker per CPU core
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "0"))
+WEB_THREADS = int(os.getenv("WEB_THREADS", "8"))
+WEB_KEEPALIVE = int(os.getenv("WEB_KEEPALIVE", "5"))
+WEB_TIMEOUT = int(os.getenv("WEB_TIMEOUT", "30"))
+WEB_MAX_REQUESTS = int(os.getenv("WEB_MAX_REQUESTS", "10000"))
+WEB_MAX_REQUESTS_JITTER = int(os.getenv("WEB_MAX_REQUESTS_JITTER", "1000"))
+WEB_PRELOAD = os.getenv("WEB_PRELOAD", "true").lower() in ("1", "true", "yes")
+# connections the database allows all workers together, 0 for no limit
+DB_CONNECTION_BUDGET = int(os.getenv("DB_CONNECTION_BUDGET", "0"))
+
+# invalid rows tolerated by a bulk load before it is rolled back
+BULK_MAX_ERRORS = int(os.getenv("BULK_MAX_ERRORS", "1000"))
+# bytes of a bulk body queued as a job kept in memory before spilling to disk
+BULK_SPOOL_MEMORY = int(os.getenv("BULK_SPOOL_MEMORY", str(8 * 1024 * 1024)))
+# IDs deleted per statement by the bulk delete endpoints
+BULK_DELETE_BATCH = int(os.getenv("BULK_DELETE_BATCH", "1000"))
+
+# parallel COPY connections and rows per COPY of python -m db.loader
+LOADER_JOBS = int(os.getenv("LOADER_JOBS", "4"))
+LOADER_CHUNK_ROWS = int(os.getenv("LOADER_CHUNK_ROWS", "100000"))
+
+# write-behind buffering of review inserts, off unless REVIEW_WRITE_BEHIND is set
+REVIEW_WRITE_BEHIND = os.getenv("REVIEW_WRITE_BEHIND", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+WRITE_BEHIND_QUEUE_SIZE = int(os.getenv("WRITE_BEHIND_QUEUE_SIZE", "10000"))
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "500"))
+WRITE_BEHIND_INTERVAL = float(os.getenv("WRITE_BEHIND_INTERVAL", "0.2"))
+# longest wait in seconds between retries of a batch the database rejected
+WRITE_BEHIND_MAX_BACKOFF = float(os.getenv("WRITE_BEHIND_MAX_BACKOFF", "30"))
+# seconds a persisted ack token can be confirmed, tokens tracked per process
+WRITE_ACK_TTL = int(os.getenv("WRITE_ACK_TTL", "86400"))
+WRITE_ACK_ENTRIES = int(os.getenv("WRITE_ACK_ENTRIES", "100000"))
+
+# delta sync over db/change_log.py, off until the change log is installed;
+# changes older than CHANGE_LOG_RETENTION seconds are pruned
+CHANGE_LOG_ENABLED = os.getenv("CHANGE_LOG_ENABLED", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+CHANGE_LOG_RETENTION = int(os.getenv("CHANGE_LOG_RETENTION", str(7 * 86400)))
+
+# seconds a stored Idempotency-Key response is replayed, and after which an
+# unfinished request's claim on a key can be taken over
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "86400"))
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.getenv("IDEMPOTENCY_LOCK_TIMEOUT", "60"))
+
+# background jobs per web worker, see api/jobs.py
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "8"))
+JOB_PROGRESS_INTERVAL = float(os.getenv("JOB_PROGRESS_INTERVAL", "1"))
+JOB_MAX_ERRORS = int(os.getenv("JOB_MAX_ERRORS", "100"))
+# seconds between heartbeats of the jobs of a worker, and without one after
+# which an unfinished job is failed as its worker is gone
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "10"))
+JOB_HEARTBEAT_TIMEOUT = float(os.getenv("JOB_HEARTBEAT_TIMEOUT", "60"))
@@ -16,10 +16,15 @@ class Connection:
     Database connection class
     """
 
-    def __init__(self):
+    def __init__(self, minconn=None, maxconn=None):
         """
         constructor
+
+        parameter minconn, maxconn = pool bounds, MIN_CONNECTIONS and
+        MAX_CONNECTIONS from the environment by default
         """
+        self.minconn = minconn
+        self.maxconn = maxconn
         self.setpool()
 
     def getconn(self):
@@ -28,11 +33,11 @@ class Connection:
         """
         return self.pool.getconn()
 
-    def putconn(self, conn):
+    def putconn(self, conn, close=False):
         """
-        places connection back in the pool
+        places connection back in the pool, closing it if close is set
         """
-        self.pool.putconn(conn)
+        self.pool.putconn(conn, close=close)
 
     def setpool(self):
         """
@@ -48,8 +53,8 @@ class Connection:
             self.config["database"] = os.getenv("DATABASE")
             # configure threaded connection pool
             self.pool = ThreadedConnectionPool(
-                minconn=os.getenv("MIN_CONNECTIONS"),
-                maxconn=os.getenv("MAX_CONNECTIONS"),
+                minconn=self.minconn or os.getenv("MIN_CONNECTIONS"),
+                maxconn=self.maxconn or os.getenv("MAX_CONNECTIONS"),
                 **self.config
             )
             logging.info(emoji.emojize("Connected to database...:party_popper:"))
@@ -0,0 +1,270 @@
+"""
+Change log for delta sync
+
+A trigger on every table records the key of each inserted, updated or deleted
+row in change_log, in the same transaction as the write, so deletes leave a
+tombstone. Entries carry the id of the writing transaction. A sync token is
+the oldest transaction still running when the changes were read: everything
+below it has committed or rolled back, so a client asking again with the
+token can't miss a transaction that commits late.
+
+Changes older than CHANGE_LOG_RETENTION seconds are pruned, and the horizon
+moves past the newest transaction pruned. A token below the horizon may have
+missed pruned changes, it gets 410 and the client syncs again without a token.
+The /changes endpoints answer 404 until CHANGE_LOG_ENABLED is set, once the
+change log is installed.
+
+usage: python -m db.change_log    (installs the table and the triggers)
+"""
+
+import logging
+import threading
+import time
+
+from db.Connection import Connection
+from db.db_utils import do_query
+from db.Query import Query
+from constants.constants import (
+    ACTOR,
+    DIRECTOR,
+    GENRE,
+    MOVIE,
+    MOVIE_ACTOR,
+    MOVIE_DIRECTOR,
+    MOVIE_GENRE,
+    MOVIE_REVIEW,
+    CHANGE_LOG_ENABLED,
+    CHANGE_LOG_RETENTION,
+    SCHEMA_NAME,
+    STATUS_BAD_REQUEST,
+    STATUS_GONE,
+    STATUS_NOT_FOUND,
+    STATUS_OK,
+)
+
+CHANGE_LOG = "change_log"
+CHANGE_LOG_HORIZON = "change_log_horizon"
+
+# seconds between deletions of expired changes, per process
+PRUNE_INTERVAL = 60
+pruned_at = time.monotonic()
+prune_lock = threading.Lock()
+
+# key columns recorded for each table
+KEYS = {
+    MOVIE: ("movie_id",),
+    ACTOR: ("actor_id",),
+    DIRECTOR: ("director_id",),
+    GENRE: ("genre_id",),
+    MOVIE_ACTOR: ("movie_id", "actor_id"),
+    MOVIE_DIRECTOR: ("movie_id", "director_id"),
+    MOVIE_GENRE: ("movie_id", "genre_id"),
+    MOVIE_REVIEW: ("review_id",),
+}
+
+TOKEN_SQL = f"""
+    SELECT txid_snapshot_xmin(txid_current_snapshot()) AS token,
+        (SELECT txid FROM {SCHEMA_NAME}.{CHANGE_LOG_HORIZON}) AS horizon;"""
+
+
+def ddl(schema):
+    """
+    returns the statements creating the change log and its triggers
+    """
+    statements = [
+        f"""
+        CREATE TABLE IF NOT EXISTS {schema}.{CHANGE_LOG} (
+            version bigserial PRIMARY KEY,
+            txid bigint NOT NULL DEFAULT txid_current(),
+            entity text NOT NULL,
+            row_key jsonb NOT NULL,
+            op char(1) NOT NULL,
+            changed_at timestamptz NOT NULL DEFAULT now()
+        );""",
+        f"""
+        CREATE INDEX IF NOT EXISTS {CHANGE_LOG}_entity_txid
+            ON {schema}.{CHANGE_LOG} (entity, txid);""",
+        f"""
+        CREATE INDEX IF NOT EXISTS {CHANGE_LOG}_changed_at
+            ON {schema}.{CHANGE_LOG} (changed_at);""",
+        f"""
+        CREATE TABLE IF NOT EXISTS {schema}.{CHANGE_LOG_HORIZON} (
+            only_row boolean PRIMARY KEY DEFAULT true CHECK (only_row),
+            txid bigint NOT NULL
+        );
+        INSERT INTO {schema}.{CHANGE_LOG_HORIZON} (txid) VALUES (0)
+            ON CONFLICT DO NOTHING;""",
+        f"""
+        CREATE OR REPLACE FUNCTION {schema}.log_change() RETURNS trigger AS $$
+        DECLARE
+            old_key jsonb := '{{}}'::jsonb;
+            new_key jsonb := '{{}}'::jsonb;
+            col text;
+        BEGIN
+            FOREACH col IN ARRAY TG_ARGV LOOP
+                IF TG_OP <> 'INSERT' THEN
+                    old_key := old_key || jsonb_build_object(col, to_jsonb(OLD) -> col);
+                END IF;
+                IF TG_OP <> 'DELETE' THEN
+                    new_key := new_key || jsonb_build_object(col, to_jsonb(NEW) -> col);
+                END IF;
+            END LOOP;
+            -- an update moving the row to another key deletes the old one
+            IF TG_OP = 'DELETE' OR (TG_OP = 'UPDATE' AND old_key <> new_key) THEN
+                INSERT INTO {schema}.{CHANGE_LOG} (entity, row_key, op)
+                VALUES (TG_TABLE_NAME, old_key, 'D');
+            END IF;
+            IF TG_OP <> 'DELETE' THEN
+                INSERT INTO {schema}.{CHANGE_LOG} (entity, row_key, op)
+                VALUES (TG_TABLE_NAME, new_key, 'U');
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;""",
+    ]
+    for table, keys in KEYS.items():
+        args = ", ".join(f"'{key}'" for key in keys)
+        statements.append(f"""
+        DROP TRIGGER IF EXISTS {table}_change_log ON {schema}.{table};
+        CREATE TRIGGER {table}_change_log
+            AFTER INSERT OR UPDATE OR DELETE ON {schema}.{table}
+            FOR EACH ROW EXECUTE PROCEDURE {schema}.log_change({args});""")
+    return "\n".join(statements)
+
+
+def parse_token(since):
+    """
+    returns the transaction id in a sync token, None for a full sync
+    """
+    if since is None or since == "":
+        return None
+    token = int(since)
+    if token < 0:
+        raise ValueError(f"invalid sync token {since}")
+    return token
+
+
+def prune():
+    """
+    deletes changes older than CHANGE_LOG_RETENTION seconds and moves the
+    horizon past them, at most once per PRUNE_INTERVAL in each process
+    """
+    global pruned_at  # pylint: disable=global-statement
+    with prune_lock:
+        if time.monotonic() - pruned_at < PRUNE_INTERVAL:
+            return
+        pruned_at = time.monotonic()
+    # a transaction's changes share its start time, so they go together
+    do_query(
+        f"""
+        WITH pruned AS (
+            DELETE FROM {SCHEMA_NAME}.{CHANGE_LOG}
+            WHERE changed_at < now() - %(retention)s * interval '1 second'
+            RETURNING txid
+        )
+        UPDATE {SCHEMA_NAME}.{CHANGE_LOG_HORIZON}
+        SET txid = GREATEST(txid, (SELECT max(txid) + 1 FROM pruned))
+        RETURNING txid;""",
+        {"retention": CHANGE_LOG_RETENTION},
+    )
+
+
+def full_query(table, token):
+    """
+    returns every row of table as upserted, with the token
+    """
+    result = do_query(f"SELECT * FROM {SCHEMA_NAME}.{table};", {})
+    if result["status"] != STATUS_OK:
+        return result
+    data = {"upserted": result["data"], "deleted": [], "token": str(token)}
+    return {"status": STATUS_OK, "data": data}
+
+
+def delta_query(table, since, token):
+    """
+    returns the rows of table upserted and the keys deleted by transactions
+    from since up to token, with the token
+    """
+    join = " AND ".join(
+        f"t.{key} = (l.row_key ->> '{key}')::bigint" for key in KEYS[table]
+    )
+    sql = f"""
+        WITH latest AS (
+            SELECT DISTINCT ON (row_key) row_key, op
+            FROM {SCHEMA_NAME}.{CHANGE_LOG}
+            WHERE entity = %(entity)s AND txid >= %(since)s AND txid < %(token)s
+            ORDER BY row_key, version DESC
+        )
+        SELECT l.op, l.row_key, to_jsonb(t) AS row
+        FROM latest l LEFT JOIN {SCHEMA_NAME}.{table} t ON {join};"""
+    result = do_query(sql, {"entity": table, "since": since, "token": token})
+    if result["status"] != STATUS_OK:
+        return result
+
+    # a row updated in the window but deleted since is reported as deleted,
+    # its tombstone comes again with the next token
+    upserted = []
+    deleted = []
+    for change in result["data"]:
+        if change["op"] == "U" and change["row"] is not None:
+            upserted.append(change["row"])
+        else:
+            deleted.append(change["row_key"])
+    data = {"upserted": upserted, "deleted": deleted, "token": str(token)}
+    return {"status": STATUS_OK, "data": data}
+
+
+def changes_query(table, since):
+    """
+    Service function returning the rows of table upserted and the keys
+    deleted since a sync token, with the token to pass next time
+
+    Without a token every row is returned as upserted.
+    """
+    if not CHANGE_LOG_ENABLED:
+        return {
+            "status": STATUS_NOT_FOUND,
+            "error": "delta sync is off, the change log isn't enabled",
+        }
+    try:
+        since = parse_token(since)
+    except ValueError:
+        return {"status": STATUS_BAD_REQUEST, "error": f"invalid sync token {since}"}
+
+    prune()
+    # read before the changes, so later commits fall after the new token
+    result = do_query(TOKEN_SQL, {})
+    if result["status"] != STATUS_OK:
+        return result
+    token = result["data"][0]["token"]
+    if since is None:
+        return full_query(table, token)
+    if since < result["data"][0]["horizon"]:
+        return {
+            "status": STATUS_GONE,
+            "error": f"sync token {since} expired, sync again without a token",
+        }
+    return delta_query(table, since, token)
+
+
+def install(conn_pool):
+    """
+    creates the change log and the triggers of every table
+    """
+    query = Query(conn_pool)
+    query.execute(ddl(SCHEMA_NAME))
+    query.close()
+    logging.info("change log installed for %s tables", len(KEYS))
+
+
+def main():
+    """
+    installs the change log in the configured database
+    """
+    logging.basicConfig(level=logging.INFO)
+    install(Connection())
+    print(f"Change log installed in {SCHEMA_NAME}.{CHANGE_LOG}")
+
+
+if __name__ == "__main__":
+    main()
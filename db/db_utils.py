@@ -2,12 +2,27 @@
 database utility class
 """
 
-
+import json
 import logging
+import queue
+import threading
+import uuid
 import emoji
 from flask import current_app as app
 from psycopg2 import DatabaseError
-from constants.constants import STATUS_OK, STATUS_ERR
+from psycopg2.extras import RealDictCursor
+from constants.constants import (
+    BULK_DELETE_BATCH,
+    COLUMNS,
+    COPY_CHUNK_SIZE,
+    COPY_QUEUE_SIZE,
+    SCHEMA_NAME,
+    STATUS_BAD_REQUEST,
+    STATUS_NOT_FOUND,
+    STATUS_OK,
+    STATUS_ERR,
+    STREAM_ITERSIZE,
+)
 from db.Query import Query
 
 
@@ -32,3 +47,525 @@ def do_query(sql, payload):
         # logs the database error
         logging.error(emoji.emojize("Error retrieving data :cross_mark:"))
         return {"status": STATUS_ERR, "error": err}
+
+
+def stream_query(sql, payload, itersize=STREAM_ITERSIZE):
+    """
+    Service function to execute a query on a server-side cursor
+
+    The query runs before returning, so errors are reported like do_query.
+    'data' is an iterator over the rows; the connection goes back to the
+    pool once it is exhausted or closed.
+    """
+
+    conn_pool = app.conn
+    conn = conn_pool.getconn()
+    try:
+        # server-side cursors live inside a transaction
+        conn.autocommit = False
+        cursor = conn.cursor(
+            name=f"stream_{uuid.uuid4().hex}", cursor_factory=RealDictCursor
+        )
+        cursor.itersize = itersize
+        cursor.execute(sql, payload)
+    except DatabaseError as err:
+        conn.rollback()
+        conn_pool.putconn(conn)
+        logging.error(emoji.emojize("Error retrieving data :cross_mark:"))
+        return {"status": STATUS_ERR, "error": err}
+
+    return {"status": STATUS_OK, "data": _RowStream(conn_pool, conn, cursor)}
+
+
+class _RowStream:
+    """
+    Iterator over a server-side cursor that releases its connection
+
+    close() releases it even if iteration never started, e.g. for a HEAD
+    request or a client gone before the first chunk, where a generator's
+    finally would never run.
+    """
+
+    def __init__(self, conn_pool, conn, cursor):
+        """
+        constructor
+        """
+        self.conn_pool = conn_pool
+        self.conn = conn
+        self.cursor = cursor
+        self.rows = iter(cursor)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.conn is None:
+            raise StopIteration
+        try:
+            return next(self.rows)
+        except BaseException:
+            # exhausted or failed, either way the cursor is done
+            self.close()
+            raise
+
+    def close(self):
+        """
+        closes the cursor and returns the connection to the pool, once
+        """
+        conn, self.conn = self.conn, None
+        if conn is None:
+            return
+        try:
+            self.cursor.close()
+            conn.rollback()
+        except DatabaseError:
+            logging.error(emoji.emojize("Error closing stream cursor :cross_mark:"))
+        self.conn_pool.putconn(conn)
+
+
+def filter_clause(table, filters):
+    """
+    builds a WHERE clause matching each column of filters exactly
+
+    parameter filters = {column: value}, columns must belong to table
+    returns (sql, params); raises ValueError for unknown columns
+    """
+
+    conditions = []
+    params = {}
+    for idx, (column, value) in enumerate(filters.items()):
+        if column not in COLUMNS[table]:
+            raise ValueError(f"Unknown column '{column}' for {table}")
+        conditions.append(f"{column} = %(filter_{idx})s")
+        params[f"filter_{idx}"] = value
+
+    if not conditions:
+        return "", params
+    return " WHERE " + " AND ".join(conditions), params
+
+
+class _CopyWriter:
+    """
+    File-like target for COPY ... TO STDOUT that hands chunks to a queue
+    """
+
+    def __init__(self, chunks):
+        """
+        constructor
+        """
+        self.chunks = chunks
+        self.buffer = bytearray()
+        self.cancelled = threading.Event()
+
+    def write(self, data):
+        """
+        buffers COPY output and queues it in COPY_CHUNK_SIZE chunks
+        """
+        if self.cancelled.is_set():
+            raise IOError("COPY output cancelled by the client")
+        self.buffer += data.encode() if isinstance(data, str) else data
+        if len(self.buffer) >= COPY_CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        """
+        queues the buffered output, blocking while the queue is full
+        """
+        if self.buffer:
+            self.put(bytes(self.buffer))
+            self.buffer.clear()
+
+    def put(self, item):
+        """
+        queues item unless the client went away
+        """
+        while not self.cancelled.is_set():
+            try:
+                self.chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+
+_COPY_DONE = object()
+
+
+def copy_query(sql, payload):
+    """
+    Service function to stream a SELECT as CSV with COPY ... TO STDOUT
+
+    The COPY runs on its own pooled connection in a background thread and its
+    output is passed through a bounded queue, so rows are never materialized
+    in Python. 'data' is an iterator over CSV byte chunks.
+    """
+
+    conn_pool = app.conn
+    conn = conn_pool.getconn()
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            select = cursor.mogrify(sql.strip().rstrip(";"), payload).decode()
+    except DatabaseError as err:
+        conn_pool.putconn(conn)
+        logging.error(emoji.emojize("Error preparing COPY :cross_mark:"))
+        return {"status": STATUS_ERR, "error": err}
+
+    copy_sql = f"COPY ({select}) TO STDOUT WITH CSV HEADER"
+    writer = _CopyWriter(queue.Queue(maxsize=COPY_QUEUE_SIZE))
+    threading.Thread(
+        target=_run_copy,
+        args=(conn_pool, conn, copy_sql, writer),
+        name="copy",
+        daemon=True,
+    ).start()
+
+    # waits for the first chunk so errors can still be reported
+    first = writer.chunks.get()
+    if isinstance(first, Exception):
+        return {"status": STATUS_ERR, "error": first}
+
+    return {"status": STATUS_OK, "data": _CopyStream(first, writer)}
+
+
+def _run_copy(conn_pool, conn, copy_sql, writer):
+    """
+    runs COPY into writer and releases the connection
+    """
+
+    failed = False
+    try:
+        with conn.cursor() as cursor:
+            cursor.copy_expert(copy_sql, writer, size=COPY_CHUNK_SIZE)
+        writer.flush()
+        writer.put(_COPY_DONE)
+    except Exception as err:  # pylint: disable=broad-exception-caught
+        failed = True
+        if not writer.cancelled.is_set():
+            logging.error(emoji.emojize("Error copying data :cross_mark:"))
+        writer.put(err)
+    finally:
+        # a COPY aborted midway leaves the connection unusable
+        conn_pool.putconn(conn, close=failed)
+
+
+class _CopyStream:
+    """
+    Iterator over COPY output chunks
+
+    close() cancels the copy even if iteration never started, so the COPY
+    thread stops waiting on a full queue and releases its connection.
+    """
+
+    def __init__(self, first, writer):
+        """
+        constructor
+        """
+        self.pending = first
+        self.writer = writer
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.writer.cancelled.is_set():
+            raise StopIteration
+        chunk = self.pending
+        self.pending = None
+        if chunk is None:
+            chunk = self.writer.chunks.get()
+        if chunk is _COPY_DONE or isinstance(chunk, Exception):
+            # after an error the headers are already sent, the response ends early
+            self.close()
+            raise StopIteration
+        return chunk
+
+    def close(self):
+        """
+        cancels the copy and drops the chunks still queued
+        """
+        self.writer.cancelled.set()
+        try:
+            while True:
+                self.writer.chunks.get_nowait()
+        except queue.Empty:
+            pass
+
+
+def copy_line(values):
+    """
+    returns one CSV line for COPY ... FROM STDIN WITH CSV
+
+    COPY reads an unquoted empty field as NULL, so only None is written that
+    way and every other value is quoted, keeping empty strings empty.
+    """
+    fields = (
+        "" if value is None else '"' + str(value).replace('"', '""') + '"'
+        for value in values
+    )
+    return ",".join(fields) + "\n"
+
+
+def copy_in_query(setup_sql, copy_sql, source, merge_sql):
+    """
+    Service function to load rows with COPY ... FROM STDIN
+
+    setup_sql (e.g. a staging table), the COPY reading from source and
+    merge_sql run in one transaction; nothing is kept if any of them fails.
+    'data' is the rows returned by merge_sql.
+    """
+
+    conn_pool = app.conn
+    conn = conn_pool.getconn()
+    failed = False
+    try:
+        conn.autocommit = False
+        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(setup_sql)
+            cursor.copy_expert(copy_sql, source, size=COPY_CHUNK_SIZE)
+            cursor.execute(merge_sql)
+            data = cursor.fetchall()
+        conn.commit()
+        return {"status": STATUS_OK, "data": data}
+    except Exception as err:  # pylint: disable=broad-exception-caught
+        # source may abort the COPY by raising from read()
+        failed = True
+        logging.error(emoji.emojize("Error loading data :cross_mark:"))
+        return {"status": STATUS_ERR, "error": err}
+    finally:
+        # an aborted COPY can leave the connection unusable
+        conn_pool.putconn(conn, close=failed)
+
+
+def bulk_link_query(table, keys, parents, pairs):
+    """
+    Service function to insert many rows of a link table in one statement
+
+    parameter keys = (parent key, child key) columns, e.g. movie_id, actor_id
+    parameter parents = tables the keys reference, e.g. movie, actor
+    parameter pairs = [(parent id, child id), ...]
+
+    Pairs are passed as two arrays and unnested. Unknown IDs, duplicates in
+    the request and existing links are skipped. 'data' holds the number of
+    inserted rows and one item per pair with its error, if any.
+    """
+
+    first, second = keys
+    sql = f"""
+        WITH input AS (
+            SELECT ord, {first}, {second}
+            FROM unnest(%(first)s::bigint[], %(second)s::bigint[])
+                WITH ORDINALITY AS i({first}, {second}, ord)
+        ),
+        checked AS (
+            SELECT i.ord, i.{first}, i.{second},
+                CASE
+                    WHEN p.{first} IS NULL THEN 'unknown {first}'
+                    WHEN c.{second} IS NULL THEN 'unknown {second}'
+                    WHEN l.{first} IS NOT NULL THEN 'already linked'
+                    WHEN i.ord > min(i.ord) OVER (PARTITION BY i.{first}, i.{second})
+                        THEN 'duplicate in request'
+                END AS error
+            FROM input i
+            LEFT JOIN {SCHEMA_NAME}.{parents[0]} p ON p.{first} = i.{first}
+            LEFT JOIN {SCHEMA_NAME}.{parents[1]} c ON c.{second} = i.{second}
+            LEFT JOIN {SCHEMA_NAME}.{table} l
+                ON l.{first} = i.{first} AND l.{second} = i.{second}
+        ),
+        inserted AS (
+            INSERT INTO {SCHEMA_NAME}.{table} ({first}, {second})
+            SELECT {first}, {second} FROM checked WHERE error IS NULL
+            ON CONFLICT DO NOTHING
+            RETURNING {first}, {second}
+        )
+        SELECT c.{first}, c.{second},
+            CASE WHEN c.error IS NULL AND n.{first} IS NULL
+                THEN 'already linked' ELSE c.error END AS error
+        FROM checked c
+        LEFT JOIN inserted n ON n.{first} = c.{first} AND n.{second} = c.{second}
+            AND c.error IS NULL
+        ORDER BY c.ord;"""
+    params = {
+        "first": [pair[0] for pair in pairs],
+        "second": [pair[1] for pair in pairs],
+    }
+
+    result = do_query(sql, params)
+    if result["status"] != STATUS_OK:
+        return result
+
+    items = result["data"]
+    inserted = sum(1 for item in items if item["error"] is None)
+    return {"status": STATUS_OK, "data": {"inserted": inserted, "items": items}}
+
+
+def replace_links_query(table, keys, parents, parent_id, child_ids):
+    """
+    Service function making child_ids the full set of links of one parent
+
+    Only the difference is written: links not in child_ids are deleted and
+    missing ones inserted, in a single statement. Nothing changes if the
+    parent or any child doesn't exist. 'data' holds the added and removed
+    child IDs.
+    """
+
+    first, second = keys
+    sql = f"""
+        WITH desired AS (
+            SELECT DISTINCT d.id AS {second}, c.{second} IS NOT NULL AS known
+            FROM unnest(%(ids)s::bigint[]) AS d(id)
+            LEFT JOIN {SCHEMA_NAME}.{parents[1]} c ON c.{second} = d.id
+        ),
+        valid AS (
+            SELECT EXISTS (
+                SELECT 1 FROM {SCHEMA_NAME}.{parents[0]} WHERE {first} = %(id)s
+            ) AS parent_known,
+            NOT EXISTS (SELECT 1 FROM desired WHERE NOT known) AS children_known
+        ),
+        removed AS (
+            DELETE FROM {SCHEMA_NAME}.{table}
+            WHERE {first} = %(id)s AND {second} <> ALL(%(ids)s::bigint[])
+                AND (SELECT parent_known AND children_known FROM valid)
+            RETURNING {second}
+        ),
+        added AS (
+            INSERT INTO {SCHEMA_NAME}.{table} ({first}, {second})
+            SELECT %(id)s, d.{second} FROM desired d
+            WHERE (SELECT parent_known AND children_known FROM valid)
+                AND NOT EXISTS (
+                    SELECT 1 FROM {SCHEMA_NAME}.{table} l
+                    WHERE l.{first} = %(id)s AND l.{second} = d.{second}
+                )
+            ON CONFLICT DO NOTHING
+            RETURNING {second}
+        )
+        SELECT v.parent_known,
+            ARRAY(SELECT {second} FROM desired WHERE NOT known ORDER BY 1) AS unknown,
+            ARRAY(SELECT {second} FROM added ORDER BY 1) AS added,
+            ARRAY(SELECT {second} FROM removed ORDER BY 1) AS removed
+        FROM valid v;"""
+    params = {"id": parent_id, "ids": list(child_ids)}
+
+    result = do_query(sql, params)
+    if result["status"] != STATUS_OK:
+        return result
+
+    row = result["data"][0]
+    if not row["parent_known"]:
+        return {"status": STATUS_BAD_REQUEST, "error": f"Unknown {first} {parent_id}"}
+    if row["unknown"]:
+        return {
+            "status": STATUS_BAD_REQUEST,
+            "error": f"Unknown {second} {', '.join(map(str, row['unknown']))}",
+        }
+    return {
+        "status": STATUS_OK,
+        "data": {"added": row["added"], "removed": row["removed"]},
+    }
+
+
+def delete_sql(table, key, dependents, returning="*"):
+    """
+    returns one statement deleting the rows of table whose key is in the
+    %(ids)s array, after the rows of dependent tables referencing them
+
+    parameter dependents = tables holding key as a foreign key
+    """
+
+    ctes = ",\n".join(f"""{dependent} AS (
+            DELETE FROM {SCHEMA_NAME}.{dependent} WHERE {key} = ANY(%(ids)s::bigint[])
+        )""" for dependent in dependents)
+    with_clause = f"WITH {ctes}" if ctes else ""
+    # foreign keys are checked at the end of the statement, once the
+    # dependent rows are gone
+    return f"""
+        {with_clause}
+        DELETE FROM {SCHEMA_NAME}.{table} WHERE {key} = ANY(%(ids)s::bigint[])
+        RETURNING {returning};"""
+
+
+def bulk_delete_query(table, key, dependents, ids, *, progress=None):
+    """
+    Service function to delete many rows by key with their dependent rows
+
+    IDs are deleted BULK_DELETE_BATCH at a time, one statement and
+    transaction per batch, so locks are held briefly. If a batch fails, the batches before
+    it stay deleted; deleting the same IDs again is safe. 'data' holds the
+    deleted keys and the ones that didn't exist.
+
+    parameter progress = function called with the number of IDs of each
+    batch done, e.g. a job's progress
+    """
+
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        return {"status": STATUS_BAD_REQUEST, "error": f"No {key} values given"}
+
+    sql = delete_sql(table, key, dependents, returning=key)
+    deleted = []
+    for start in range(0, len(ids), BULK_DELETE_BATCH):
+        batch = ids[start : start + BULK_DELETE_BATCH]
+        result = do_query(sql, {"ids": batch})
+        if result["status"] != STATUS_OK:
+            return result
+        deleted += [row[key] for row in result["data"]]
+        if progress is not None:
+            progress(len(batch))
+
+    found = set(deleted)
+    data = {
+        "deleted": sorted(deleted),
+        "not_found": [id_ for id_ in ids if id_ not in found],
+    }
+    return {"status": STATUS_OK, "data": data}
+
+
+def patch_query(table, key, id_, changes):
+    """
+    Service function updating only the given columns of one row
+
+    The row is written only if a value actually differs, so an unchanged
+    patch creates no new row version and no change log entry. 'data' holds
+    the row and whether it changed.
+    """
+
+    columns = COLUMNS[table]
+    unknown = [column for column in changes if column not in columns or column == key]
+    if unknown:
+        return {
+            "status": STATUS_BAD_REQUEST,
+            "error": f"Unknown column {', '.join(unknown)}",
+        }
+    if not changes:
+        return {"status": STATUS_BAD_REQUEST, "error": "No columns to update"}
+
+    # values are typed by the table's own row type, so a number sent for a
+    # varchar column compares and stores like the text the column holds
+    params = {"id": id_, "changes": json.dumps(changes, default=str)}
+    assignments = ", ".join(f"{column} = new.{column}" for column in changes)
+    current = ", ".join(f"t.{column}" for column in changes)
+    values = ", ".join(f"new.{column}" for column in changes)
+    sql = f"""
+        WITH new AS (
+            SELECT {", ".join(changes)} FROM jsonb_populate_record(
+                NULL::{SCHEMA_NAME}.{table}, %(changes)s::jsonb
+            )
+        ), updated AS (
+            UPDATE {SCHEMA_NAME}.{table} t SET {assignments}
+            FROM new
+            WHERE t.{key} = %(id)s AND ROW({current}) IS DISTINCT FROM ROW({values})
+            RETURNING t.*
+        )
+        SELECT updated.*, true AS changed FROM updated
+        UNION ALL
+        SELECT t.*, false AS changed FROM {SCHEMA_NAME}.{table} t
+        WHERE t.{key} = %(id)s AND NOT EXISTS (SELECT 1 FROM updated);"""
+
+    result = do_query(sql, params)
+    if result["status"] != STATUS_OK:
+        return result
+    if not result["data"]:
+        return {"status": STATUS_NOT_FOUND, "error": f"No {table} with {key} {id_}"}
+
+    row = dict(result["data"][0])
+    changed = row.pop("changed")
+    return {"status": STATUS_OK, "data": {"changed": changed, "row": row}}
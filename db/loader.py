@@ -0,0 +1,400 @@
+"""
+Parallel loader for movie datasets
+
+Loads a CSV laid out like the IMDB top-1000 style datasets (Title, Genre,
+Description, Director, Actors, Year, Runtime (Minutes), Rating, Votes,
+Revenue (Millions), Metascore) into movie, genre, director, actor and their
+link tables. Genre, director and actor cells may hold comma separated names.
+
+Names are deduplicated in memory and matched against the rows already in the
+database, and the IDs of new rows are drawn from the table sequences up
+front, so every row and link is known before anything is written. The
+secondary indexes of the target tables are dropped, the tables are filled
+with COPY over several pool connections at once, parents before links, and
+the indexes are built again at the end. Primary keys and foreign keys stay.
+
+Every chunk commits on its own: a failed load leaves the chunks already
+copied in place.
+
+usage: python -m db.loader movies.csv [--jobs 4] [--chunk-rows 100000]
+"""
+
+import argparse
+import csv
+import io
+import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from db.Connection import Connection
+from db.db_utils import copy_line
+from constants.constants import (
+    ACTOR,
+    DIRECTOR,
+    GENRE,
+    LOADER_CHUNK_ROWS,
+    LOADER_JOBS,
+    MOVIE,
+    MOVIE_ACTOR,
+    MOVIE_DIRECTOR,
+    MOVIE_GENRE,
+    SCHEMA_NAME,
+)
+
+# normalized dataset header => record field
+HEADERS = {
+    "title": "title",
+    "genre": "genres",
+    "genres": "genres",
+    "description": "description",
+    "director": "directors",
+    "directors": "directors",
+    "actors": "actors",
+    "stars": "actors",
+    "year": "movie_year",
+    "runtime": "runtime",
+    "rating": "rating",
+    "votes": "votes",
+    "revenue": "revenue",
+    "metascore": "metascore",
+}
+
+# table => (key column, columns written), parents first
+TABLES = {
+    GENRE: ("genre_id", ("genre_id", "name")),
+    DIRECTOR: ("director_id", ("director_id", "first_name", "last_name")),
+    ACTOR: ("actor_id", ("actor_id", "first_name", "last_name")),
+    MOVIE: (
+        "movie_id",
+        (
+            "movie_id",
+            "title",
+            "description",
+            "movie_year",
+            "rating",
+            "runtime",
+            "votes",
+            "revenue",
+            "metascore",
+        ),
+    ),
+}
+
+# link table => (child table, record field holding the child names)
+LINKS = {
+    MOVIE_GENRE: (GENRE, "genres"),
+    MOVIE_DIRECTOR: (DIRECTOR, "directors"),
+    MOVIE_ACTOR: (ACTOR, "actors"),
+}
+
+
+def normalize_header(header):
+    """
+    returns the record field of a dataset header, None for other columns
+    """
+    name = re.sub(r"\(.*?\)", "", header).strip().lower().replace(" ", "_")
+    return HEADERS.get(name)
+
+
+def split_names(cell):
+    """
+    returns the distinct names of a comma separated cell, in order
+    """
+    names = (name.strip() for name in (cell or "").split(","))
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def split_person(name):
+    """
+    returns (first name, last name) of a full name
+    """
+    first, _, last = name.partition(" ")
+    return first, " ".join(last.split())
+
+
+def number(value):
+    """
+    returns a numeric cell without thousands separators, None if empty
+    """
+    value = (value or "").replace(",", "").strip()
+    return value or None
+
+
+def read_records(lines):
+    """
+    returns an iterator of one record per dataset row with the fields of
+    HEADERS, raises ValueError if there is no header row
+    """
+    reader = csv.reader(lines)
+    headers = next(reader, None)
+    if headers is None:
+        raise ValueError("the dataset is empty, expected a header row")
+    return parse_rows(reader, [normalize_header(header) for header in headers])
+
+
+def parse_rows(reader, fields):
+    """
+    yields the record of each row of reader, cells named by fields
+    """
+    for row in reader:
+        record = {field: value for field, value in zip(fields, row) if field}
+        year = number(record.get("movie_year"))
+        yield {
+            "title": record.get("title", "").strip(),
+            "description": record.get("description", "").strip(),
+            "movie_year": f"{year}-01-01" if year else None,
+            "rating": number(record.get("rating")),
+            "runtime": number(record.get("runtime")),
+            "votes": number(record.get("votes")),
+            "revenue": number(record.get("revenue")),
+            "metascore": number(record.get("metascore")),
+            "genres": split_names(record.get("genres")),
+            "directors": split_names(record.get("directors")),
+            "actors": split_names(record.get("actors")),
+        }
+
+
+def name_key(table, name):
+    """
+    returns the key identifying a name in table
+    """
+    if table == GENRE:
+        return name
+    return split_person(name)
+
+
+def new_names(records, ids):
+    """
+    returns {table: [name keys]} of the names of records not in ids
+    """
+    new = {table: {} for table in ids}
+    for record in records:
+        for table, field in LINKS.values():
+            for name in record[field]:
+                key = name_key(table, name)
+                if key not in ids[table]:
+                    new[table][key] = True
+    return {table: list(keys) for table, keys in new.items()}
+
+
+def build(records, existing, allocate):
+    """
+    returns {table: rows} for every table of the load
+
+    parameter existing = {table: {name key: id}} of genre, director and actor
+    parameter allocate = function(table, count) returning count new IDs
+    """
+    records = list(records)
+    ids = {table: dict(existing.get(table, {})) for table in (GENRE, DIRECTOR, ACTOR)}
+
+    rows = {}
+    for table, keys in new_names(records, ids).items():
+        for key, id_ in zip(keys, allocate(table, len(keys))):
+            ids[table][key] = id_
+        if table == GENRE:
+            rows[table] = [(ids[table][key], key) for key in keys]
+        else:
+            rows[table] = [(ids[table][key], *key) for key in keys]
+
+    movie_ids = allocate(MOVIE, len(records))
+    columns = TABLES[MOVIE][1][1:]
+    rows[MOVIE] = [
+        (movie_id, *(record[column] for column in columns))
+        for movie_id, record in zip(movie_ids, records)
+    ]
+    for link, (table, field) in LINKS.items():
+        # names differing only in spacing resolve to the same row
+        rows[link] = [
+            (movie_id, child_id)
+            for movie_id, record in zip(movie_ids, records)
+            for child_id in dict.fromkeys(
+                ids[table][name_key(table, name)] for name in record[field]
+            )
+        ]
+    return rows
+
+
+class Loader:
+    """
+    Writes the rows of a load over a pool of connections
+    """
+
+    def __init__(self, conn_pool, jobs=LOADER_JOBS, chunk_rows=LOADER_CHUNK_ROWS):
+        """
+        constructor
+        """
+        self.conn_pool = conn_pool
+        self.jobs = jobs
+        self.chunk_rows = chunk_rows
+
+    def run(self, sql, params=None):
+        """
+        runs one statement on its own connection, returns the rows
+        """
+        conn = self.conn_pool.getconn()
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(sql, params)
+                return cursor.fetchall() if cursor.description else []
+        finally:
+            self.conn_pool.putconn(conn)
+
+    def existing(self):
+        """
+        returns {table: {name key: id}} of the names already stored
+        """
+        names = {}
+        for table, (_, columns) in TABLES.items():
+            if table == MOVIE:
+                continue
+            rows = self.run(f"SELECT {', '.join(columns)} FROM {SCHEMA_NAME}.{table};")
+            if table == GENRE:
+                names[table] = {row[1]: row[0] for row in rows}
+            else:
+                names[table] = {(row[1], row[2]): row[0] for row in rows}
+        return names
+
+    def allocate(self, table, count):
+        """
+        draws count new IDs from the sequence of table
+        """
+        if not count:
+            return []
+        key = TABLES[table][0]
+        rows = self.run(
+            """SELECT nextval(pg_get_serial_sequence(%(table)s, %(key)s))
+            FROM generate_series(1, %(count)s);""",
+            {"table": f"{SCHEMA_NAME}.{table}", "key": key, "count": count},
+        )
+        return [row[0] for row in rows]
+
+    def copy(self, table, columns, rows):
+        """
+        copies one chunk of rows into table in its own transaction
+        """
+        # quoted by copy_line, an empty title stays an empty string, not NULL
+        buffer = io.StringIO("".join(copy_line(row) for row in rows))
+        conn = self.conn_pool.getconn()
+        failed = True
+        try:
+            conn.autocommit = False
+            with conn.cursor() as cursor:
+                cursor.copy_expert(
+                    f"COPY {SCHEMA_NAME}.{table} ({', '.join(columns)}) "
+                    "FROM STDIN WITH CSV",
+                    buffer,
+                )
+            conn.commit()
+            failed = False
+            return len(rows)
+        finally:
+            # a failed COPY leaves the transaction aborted, the connection goes
+            self.conn_pool.putconn(conn, close=failed)
+
+    def copy_all(self, tables):
+        """
+        copies {table: (columns, rows)} in parallel chunks, returns the
+        number of rows per table
+        """
+        with ThreadPoolExecutor(self.jobs, thread_name_prefix="loader") as executor:
+            futures = [
+                (
+                    table,
+                    executor.submit(
+                        self.copy, table, columns, rows[start : start + self.chunk_rows]
+                    ),
+                )
+                for table, (columns, rows) in tables.items()
+                for start in range(0, len(rows), self.chunk_rows)
+            ]
+            counts = dict.fromkeys(tables, 0)
+            for table, future in futures:
+                counts[table] += future.result()
+        return counts
+
+    def drop_indexes(self, tables):
+        """
+        drops the indexes of tables not backing a constraint, returns their
+        definitions
+        """
+        rows = self.run(
+            """SELECT i.indexrelid::regclass::text, pg_get_indexdef(i.indexrelid)
+            FROM pg_index i
+            JOIN pg_class t ON t.oid = i.indrelid
+            JOIN pg_namespace n ON n.oid = t.relnamespace
+            WHERE n.nspname = %(schema)s AND t.relname = ANY(%(tables)s)
+                AND NOT EXISTS (
+                    SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid
+                );""",
+            {"schema": SCHEMA_NAME, "tables": list(tables)},
+        )
+        for name, _ in rows:
+            self.run(f"DROP INDEX IF EXISTS {name};")
+        return [definition for _, definition in rows]
+
+    def build_indexes(self, definitions):
+        """
+        builds indexes in parallel, one connection each
+        """
+        with ThreadPoolExecutor(self.jobs, thread_name_prefix="loader") as executor:
+            list(executor.map(self.run, definitions))
+
+    def load(self, records):
+        """
+        loads dataset records, returns the number of rows per table
+        """
+        rows = build(records, self.existing(), self.allocate)
+        columns = {table: definition[1] for table, definition in TABLES.items()}
+        columns.update(
+            {link: ("movie_id", f"{child}_id") for link, (child, _) in LINKS.items()}
+        )
+
+        definitions = self.drop_indexes([*TABLES, *LINKS])
+        try:
+            counts = self.copy_all(
+                {table: (columns[table], rows[table]) for table in TABLES}
+            )
+            counts.update(
+                self.copy_all({link: (columns[link], rows[link]) for link in LINKS})
+            )
+        finally:
+            # indexes come back even if the load failed half way
+            self.build_indexes(definitions)
+        for table in counts:
+            self.run(f"ANALYZE {SCHEMA_NAME}.{table};")
+        return counts
+
+
+def main():
+    """
+    loads a dataset file into the configured database
+    """
+    parser = argparse.ArgumentParser(description="Load a movie dataset CSV")
+    parser.add_argument("path", help="dataset CSV file")
+    parser.add_argument("--jobs", type=int, default=LOADER_JOBS)
+    parser.add_argument("--chunk-rows", type=int, default=LOADER_CHUNK_ROWS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    started = time.monotonic()
+    loader = Loader(Connection(1, args.jobs), args.jobs, args.chunk_rows)
+    with open(args.path, encoding="utf-8", newline="") as file:
+        try:
+            dataset = read_records(file)
+        except ValueError as err:
+            parser.error(f"{args.path}: {err}")
+        counts = loader.load(dataset)
+    elapsed = time.monotonic() - started
+
+    total = sum(counts.values())
+    for table, count in counts.items():
+        print(f"{table:>16}: {count} rows")
+    print(
+        f"Loaded {total} rows in {elapsed:.1f}s ({total / max(elapsed, 1e-9):.0f} rows/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""
+Runner applying the schema migrations of db.migrations
+
+Applied versions are recorded in the schema_migration table. Pending
+migrations run in version order: the statements of a migration in one
+transaction, then its indexes one at a time with CREATE INDEX CONCURRENTLY,
+so tables stay writable while they build. An index build that was
+interrupted leaves an invalid index behind, it is dropped and built again on
+the next run.
+
+A session advisory lock keeps two runners from migrating at once, the second
+one waits and finds the migrations applied.
+
+usage: python -m db.migrate [--list] [--target VERSION]
+"""
+
+import argparse
+import importlib
+import logging
+import pkgutil
+import re
+import time
+
+from db import migrations
+from db.Connection import Connection
+from constants.constants import SCHEMA_NAME
+
+SCHEMA_MIGRATION = "schema_migration"
+MODULE_NAME = re.compile(r"v(\d+)_(\w+)")
+
+# advisory lock key held while migrating
+LOCK_KEY = 4_246_813
+
+
+def ddl(schema):
+    """
+    returns the statement creating the table of applied versions
+    """
+    return f"""
+        CREATE TABLE IF NOT EXISTS {schema}.{SCHEMA_MIGRATION} (
+            version integer PRIMARY KEY,
+            name text NOT NULL,
+            applied_at timestamptz NOT NULL DEFAULT now()
+        );"""
+
+
+def discover(package=migrations):
+    """
+    returns [(version, name, module)] of the migrations in package, in order
+    """
+    found = {}
+    for info in pkgutil.iter_modules(package.__path__):
+        match = MODULE_NAME.fullmatch(info.name)
+        if match is None:
+            continue
+        version = int(match.group(1))
+        if version in found:
+            raise ValueError(
+                f"Migrations {found[version][1]} and {info.name} share version {version}"
+            )
+        module = importlib.import_module(f"{package.__name__}.{info.name}")
+        found[version] = (version, info.name, module)
+    return [found[version] for version in sorted(found)]
+
+
+def index_name(table, columns):
+    """
+    returns the name of the index of table on columns
+    """
+    return f"{table}_{'_'.join(columns)}"
+
+
+def index_sql(schema, table, columns):
+    """
+    returns the statement building an index online
+    """
+    return (
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name(table, columns)} "
+        f"ON {schema}.{table} ({', '.join(columns)});"
+    )
+
+
+class Migrator:
+    """
+    Applies migrations over one connection of a pool
+    """
+
+    def __init__(self, conn_pool, schema=SCHEMA_NAME):
+        """
+        constructor
+        """
+        self.conn_pool = conn_pool
+        self.schema = schema
+        self.conn = None
+
+    def run(self, sql, params=None):
+        """
+        runs one statement outside a transaction, returns the rows
+        """
+        self.conn.autocommit = True
+        with self.conn.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall() if cursor.description else []
+
+    def transaction(self, statements):
+        """
+        runs statements in one transaction
+        """
+        self.conn.autocommit = False
+        try:
+            with self.conn.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    def applied(self):
+        """
+        returns the applied versions
+        """
+        rows = self.run(f"SELECT version FROM {self.schema}.{SCHEMA_MIGRATION};")
+        return {row[0] for row in rows}
+
+    def build_index(self, table, columns):
+        """
+        builds one index online, replacing an invalid one left by an
+        interrupted build
+        """
+        name = f"{self.schema}.{index_name(table, columns)}"
+        rows = self.run(
+            """SELECT indisvalid FROM pg_index
+            WHERE indexrelid = to_regclass(%(name)s);""",
+            {"name": name},
+        )
+        if rows and not rows[0][0]:
+            logging.warning("dropping invalid index %s", name)
+            self.run(f"DROP INDEX CONCURRENTLY IF EXISTS {name};")
+        self.run(index_sql(self.schema, table, columns))
+
+    def apply(self, version, name, module):
+        """
+        applies one migration and records its version
+        """
+        statements = getattr(module, "statements", None)
+        if statements is not None:
+            self.transaction(statements(self.schema))
+        for table, columns in getattr(module, "INDEXES", ()):
+            self.build_index(table, columns)
+        self.run(
+            f"""INSERT INTO {self.schema}.{SCHEMA_MIGRATION} (version, name)
+            VALUES (%(version)s, %(name)s);""",
+            {"version": version, "name": name},
+        )
+
+    def migrate(self, pending=None, target=None, report=None):
+        """
+        applies the migrations not applied yet, up to target, returns the
+        versions applied
+
+        parameter report = function(name, seconds) called after each
+        """
+        pending = discover() if pending is None else pending
+        self.conn = self.conn_pool.getconn()
+        try:
+            self.run("SELECT pg_advisory_lock(%(key)s);", {"key": LOCK_KEY})
+            try:
+                self.run(ddl(self.schema))
+                applied = self.applied()
+                done = []
+                for version, name, module in pending:
+                    if version in applied or (target is not None and version > target):
+                        continue
+                    started = time.monotonic()
+                    self.apply(version, name, module)
+                    done.append(version)
+                    if report is not None:
+                        report(name, time.monotonic() - started)
+                return done
+            finally:
+                self.run("SELECT pg_advisory_unlock(%(key)s);", {"key": LOCK_KEY})
+        finally:
+            self.conn_pool.putconn(self.conn)
+            self.conn = None
+
+    def status(self, pending=None):
+        """
+        returns [(version, name, applied)] of every migration
+        """
+        pending = discover() if pending is None else pending
+        self.conn = self.conn_pool.getconn()
+        try:
+            self.run(ddl(self.schema))
+            applied = self.applied()
+        finally:
+            self.conn_pool.putconn(self.conn)
+            self.conn = None
+        return [(version, name, version in applied) for version, name, _ in pending]
+
+
+def main():
+    """
+    applies the pending migrations to the configured database
+    """
+    parser = argparse.ArgumentParser(description="Apply schema migrations")
+    parser.add_argument(
+        "--list", action="store_true", help="show the migrations and exit"
+    )
+    parser.add_argument(
+        "--target", type=int, help="apply migrations up to this version"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    migrator = Migrator(Connection(1, 1))
+    if args.list:
+        for _, name, applied in migrator.status():
+            print(f"{'applied' if applied else 'pending':>8}  {name}")
+        return
+
+    done = migrator.migrate(
+        target=args.target,
+        report=lambda name, seconds: print(f"applied {name} in {seconds:.1f}s"),
+    )
+    print(f"{len(done)} migrations applied in {SCHEMA_NAME}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+"""
+Versioned schema migrations, applied in order by db.migrate
+
+Every module vNNNN_<name>.py is one migration, NNNN its version. A migration
+may define
+
+    statements(schema)  returns SQL statements run in one transaction
+    INDEXES             (table, columns) pairs built online afterwards
+
+Migrations are forward-only: a change to an applied migration is a new
+migration. The version is recorded only after the indexes are built, so the
+statements of a migration with indexes must be safe to run again.
+"""
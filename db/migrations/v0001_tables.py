@@ -0,0 +1,86 @@
+"""
+Entity, link and review tables
+
+Link and review rows go with the movie, actor, director or genre they point
+at.
+"""
+
+from constants.constants import (
+    ACTOR,
+    DIRECTOR,
+    GENRE,
+    MOVIE,
+    MOVIE_ACTOR,
+    MOVIE_DIRECTOR,
+    MOVIE_GENRE,
+    MOVIE_REVIEW,
+)
+
+
+def link(schema, table, child):
+    """
+    returns the statement creating the link table of movie and child
+    """
+    return f"""
+        CREATE TABLE IF NOT EXISTS {schema}.{table} (
+            movie_id bigint NOT NULL
+                REFERENCES {schema}.{MOVIE} (movie_id) ON DELETE CASCADE,
+            {child}_id bigint NOT NULL
+                REFERENCES {schema}.{child} ({child}_id) ON DELETE CASCADE,
+            created_at timestamp NOT NULL DEFAULT now(),
+            PRIMARY KEY (movie_id, {child}_id)
+        );"""
+
+
+def statements(schema):
+    """
+    returns the statements creating the tables
+    """
+    return [
+        f"""
+        CREATE TABLE IF NOT EXISTS {schema}.{MOVIE} (
+            movie_id bigserial PRIMARY KEY,
+            title varchar NOT NULL,
+            description varchar(1000),
+            movie_year date,
+            rating numeric,
+            runtime numeric,
+            votes varchar(20),
+            revenue numeric,
+            metascore varchar,
+            created_at timestamp NOT NULL DEFAULT now()
+        );""",
+        f"""
+        CREATE TABLE IF NOT EXISTS {schema}.{ACTOR} (
+            actor_id bigserial PRIMARY KEY,
+            first_name varchar,
+            last_name varchar,
+            gender varchar,
+            age int,
+            created_at timestamp NOT NULL DEFAULT now()
+        );""",
+        f"""
+        CREATE TABLE IF NOT EXISTS {schema}.{DIRECTOR} (
+            director_id bigserial PRIMARY KEY,
+            first_name varchar,
+            last_name varchar,
+            created_at timestamp NOT NULL DEFAULT now()
+        );""",
+        f"""
+        CREATE TABLE IF NOT EXISTS {schema}.{GENRE} (
+            genre_id bigserial PRIMARY KEY,
+            name varchar NOT NULL,
+            created_at timestamp NOT NULL DEFAULT now()
+        );""",
+        link(schema, MOVIE_ACTOR, ACTOR),
+        link(schema, MOVIE_DIRECTOR, DIRECTOR),
+        link(schema, MOVIE_GENRE, GENRE),
+        f"""
+        CREATE TABLE IF NOT EXISTS {schema}.{MOVIE_REVIEW} (
+            review_id bigserial PRIMARY KEY,
+            movie_id bigint NOT NULL
+                REFERENCES {schema}.{MOVIE} (movie_id) ON DELETE CASCADE,
+            review integer,
+            created_at timestamp NOT NULL DEFAULT now()
+        );""",
+    ]
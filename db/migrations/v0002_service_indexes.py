@@ -0,0 +1,32 @@
+"""
+Foreign key and lookup indexes of the service queries
+
+The primary keys of the link tables lead with movie_id, so lookups and
+deletes by movie are covered already. Lookups and cascading deletes by the
+other side of a link, and reviews by movie, need their own index. Names are
+looked up by exact search and when the loader matches a dataset against the
+stored rows.
+"""
+
+from constants.constants import (
+    ACTOR,
+    DIRECTOR,
+    GENRE,
+    MOVIE,
+    MOVIE_ACTOR,
+    MOVIE_DIRECTOR,
+    MOVIE_GENRE,
+    MOVIE_REVIEW,
+)
+
+INDEXES = (
+    (MOVIE_ACTOR, ("actor_id",)),
+    (MOVIE_DIRECTOR, ("director_id",)),
+    (MOVIE_GENRE, ("genre_id",)),
+    (MOVIE_REVIEW, ("movie_id",)),
+    (MOVIE, ("title",)),
+    (MOVIE, ("movie_year",)),
+    (ACTOR, ("last_name", "first_name")),
+    (DIRECTOR, ("last_name", "first_name")),
+    (GENRE, ("name",)),
+)
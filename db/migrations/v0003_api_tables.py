@@ -0,0 +1,16 @@
+"""
+Idempotency key and job tables
+
+Both are used by endpoints enabled by default. The change log and the write
+ack table stay with their own installers, they are only needed when delta
+sync or buffered review inserts are turned on.
+"""
+
+from api import idempotency, jobs
+
+
+def statements(schema):
+    """
+    returns the statements creating the tables
+    """
+    return [idempotency.ddl(schema), jobs.ddl(schema)]
@@ -0,0 +1,334 @@
+"""
+Write-behind buffering of inserts
+
+Submissions are queued in-process and written in multi-row batches by one
+flusher thread, as soon as WRITE_BEHIND_BATCH_SIZE rows are waiting or
+WRITE_BEHIND_INTERVAL seconds after the first one arrived. The queue is
+bounded: a full queue rejects new rows so the caller can answer 429. Rows
+still queued are flushed when the process exits.
+
+A flush rejects single rows it can't write. When the whole batch fails,
+the database is likely unavailable: the batch is kept and retried after a
+backoff doubling up to WRITE_BEHIND_MAX_BACKOFF seconds, its rows staying
+pending while new ones wait in the queue.
+
+Every submission gets an ack token. The flush records the token and the new
+key in write_ack in the same statement as the rows, so any worker can
+confirm a write was persisted, not only the one that accepted it.
+
+usage: python -m db.write_behind    (installs the write_ack table)
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import emoji
+
+from db.Connection import Connection
+from db.db_utils import do_query
+from db.Query import Query
+from constants.constants import (
+    SCHEMA_NAME,
+    STATUS_NOT_FOUND,
+    STATUS_OK,
+    WRITE_ACK_ENTRIES,
+    WRITE_ACK_TTL,
+    WRITE_BEHIND_BATCH_SIZE,
+    WRITE_BEHIND_INTERVAL,
+    WRITE_BEHIND_MAX_BACKOFF,
+    WRITE_BEHIND_QUEUE_SIZE,
+)
+
+WRITE_ACK = "write_ack"
+
+PENDING = "pending"
+PERSISTED = "persisted"
+FAILED = "failed"
+
+# seconds between deletions of expired acks
+PRUNE_INTERVAL = 60
+
+# seconds before the first retry of a failed batch
+MIN_BACKOFF = 0.5
+
+
+def ddl(schema):
+    """
+    returns the statement creating the ack table
+    """
+    return f"""
+        CREATE TABLE IF NOT EXISTS {schema}.{WRITE_ACK} (
+            token uuid PRIMARY KEY,
+            entity text NOT NULL,
+            row_key bigint NOT NULL,
+            persisted_at timestamptz NOT NULL DEFAULT now()
+        );
+        CREATE INDEX IF NOT EXISTS {WRITE_ACK}_persisted_at
+            ON {schema}.{WRITE_ACK} (persisted_at);"""
+
+
+class FlushFailed(RuntimeError):
+    """
+    Raised by a flush when none of the batch could be written
+    """
+
+
+class WriteBehind:  # pylint: disable=too-many-instance-attributes
+    """
+    Bounded queue of rows written in batches by a background thread
+
+    flush(batch) receives a list of (token, row) and returns
+    {token: error} for the rows it couldn't write, or raises FlushFailed
+    when the batch couldn't be written at all; it must record the tokens of
+    the written rows in write_ack.
+    """
+
+    def __init__(
+        self,
+        entity,
+        flush,
+        max_queue=WRITE_BEHIND_QUEUE_SIZE,
+        batch_size=WRITE_BEHIND_BATCH_SIZE,
+        interval=WRITE_BEHIND_INTERVAL,
+    ):
+        """
+        constructor
+        """
+        self.entity = entity
+        self.flush = flush
+        self.batch_size = batch_size
+        self.interval = interval
+        self.queue = queue.Queue(max_queue)
+        self.stopped = threading.Event()
+        self.thread = None
+        self.app = None
+        self.lock = threading.Lock()
+        # token => (state, error) for rows accepted by this process
+        self.states = OrderedDict()
+
+    def submit(self, row):
+        """
+        queues row, returns its ack token or None when the queue is full
+        """
+        if self.stopped.is_set():
+            return None
+        token = str(uuid.uuid4())
+        # set first, the flusher may write the row before put_nowait returns
+        self._set_state(token, PENDING)
+        try:
+            self.queue.put_nowait((token, row))
+        except queue.Full:
+            with self.lock:
+                self.states.pop(token, None)
+            return None
+        return token
+
+    def _set_state(self, token, state, error=None):
+        """
+        records the state of a token, forgetting the oldest beyond the limit
+        """
+        with self.lock:
+            self.states[token] = (state, error)
+            self.states.move_to_end(token)
+            while len(self.states) > WRITE_ACK_ENTRIES:
+                self.states.popitem(last=False)
+
+    def status(self, token):
+        """
+        Service function returning whether the row of an ack token was
+        persisted, is still queued or failed
+        """
+        with self.lock:
+            state, error = self.states.get(token, (None, None))
+        if state in (PENDING, FAILED):
+            return {"status": STATUS_OK, "data": {"state": state, "error": error}}
+
+        # tokens accepted by other workers are only known to the database
+        result = do_query(
+            f"""SELECT row_key, persisted_at FROM {SCHEMA_NAME}.{WRITE_ACK}
+            WHERE token = %(token)s AND entity = %(entity)s;""",
+            {"token": token, "entity": self.entity},
+        )
+        if result["status"] != STATUS_OK:
+            return result
+        if result["data"]:
+            row = result["data"][0]
+            data = {
+                "state": PERSISTED,
+                "key": row["row_key"],
+                "persisted_at": row["persisted_at"],
+            }
+            return {"status": STATUS_OK, "data": data}
+        if state == PERSISTED:
+            # the ack was pruned, the row itself was written
+            return {"status": STATUS_OK, "data": {"state": PERSISTED}}
+        return {"status": STATUS_NOT_FOUND, "error": f"Unknown ack token {token}"}
+
+    def next_batch(self):
+        """
+        waits for a first row, then collects rows until the batch is full or
+        nothing more arrives within interval seconds, [] after an idle second
+        """
+        try:
+            batch = [self.queue.get(timeout=1)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                # rows already queued are taken even past the deadline
+                if remaining > 0:
+                    batch.append(self.queue.get(timeout=remaining))
+                else:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def try_write(self, batch):
+        """
+        flushes one batch and records the state of its tokens, returns the
+        number of rows written or None if the whole batch failed, leaving
+        its rows pending
+        """
+        try:
+            if self.app is not None:
+                with self.app.app_context():
+                    errors = self.flush(batch)
+            else:
+                errors = self.flush(batch)
+        except Exception:  # pylint: disable=broad-exception-caught
+            logging.exception(
+                emoji.emojize(
+                    f"Write-behind flush of {self.entity} failed :cross_mark:"
+                )
+            )
+            return None
+
+        for token, _ in batch:
+            if token in errors:
+                self._set_state(token, FAILED, errors[token])
+            else:
+                self._set_state(token, PERSISTED)
+        return len(batch) - len(errors)
+
+    def write(self, batch):
+        """
+        flushes one batch without retrying, a batch that fails as a whole
+        fails all its rows; returns the number of rows written
+        """
+        written = self.try_write(batch)
+        if written is None:
+            for token, _ in batch:
+                self._set_state(token, FAILED, "the batch could not be written")
+            return 0
+        return written
+
+    def drain(self):
+        """
+        flushes everything still queued, in batches
+        """
+        written = 0
+        batch = []
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+            if len(batch) >= self.batch_size:
+                written += self.write(batch)
+                batch = []
+        if batch:
+            written += self.write(batch)
+        return written
+
+    def run(self):
+        """
+        flushes batches until stopped, runs on the flusher thread
+        """
+        pruned_at = time.monotonic()
+        backoff = 0
+        failed = []
+        while not self.stopped.is_set():
+            batch = failed or self.next_batch()
+            failed = []
+            if batch and self.try_write(batch) is None:
+                # retried as a whole, not row by row, once the database is back
+                failed = batch
+                backoff = min(max(2 * backoff, MIN_BACKOFF), WRITE_BEHIND_MAX_BACKOFF)
+                self.stopped.wait(backoff)
+                continue
+            backoff = 0
+            if time.monotonic() - pruned_at >= PRUNE_INTERVAL:
+                pruned_at = time.monotonic()
+                with self.app.app_context():
+                    self.prune()
+        # stopped while waiting to retry, one last attempt
+        if failed:
+            self.write(failed)
+
+    def start(self, app):
+        """
+        starts the flusher thread, rows left on exit are flushed by close
+        """
+        self.app = app
+        self.stopped.clear()
+        self.thread = threading.Thread(
+            target=self.run, name=f"write-behind-{self.entity}", daemon=True
+        )
+        self.thread.start()
+        atexit.register(self.close)
+
+    def close(self):
+        """
+        stops accepting rows and flushes the queue
+        """
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        written = self.drain()
+        if written:
+            logging.info(
+                "write-behind: flushed %s %s rows on exit", written, self.entity
+            )
+
+    def prune(self):
+        """
+        deletes acks older than WRITE_ACK_TTL seconds
+        """
+        return do_query(
+            f"""DELETE FROM {SCHEMA_NAME}.{WRITE_ACK}
+            WHERE persisted_at < now() - %(ttl)s * interval '1 second'
+            RETURNING token;""",
+            {"ttl": WRITE_ACK_TTL},
+        )
+
+
+def install(conn_pool):
+    """
+    creates the ack table
+    """
+    query = Query(conn_pool)
+    query.execute(ddl(SCHEMA_NAME))
+    query.close()
+    logging.info("%s table installed", WRITE_ACK)
+
+
+def main():
+    """
+    installs the ack table in the configured database
+    """
+    logging.basicConfig(level=logging.INFO)
+    install(Connection())
+    print(f"Ack table installed in {SCHEMA_NAME}.{WRITE_ACK}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"Makes the directory a python module"
@@ -0,0 +1,168 @@
+"""
+Production launcher
+
+Runs the app under gunicorn with pre-forked gthread workers. The app is
+imported once in the master (preload) and every worker then opens its own
+connection pool. ThreadedConnectionPool raises instead of waiting when it is
+exhausted, so each pool is sized for the worker's request threads plus the
+background threads that also query (cache refresh and warm-up).
+
+usage: python -m server.launcher --workers 4 --threads 8
+"""
+
+import argparse
+import logging
+import os
+
+import emoji
+from gunicorn.app.base import BaseApplication
+
+from app import close_worker, create_app, init_worker
+from constants.constants import (
+    CACHE_REFRESH_WORKERS,
+    DB_CONNECTION_BUDGET,
+    JOB_WORKERS,
+    REVIEW_WRITE_BEHIND,
+    WARMUP_CONCURRENCY,
+    WEB_BIND,
+    WEB_KEEPALIVE,
+    WEB_MAX_REQUESTS,
+    WEB_MAX_REQUESTS_JITTER,
+    WEB_PRELOAD,
+    WEB_THREADS,
+    WEB_TIMEOUT,
+    WEB_WORKERS,
+)
+
+
+def plan(workers, threads, budget=0):
+    """
+    returns the request threads and pool bounds of each worker
+
+    parameter budget = connections the database allows all workers together,
+    0 for no limit; request threads are cut down to fit in it
+    """
+    background = CACHE_REFRESH_WORKERS + WARMUP_CONCURRENCY + JOB_WORKERS
+    if JOB_WORKERS:
+        # the job heartbeat
+        background += 1
+    if REVIEW_WRITE_BEHIND:
+        # the review flusher holds one connection while writing a batch
+        background += 1
+    maxconn = threads + background
+    if budget:
+        per_worker = budget // workers
+        if per_worker < background + 1:
+            # a request thread needs a connection the background ones can't take
+            raise ValueError(
+                f"{budget} database connections can't serve {workers} workers, "
+                f"each needs {background + 1}"
+            )
+        if per_worker < maxconn:
+            maxconn = per_worker
+            threads = min(threads, per_worker - background)
+            logging.warning(
+                emoji.emojize(
+                    f"Budget of {budget} connections limits workers to "
+                    f"{threads} threads :warning:"
+                )
+            )
+    return {"threads": threads, "minconn": 1, "maxconn": maxconn}
+
+
+def options(args, sizing):
+    """
+    returns the gunicorn settings for the parsed arguments
+    """
+
+    def post_worker_init(worker):
+        # runs in the worker after the fork, once the app is loaded
+        init_worker(worker.wsgi, sizing["minconn"], sizing["maxconn"])
+
+    def worker_exit(server, worker):  # pylint: disable=unused-argument
+        # runs in the worker before it exits, while jobs can still be cancelled
+        close_worker()
+
+    return {
+        "bind": args.bind,
+        "workers": args.workers,
+        "worker_class": "gthread",
+        "threads": sizing["threads"],
+        "preload_app": args.preload,
+        "keepalive": args.keepalive,
+        "timeout": args.timeout,
+        "max_requests": args.max_requests,
+        "max_requests_jitter": args.max_requests_jitter,
+        "post_worker_init": post_worker_init,
+        "worker_exit": worker_exit,
+    }
+
+
+class Launcher(BaseApplication):
+    """
+    gunicorn application serving the app factory
+    """
+
+    def __init__(self, settings):
+        """
+        constructor
+        """
+        self.settings = settings
+        super().__init__()
+
+    def init(self, parser, opts, args):
+        """
+        no command line of gunicorn's own, the settings come from options()
+        """
+        return None
+
+    def load_config(self):
+        """
+        applies the settings to the gunicorn config
+        """
+        for key, value in self.settings.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        """
+        creates the app without opening connections or starting threads
+        """
+        return create_app(start_worker=False)
+
+
+def parse_args(argv=None):
+    """
+    parses the command line, defaults come from the environment
+    """
+    parser = argparse.ArgumentParser(description="Run the API under gunicorn")
+    parser.add_argument("--bind", default=WEB_BIND)
+    parser.add_argument("--workers", type=int, default=WEB_WORKERS or os.cpu_count())
+    parser.add_argument("--threads", type=int, default=WEB_THREADS)
+    parser.add_argument("--keepalive", type=int, default=WEB_KEEPALIVE)
+    parser.add_argument("--timeout", type=int, default=WEB_TIMEOUT)
+    parser.add_argument("--max-requests", type=int, default=WEB_MAX_REQUESTS)
+    parser.add_argument(
+        "--max-requests-jitter", type=int, default=WEB_MAX_REQUESTS_JITTER
+    )
+    parser.add_argument(
+        "--preload", action=argparse.BooleanOptionalAction, default=WEB_PRELOAD
+    )
+    parser.add_argument("--db-budget", type=int, default=DB_CONNECTION_BUDGET)
+    return parser.parse_args(argv)
+
+
+def main():
+    """
+    starts the production server
+    """
+    args = parse_args()
+    sizing = plan(args.workers, args.threads, args.db_budget)
+    print(
+        f"Starting {args.workers} workers x {sizing['threads']} threads, "
+        f"pool of {sizing['maxconn']} connections per worker"
+    )
+    Launcher(options(args, sizing)).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Admin Tests"""
+
+import pytest
+from flask import Flask
+
+from blueprints.admin import blueprint
+from cache.cache import caches
+from constants.constants import COLUMNS, MOVIE
+
+
+@pytest.fixture()
+def client():
+    """
+    returns a test client of an app with the admin blueprint
+    """
+    app = Flask(__name__)
+    app.register_blueprint(blueprint.admin_blueprint)
+    return app.test_client()
+
+
+def test_admin_closed_without_token(client, monkeypatch):
+    """
+    the admin endpoints don't answer while no token is configured
+    """
+    monkeypatch.setattr(blueprint, "ADMIN_TOKEN", None)
+
+    assert client.get("/admin/cache").status_code == 404
+    assert client.post("/admin/cache/flush", json={}).status_code == 404
+
+
+@pytest.mark.parametrize(
+    "headers, status",
+    [({}, 403), ({"X-Admin-Token": "wrong"}, 403), ({"X-Admin-Token": "s3cret"}, 200)],
+)
+def test_admin_requires_token(client, monkeypatch, headers, status):
+    """
+    only the configured token opens the admin endpoints
+    """
+    monkeypatch.setattr(blueprint, "ADMIN_TOKEN", "s3cret")
+
+    assert client.get("/admin/cache", headers=headers).status_code == status
+
+
+def test_flush_reaches_every_worker(client, monkeypatch):
+    """
+    a flush goes through invalidate(), so every worker of the node applies
+    it, and needs no body to flush every entity
+    """
+    monkeypatch.setattr(blueprint, "ADMIN_TOKEN", "s3cret")
+    invalidated = []
+    monkeypatch.setattr(
+        blueprint, "invalidate", lambda *entities: invalidated.append(entities)
+    )
+    headers = {"X-Admin-Token": "s3cret"}
+
+    response = client.post(
+        "/admin/cache/flush", json={"entity": MOVIE}, headers=headers
+    )
+    assert response.status_code == 200
+    assert set(response.get_json()["data"]) == set(caches)
+
+    assert client.post("/admin/cache/flush", headers=headers).status_code == 200
+    unknown = client.post("/admin/cache/flush", json={"entity": "x"}, headers=headers)
+
+    assert unknown.status_code == 404
+    assert invalidated == [(MOVIE,), tuple(COLUMNS)]
@@ -0,0 +1,121 @@
+"""Bulk load Tests"""
+
+import csv
+import io
+import pytest
+from flask import Flask, request
+from pydantic import BaseModel
+from api import bulk
+from constants.constants import STATUS_OK
+
+
+class RowModel(BaseModel):
+    """row model"""
+
+    title: str
+    votes: int
+
+
+def drain(source):
+    """
+    reads a source the way COPY does and parses the CSV
+    """
+    chunks = []
+    while True:
+        chunk = source.read(16)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    return list(csv.reader(io.StringIO(b"".join(chunks).decode())))
+
+
+def test_ndjson_rows_validated():
+    """
+    valid rows are encoded with their row number, invalid ones reported
+    """
+
+    body = b'{"title": "Up", "votes": 10}\n\n{"title": "Cars"}\nnot json\n[1]\n'
+    source = bulk.RowSource(bulk.ndjson_rows(io.BytesIO(body)), RowModel)
+
+    assert drain(source) == [["1", "Up", "10"]]
+    assert source.count == 1
+    assert [error["row"] for error in source.errors] == [2, 3, 4]
+    assert source.errors[0]["errors"] == ["votes: Field required"]
+
+
+def test_csv_rows():
+    """
+    CSV rows are read by header name
+    """
+
+    body = b"votes,title\n10,Up\n,Cars\n"
+    source = bulk.RowSource(bulk.csv_rows(io.BytesIO(body)), RowModel)
+
+    assert drain(source) == [["1", "Up", "10"]]
+    assert source.errors[0]["row"] == 2
+
+
+def test_empty_string_is_not_null():
+    """
+    empty strings are quoted so COPY doesn't load them as NULL, None isn't
+    """
+
+    class OptionalModel(BaseModel):
+        """row model with an optional field"""
+
+        title: str
+        description: str | None = None
+
+    body = b'{"title": "", "description": null}\n{"title": "Up", "description": ""}\n'
+    source = bulk.RowSource(bulk.ndjson_rows(io.BytesIO(body)), OptionalModel)
+
+    assert b"".join(iter(lambda: source.read(16), b"")) == (b'"1","",\n"2","Up",""\n')
+
+
+def test_too_many_errors():
+    """
+    the load is aborted once max_errors is exceeded
+    """
+
+    body = b'{"title": "Up"}\n' * 3
+    source = bulk.RowSource(bulk.ndjson_rows(io.BytesIO(body)), RowModel, 1)
+
+    with pytest.raises(bulk.TooManyErrors):
+        drain(source)
+    assert source.aborted
+
+
+def test_bulk_endpoint():
+    """
+    the body is streamed and the new ids are returned by row number
+    """
+
+    app = Flask(__name__)
+
+    @app.route("/bulk", methods=["POST"])
+    def post_bulk():
+        rows = bulk.read_rows(request)
+        if rows is None:
+            return "", 415
+        source = bulk.RowSource(rows, RowModel)
+        loaded = drain(source)
+        result = {
+            "status": STATUS_OK,
+            "data": [
+                {"row": int(row[0]), "movie_id": 100 + idx}
+                for idx, row in enumerate(loaded)
+            ],
+        }
+        return bulk.bulk_response(result, source, "movie_id")
+
+    client = app.test_client()
+    body = '{"title": "Up", "votes": 1}\n{"title": "Cars"}\n{"title": "Coco", "votes": 2}\n'
+    response = client.post("/bulk", data=body, content_type="application/x-ndjson")
+
+    assert response.status_code == 201
+    assert response.get_json()["data"]["ids"] == [
+        {"row": 1, "movie_id": 100},
+        {"row": 3, "movie_id": 101},
+    ]
+    assert response.get_json()["data"]["errors"][0]["row"] == 2
+    assert client.post("/bulk", json={}).status_code == 415
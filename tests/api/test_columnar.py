@@ -0,0 +1,84 @@
+"""Columnar export Tests"""
+
+import io
+from datetime import date, datetime
+from decimal import Decimal
+import pytest
+from flask import Flask
+from api.columnar import ARROW, PARQUET, columnar_response
+from constants.constants import MOVIE_REVIEW, MOVIE, STATUS_OK
+
+pyarrow = pytest.importorskip("pyarrow")
+parquet = pytest.importorskip("pyarrow.parquet")
+
+
+@pytest.fixture()
+def app():
+    """
+    returns a flask app context
+    """
+    flask_app = Flask(__name__)
+    with flask_app.app_context():
+        yield flask_app
+
+
+@pytest.fixture()
+def movies():
+    """
+    returns movie rows as psycopg2 would
+    """
+    return [
+        {
+            "movie_id": movie_id,
+            "title": f"movie {movie_id}",
+            "description": "",
+            "movie_year": date(2014, 1, 1),
+            "rating": Decimal("8.6"),
+            "runtime": Decimal("169"),
+            "votes": "1000",
+            "revenue": None,
+            "metascore": "74",
+            "created_at": datetime(2024, 5, 4),
+        }
+        for movie_id in range(5)
+    ]
+
+
+def test_arrow_stream(app, movies):
+    """
+    rows come back as typed columns from an Arrow IPC stream
+    """
+
+    response = columnar_response(
+        {"status": STATUS_OK, "data": iter(movies)}, MOVIE, ARROW
+    )
+    table = pyarrow.ipc.open_stream(b"".join(response.response)).read_all()
+
+    assert table.num_rows == 5
+    assert table.schema.field("movie_year").type == pyarrow.date32()
+    assert table.schema.field("rating").type == pyarrow.float64()
+    assert table.column("rating")[0].as_py() == 8.6
+    assert table.column("revenue")[0].as_py() is None
+    # varchar columns stay strings
+    assert table.schema.field("votes").type == pyarrow.string()
+    assert table.column("metascore")[0].as_py() == "74"
+
+
+def test_parquet_file(app):
+    """
+    rows come back from a Parquet file, also when there are none
+    """
+
+    reviews = [{"review_id": 1, "movie_id": 2, "review": 5, "created_at": None}]
+
+    response = columnar_response(
+        {"status": STATUS_OK, "data": iter(reviews)}, MOVIE_REVIEW, PARQUET
+    )
+    table = parquet.read_table(io.BytesIO(b"".join(response.response)))
+
+    assert table.to_pylist() == reviews
+
+    response = columnar_response(
+        {"status": STATUS_OK, "data": iter([])}, MOVIE_REVIEW, PARQUET
+    )
+    assert parquet.read_table(io.BytesIO(b"".join(response.response))).num_rows == 0
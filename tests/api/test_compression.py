@@ -0,0 +1,92 @@
+"""Compression Tests"""
+
+import gzip
+import pytest
+from flask import Flask, Response, jsonify
+from api import compression
+from api.json_provider import FastJSONProvider
+
+
+@pytest.fixture()
+def client():
+    """
+    returns a test client of an app with compression enabled
+    """
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    compression.init_app(app)
+
+    @app.route("/big")
+    def big():
+        return jsonify(data=[{"title": "movie"}] * 500)
+
+    @app.route("/small")
+    def small():
+        return jsonify(message="OK")
+
+    @app.route("/stream")
+    def stream():
+        return Response((b"%d\n" % idx for idx in range(1000)), mimetype="text/csv")
+
+    return app.test_client()
+
+
+def test_large_body_gzip(client):
+    """
+    large JSON bodies are compressed when the client accepts gzip
+    """
+
+    response = client.get("/big", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert gzip.decompress(response.data).startswith(b'{"data":[{"title"')
+
+
+def test_small_body_and_no_accept(client):
+    """
+    small bodies and clients without Accept-Encoding get plain responses
+    """
+
+    assert (
+        "Content-Encoding"
+        not in client.get("/small", headers={"Accept-Encoding": "gzip"}).headers
+    )
+    assert "Content-Encoding" not in client.get("/big").headers
+
+
+def test_identical_bodies_compressed_once(mocker, client):
+    """
+    the compressed body is reused for an identical payload
+    """
+
+    spy = mocker.spy(compression, "compress")
+
+    first = client.get("/big", headers={"Accept-Encoding": "gzip"}).data
+    second = client.get("/big", headers={"Accept-Encoding": "gzip"}).data
+
+    assert first == second
+    assert spy.call_count == 1
+
+
+def test_streamed_body(client):
+    """
+    streamed responses are compressed chunk by chunk
+    """
+
+    response = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(response.data).splitlines()[-1] == b"999"
+
+
+def test_brotli_preferred(client):
+    """
+    brotli is chosen when the client accepts it and it is installed
+    """
+
+    brotli = pytest.importorskip("brotli")
+    response = client.get("/big", headers={"Accept-Encoding": "gzip, br"})
+
+    assert response.headers["Content-Encoding"] == "br"
+    assert brotli.decompress(response.data).startswith(b'{"data"')
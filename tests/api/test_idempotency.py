@@ -0,0 +1,149 @@
+"""Idempotency key Tests"""
+
+import pytest
+from flask import Flask, jsonify, request
+
+from api import idempotency
+from blueprints.jobs.blueprint import jobs_blueprint
+from blueprints.movie import blueprint as movie_blueprint
+from constants.constants import STATUS_ACCEPTED, STATUS_OK
+
+
+class FakeKeys:
+    """idempotency_key table kept in a dict, answering do_query calls"""
+
+    def __init__(self):
+        self.rows = {}
+
+    def __call__(self, sql, params):
+        sql = sql.strip()
+        name = (params.get("scope"), params.get("key"))
+        if sql.startswith("INSERT"):
+            if name in self.rows:
+                return {"status": STATUS_OK, "data": []}
+            self.rows[name] = {
+                "fingerprint": params["fingerprint"],
+                "status": None,
+                "mimetype": None,
+                "body": None,
+            }
+            return {"status": STATUS_OK, "data": [{"key": params["key"]}]}
+        if sql.startswith("UPDATE"):
+            self.rows[name].update(
+                status=params["status"],
+                mimetype=params["mimetype"],
+                body=bytes(params["body"]),
+            )
+        elif sql.startswith("SELECT"):
+            row = self.rows.get(name)
+            return {"status": STATUS_OK, "data": [row] if row else []}
+        elif sql.startswith("DELETE") and "status IS NULL" in sql:
+            self.rows.pop(name, None)
+        return {"status": STATUS_OK, "data": []}
+
+
+@pytest.fixture()
+def client(mocker):
+    """
+    returns a test client of an app with one idempotent create handler
+    """
+    keys = FakeKeys()
+    mocker.patch.object(idempotency, "do_query", side_effect=keys)
+    app = Flask(__name__)
+    app.inserts = []
+
+    @app.route("/thing/create", methods=["POST"])
+    @idempotency.idempotent()
+    def create():
+        app.inserts.append(1)
+        if len(app.inserts) > 5:
+            return jsonify(error="boom"), 500
+        return jsonify(status=201, id=len(app.inserts)), 201
+
+    @app.route("/thing/fail", methods=["POST"])
+    @idempotency.idempotent()
+    def fail():
+        # create handlers report a failed insert in the body of a 200
+        app.inserts.append(1)
+        status = request.get_json()["status"]
+        return jsonify(status=status), 200 if status == 500 else status
+
+    return app.test_client()
+
+
+def test_retry_replays_stored_response(client):
+    """
+    a retry with the same key gets the first response without a new insert
+    """
+
+    headers = {"Idempotency-Key": "abc"}
+    first = client.post("/thing/create", json={"name": "x"}, headers=headers)
+    retry = client.post("/thing/create", json={"name": "x"}, headers=headers)
+
+    assert first.status_code == retry.status_code == 201
+    assert retry.get_json() == first.get_json() == {"status": 201, "id": 1}
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert client.application.inserts == [1]
+
+    # without a key every request runs
+    client.post("/thing/create", json={"name": "x"})
+    assert len(client.application.inserts) == 2
+
+
+def test_key_reused_with_other_body(client):
+    """
+    a key can't be reused for a different request body
+    """
+
+    headers = {"Idempotency-Key": "abc"}
+    client.post("/thing/create", json={"name": "x"}, headers=headers)
+    response = client.post("/thing/create", json={"name": "y"}, headers=headers)
+
+    assert response.status_code == 422
+    assert client.application.inserts == [1]
+
+
+def test_server_errors_are_not_stored(client):
+    """
+    a failed request releases its key so a retry runs again
+    """
+
+    client.application.inserts.extend([0] * 5)
+    headers = {"Idempotency-Key": "abc"}
+    assert client.post("/thing/create", json={}, headers=headers).status_code == 500
+    assert client.post("/thing/create", json={}, headers=headers).status_code == 500
+    assert len(client.application.inserts) == 7
+
+
+@pytest.mark.parametrize("status", [500, 409, 429])
+def test_failed_service_status_is_not_stored(client, status):
+    """
+    a failure reported in the body, 409 and 429 release the key
+    """
+
+    headers = {"Idempotency-Key": "abc"}
+    for _ in range(2):
+        response = client.post("/thing/fail", json={"status": status}, headers=headers)
+        assert "Idempotent-Replayed" not in response.headers
+    assert len(client.application.inserts) == 2
+
+
+def test_async_bulk_delete_retry_queues_one_job(mocker):
+    """
+    a retried async bulk delete gets the first job instead of a second one
+    """
+    mocker.patch.object(idempotency, "do_query", side_effect=FakeKeys())
+    submit = mocker.patch.object(movie_blueprint.runner, "submit")
+    submit.return_value = {"status": STATUS_ACCEPTED, "data": {"job_id": "j1"}}
+    app = Flask(__name__)
+    app.register_blueprint(jobs_blueprint)
+    app.register_blueprint(movie_blueprint.movie_blueprint)
+    client = app.test_client()
+    headers = {"Idempotency-Key": "k1", "Prefer": "respond-async"}
+
+    first = client.post("/movie/bulk_delete", json={"ids": [1]}, headers=headers)
+    retry = client.post("/movie/bulk_delete", json={"ids": [1]}, headers=headers)
+
+    assert first.status_code == retry.status_code == STATUS_ACCEPTED
+    assert retry.headers[idempotency.REPLAYED_HEADER] == "true"
+    assert submit.call_count == 1
@@ -0,0 +1,110 @@
+"""Background job Tests"""
+
+import threading
+
+import pytest
+from flask import Flask
+
+from api import jobs
+from constants.constants import STATUS_ACCEPTED, STATUS_OK, STATUS_TOO_MANY_REQUESTS
+
+
+@pytest.fixture()
+def saved(mocker):
+    """
+    records the job table writes, new jobs get IDs 1, 2, ...
+    """
+    writes = []
+
+    def do_query(sql, params):
+        writes.append(params)
+        if "job_id = ANY" in sql or "NOT state = ANY" in sql:
+            return {"status": STATUS_OK, "data": [{"job_id": 9}]}
+        if sql.strip().startswith("INSERT"):
+            job_id = sum(1 for params in writes if "kind" in params)
+            return {"status": STATUS_OK, "data": [{"job_id": job_id}]}
+        return {"status": STATUS_OK, "data": [{"cancel_requested": False}]}
+
+    mocker.patch.object(jobs, "do_query", side_effect=do_query)
+    mocker.patch.object(jobs, "JOB_PROGRESS_INTERVAL", 0)
+    mocker.patch.object(jobs, "JOB_HEARTBEAT_INTERVAL", 60)
+    return writes
+
+
+@pytest.fixture()
+def runner():
+    """
+    returns a started runner with one worker and one queued slot
+    """
+    job_runner = jobs.JobRunner(workers=1, max_queued=1)
+    job_runner.start(Flask(__name__))
+    yield job_runner
+    job_runner.close()
+
+
+def test_job_reports_progress_and_result(saved, runner):
+    """
+    a job's progress and final result are written to the job table
+    """
+
+    def work(job):
+        job.progress(2, errors=["row 2: bad"])
+        job.progress(3)
+        return {"status": STATUS_OK, "data": {"deleted": [1, 2]}}
+
+    result = runner.submit("movie.bulk_delete", work, total=5)
+    runner.executor.shutdown(wait=True)
+
+    assert result == {"status": STATUS_ACCEPTED, "data": {"job_id": 1}}
+    assert saved[1]["state"] == jobs.RUNNING
+    assert saved[-1]["state"] == jobs.SUCCEEDED
+    assert saved[-1]["processed"] == 5
+    assert saved[-1]["errors"] == '["row 2: bad"]'
+    assert '"deleted":[1,2]' in saved[-1]["result"].replace(" ", "")
+
+
+def test_cancel_and_back_pressure(saved, runner):
+    """
+    a cancelled job stops at its next report, a full runner rejects jobs
+    """
+
+    started = threading.Event()
+    release = threading.Event()
+
+    def work(job):
+        started.set()
+        release.wait(5)
+        job.progress(1)
+        return {"status": STATUS_OK, "data": {}}
+
+    runner.submit("movie.bulk", work)
+    started.wait(5)
+    runner.submit("movie.bulk", work)
+    full = runner.submit("movie.bulk", work)
+    runner.cancel(1)
+    release.set()
+    runner.executor.shutdown(wait=True)
+
+    assert full["status"] == STATUS_TOO_MANY_REQUESTS
+    assert [params["state"] for params in saved if params.get("state")] == [
+        jobs.RUNNING,
+        jobs.CANCELLED,
+        jobs.RUNNING,
+        jobs.SUCCEEDED,
+    ]
+
+
+def test_heartbeat_fails_orphaned_jobs(saved, runner):
+    """
+    the jobs of this worker are touched, unfinished jobs nobody touched
+    within the timeout are failed
+    """
+
+    runner.jobs[3] = jobs.Job(3)
+
+    result = runner.heartbeat()
+
+    assert saved[0] == {"job_ids": [3]}
+    assert saved[1]["finished"] == list(jobs.FINISHED)
+    assert saved[1]["timeout"] == jobs.JOB_HEARTBEAT_TIMEOUT
+    assert result["data"] == [{"job_id": 9}]
@@ -0,0 +1,57 @@
+"""JSON provider Tests"""
+
+from datetime import date, datetime
+from decimal import Decimal
+import pytest
+from flask import Flask, jsonify
+from api import json_provider
+from api.json_provider import FastJSONProvider
+
+
+@pytest.fixture()
+def row():
+    """
+    returns a movie row as psycopg2 would
+    """
+    return {
+        "movie_id": 1,
+        "movie_year": date(2010, 7, 16),
+        "revenue": Decimal("292.57"),
+        "created_at": datetime(2024, 5, 4, 12, 30),
+    }
+
+
+def test_dumps_postgres_types(row):
+    """
+    dates, timestamps and decimals are encoded natively
+    """
+
+    data = json_provider.loads(json_provider.dumps(row))
+
+    assert data["movie_year"] == "2010-07-16"
+    assert data["revenue"] == 292.57
+    assert data["created_at"].startswith("2024-05-04T12:30")
+
+
+def test_default_rejects_unknown_types():
+    """
+    unsupported objects still raise TypeError
+    """
+
+    with pytest.raises(TypeError):
+        json_provider.default(object())
+
+
+def test_jsonify_uses_provider(row):
+    """
+    jsonify goes through the fast provider
+    """
+
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+
+    with app.app_context():
+        response = jsonify(status=200, data=[row])
+
+    assert response.mimetype == "application/json"
+    assert response.get_json()["data"][0]["revenue"] == 292.57
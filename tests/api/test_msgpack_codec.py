@@ -0,0 +1,103 @@
+"""MessagePack Tests"""
+
+from datetime import date, datetime, timezone
+from decimal import Decimal
+import pytest
+from flask import Flask, request
+from pydantic import BaseModel
+from api import msgpack_codec
+from api.json_provider import FastJSONProvider
+from api.trusted import respond
+from constants.constants import STATUS_OK
+
+msgpack = pytest.importorskip("msgpack")
+
+
+class RowModel(BaseModel):
+    """row model"""
+
+    movie_id: int
+    movie_year: date
+
+
+class ResponseModel(BaseModel):
+    """response model"""
+
+    status: int
+    data: list[RowModel]
+
+
+@pytest.fixture()
+def client():
+    """
+    returns a test client of an app accepting msgpack bodies
+    """
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    app.request_class = msgpack_codec.MsgpackRequest
+
+    @app.route("/movie/<int:movie_id>")
+    def get_by_id(movie_id):
+        result = {
+            "status": STATUS_OK,
+            "data": [{"movie_id": movie_id, "movie_year": date(2014, 1, 1)}],
+        }
+        return respond(ResponseModel, result, trusted=True)
+
+    @app.route("/echo", methods=["POST"])
+    def echo():
+        return {"body": repr(request.get_json())}
+
+    return app.test_client()
+
+
+def test_round_trip():
+    """
+    dates, datetimes and decimals survive encoding
+    """
+
+    row = {
+        "movie_year": date(2014, 1, 1),
+        "rating": Decimal("8.1"),
+        "created_at": datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc),
+    }
+
+    assert msgpack_codec.unpackb(msgpack_codec.packb(row)) == row
+
+
+def test_date_is_compact():
+    """
+    a date takes 6 bytes instead of a 12 byte string
+    """
+
+    assert len(msgpack_codec.packb(date(2014, 1, 1))) == 6
+
+
+def test_accept_msgpack(client):
+    """
+    read handlers answer in msgpack when asked to
+    """
+
+    response = client.get("/movie/1", headers={"Accept": "application/msgpack"})
+
+    assert response.mimetype == "application/msgpack"
+    assert msgpack_codec.unpackb(response.data) == {
+        "status": STATUS_OK,
+        "data": [{"movie_id": 1, "movie_year": date(2014, 1, 1)}],
+    }
+    assert client.get("/movie/1").get_json()["data"][0]["movie_year"] == "2014-01-01"
+
+
+def test_msgpack_body(client):
+    """
+    msgpack bodies are decoded by get_json, broken ones are rejected
+    """
+
+    body = msgpack_codec.packb({"value": Decimal("1.5")})
+    response = client.post("/echo", data=body, content_type="application/msgpack")
+
+    assert response.get_json() == {"body": "{'value': Decimal('1.5')}"}
+
+    response = client.post("/echo", data=b"\xc1", content_type="application/msgpack")
+
+    assert response.status_code == 400
@@ -0,0 +1,69 @@
+"""Content negotiation Tests"""
+
+from datetime import date
+import pytest
+from flask import Flask
+from api.json_provider import FastJSONProvider
+from api.negotiation import NDJSON, ndjson_response, wants_ndjson
+from constants.constants import STATUS_ERR, STATUS_OK
+
+
+@pytest.fixture()
+def app():
+    """
+    returns a flask app with the fast JSON provider
+    """
+    flask_app = Flask(__name__)
+    flask_app.json = FastJSONProvider(flask_app)
+    return flask_app
+
+
+def test_wants_ndjson(app):
+    """
+    NDJSON is only chosen when the client asks for it
+    """
+
+    with app.test_request_context(headers={"Accept": NDJSON}):
+        assert wants_ndjson()
+    with app.test_request_context(headers={"Accept": "*/*"}):
+        assert not wants_ndjson()
+    with app.test_request_context():
+        assert not wants_ndjson()
+
+
+def test_ndjson_response_streams_rows(app):
+    """
+    each row is written as one JSON line and the row iterator is closed
+    """
+
+    closed = []
+
+    def rows():
+        try:
+            yield {"movie_id": 1, "movie_year": date(2010, 7, 16)}
+            yield {"movie_id": 2, "movie_year": date(2014, 11, 7)}
+        finally:
+            closed.append(True)
+
+    with app.app_context():
+        response = ndjson_response({"status": STATUS_OK, "data": rows()})
+        body = b"".join(response.response)
+
+    assert response.mimetype == NDJSON
+    assert body.splitlines() == [
+        b'{"movie_id":1,"movie_year":"2010-07-16"}',
+        b'{"movie_id":2,"movie_year":"2014-11-07"}',
+    ]
+    assert closed == [True]
+
+
+def test_ndjson_response_error(app):
+    """
+    a failed query is returned as a JSON error
+    """
+
+    with app.app_context():
+        response, status = ndjson_response({"status": STATUS_ERR, "error": "failed"})
+
+    assert status == STATUS_ERR
+    assert response.get_json() == {"error": "failed"}
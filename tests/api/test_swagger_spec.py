@@ -0,0 +1,69 @@
+"""Swagger spec Tests"""
+
+import pytest
+from flask import Flask
+from api.swagger_spec import SpecCache
+
+
+@pytest.fixture()
+def app():
+    """
+    returns an app serving a spec that counts its builds
+    """
+    flask_app = Flask(__name__)
+    flask_app.builds = 0
+
+    def build(app_):
+        app_.builds += 1
+        return {"paths": sorted(rule.rule for rule in app_.url_map.iter_rules())}
+
+    flask_app.spec_cache = SpecCache(build)
+
+    @flask_app.route("/swagger")
+    def swagger_spec():
+        return flask_app.spec_cache.response(flask_app)
+
+    return flask_app
+
+
+def test_spec_built_once(app):
+    """
+    the spec is built on the first request and served with cache headers
+    """
+
+    client = app.test_client()
+    first = client.get("/swagger")
+    second = client.get("/swagger")
+
+    assert app.builds == 1
+    assert first.data == second.data
+    assert first.get_json() == {"paths": ["/static/<path:filename>", "/swagger"]}
+    assert first.headers["ETag"]
+    assert "max-age=" in first.headers["Cache-Control"]
+
+
+def test_if_none_match(app):
+    """
+    a matching ETag is answered with 304 and no body
+    """
+
+    client = app.test_client()
+    etag = client.get("/swagger").headers["ETag"]
+    response = client.get("/swagger", headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.data == b""
+
+
+def test_rebuilt_when_routes_change(app):
+    """
+    adding a route builds a new spec with a new ETag
+    """
+
+    body, etag = app.spec_cache.get(app)
+    app.add_url_rule("/movie/movies", "movies", lambda: "")
+    new_body, new_etag = app.spec_cache.get(app)
+
+    assert app.builds == 2
+    assert new_etag != etag
+    assert b"/movie/movies" in new_body and b"/movie/movies" not in body
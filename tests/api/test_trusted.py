@@ -0,0 +1,119 @@
+"""Trusted output Tests"""
+
+from datetime import date
+from decimal import Decimal
+from typing import Optional
+
+import pytest
+from flask import Flask
+from pydantic import BaseModel, ValidationError
+from api import trusted
+from api.json_provider import FastJSONProvider
+from constants.constants import STATUS_OK
+
+
+class RowModel(BaseModel):
+    """row model"""
+
+    movie_id: int
+
+
+class ResponseModel(BaseModel):
+    """response model"""
+
+    status: int
+    data: list[RowModel]
+
+
+class MovieRowModel(BaseModel):
+    """row model with columns typed differently in the database"""
+
+    movie_id: int
+    votes: Optional[int]
+    rating: float
+    movie_year: str | date
+
+
+class MessageModel(BaseModel):
+    """message model"""
+
+    message: str
+
+
+class MovieResponseModel(BaseModel):
+    """response model with messages"""
+
+    status: int
+    data: list[MovieRowModel | MessageModel]
+
+
+@pytest.fixture()
+def app():
+    """
+    returns an app context with the fast JSON provider
+    """
+    flask_app = Flask(__name__)
+    flask_app.json = FastJSONProvider(flask_app)
+    with flask_app.app_context():
+        yield flask_app
+
+
+def test_untrusted_builds_model():
+    """
+    without trusted mode the response model is returned
+    """
+
+    result = {"status": STATUS_OK, "data": [{"movie_id": 1}]}
+
+    assert isinstance(
+        trusted.respond(ResponseModel, result, trusted=False), ResponseModel
+    )
+
+
+def test_trusted_validates_first_response_only(mocker, app):
+    """
+    the first response is validated, later ones are serialized as they are
+    """
+
+    mocker.patch.object(trusted, "TRUSTED_SAMPLE_RATE", 0)
+    trusted.validated.discard(ResponseModel)
+
+    with pytest.raises(ValidationError):
+        trusted.respond(
+            ResponseModel, {"status": STATUS_OK, "data": [{}]}, trusted=True
+        )
+
+    result = {"status": STATUS_OK, "data": [{"movie_id": 1}]}
+    response = trusted.respond(ResponseModel, result, trusted=True)
+
+    assert response.get_json() == result
+
+
+def test_trusted_output_matches_validated(mocker, app):
+    """
+    trusted rows come out as the validated model would serialize them
+    """
+
+    mocker.patch.object(trusted, "TRUSTED_SAMPLE_RATE", 0)
+    trusted.validated.add(MovieResponseModel)
+    row = {
+        "movie_id": 1,
+        "votes": "12",
+        "rating": Decimal("7.5"),
+        "movie_year": date(2009, 5, 29),
+        "extra": "x",
+    }
+    result = {"status": STATUS_OK, "data": [row, {**row, "votes": None}]}
+
+    response = trusted.respond(MovieResponseModel, result, trusted=True)
+    expected = app.json.response(
+        trusted.respond(MovieResponseModel, result, trusted=False).model_dump()
+    )
+
+    assert response.get_json() == expected.get_json()
+    assert response.get_json()["data"][0] == {
+        "movie_id": 1,
+        "votes": 12,
+        "rating": 7.5,
+        "movie_year": "2009-05-29",
+    }
@@ -0,0 +1,60 @@
+"""Cross-worker invalidation Tests"""
+
+from cache import cache as cache_module
+from cache.broadcast import KEY, WHOLE, Broadcast
+from cache.cache import cached
+from constants.constants import ACTOR, GENRE, MOVIE, STATUS_OK
+
+
+def test_write_in_other_worker_invalidates(tmp_path):
+    """
+    an invalidation published by another worker drops the cached read and
+    the negative entry before the next read
+    """
+
+    path = str(tmp_path / "signal")
+    cache_module.broadcast = Broadcast(path, 8)
+    other_worker = Broadcast(path, 8)
+    rows = {1: [], 2: [{"movie_id": 2}]}
+
+    @cached(MOVIE)
+    def svc_get(movie_id):
+        return {"status": STATUS_OK, "data": rows[movie_id]}
+
+    @cached(MOVIE)
+    def svc_find_by_id(movie_id):
+        return {"status": STATUS_OK, "data": rows[movie_id]}
+
+    assert svc_get(2)["data"] == [{"movie_id": 2}]
+    assert svc_find_by_id(1)["data"] == []
+    rows[2] = [{"movie_id": 2, "title": "Up"}]
+    rows[1] = [{"movie_id": 1}]
+    assert svc_get(2)["data"] == [{"movie_id": 2}]
+
+    other_worker.publish([MOVIE])
+
+    assert svc_get(2)["data"] == [{"movie_id": 2, "title": "Up"}]
+    assert svc_find_by_id(1)["data"] == [{"movie_id": 1}]
+
+
+def test_ring_overflow_reports_horizon(tmp_path):
+    """
+    events pushed out of the ring before a poll turn into whole-entity
+    events at the horizon
+    """
+
+    path = str(tmp_path / "signal")
+    reader = Broadcast(path, 2)
+    writer = Broadcast(path, 2)
+    assert reader.poll() == []
+
+    writer.publish([GENRE], [1])
+    first = reader.poll()
+    writer.publish([ACTOR], [1, 2, 3])
+    events = reader.poll()
+
+    assert first[0][:3] == (GENRE, KEY, 1)
+    assert [event[:3] for event in events[-2:]] == [(ACTOR, KEY, 2), (ACTOR, KEY, 3)]
+    horizon = {entity: at for entity, kind, _, at in events if kind == WHOLE}
+    assert horizon[MOVIE] == events[-1][3]
+    assert reader.poll() == []
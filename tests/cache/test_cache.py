@@ -0,0 +1,173 @@
+"""Cache Tests"""
+
+import threading
+import time
+import pytest
+from cache.cache import Cache, cached, invalidate, read_cache
+from constants.constants import STATUS_ERR, STATUS_OK
+
+
+@pytest.fixture()
+def cache():
+    """
+    returns a cache with a short soft TTL and one refresh worker
+    """
+    return Cache("test", soft_ttl=0.05, hard_ttl=10, max_entries=2, refresh_workers=1)
+
+
+def test_fresh_hit_skips_loader(cache):
+    """
+    a fresh entry is served without calling the loader again
+    """
+
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return len(calls)
+
+    assert cache.get_or_load("key", loader) == 1
+    assert cache.get_or_load("key", loader) == 1
+    assert len(calls) == 1
+
+
+def test_stale_entry_served_while_refreshing(cache):
+    """
+    a stale entry is returned immediately and refreshed in the background
+    """
+
+    refreshed = threading.Event()
+    values = iter(["old", "new"])
+
+    def loader():
+        value = next(values)
+        if value == "new":
+            refreshed.set()
+        return value
+
+    cache.get_or_load("key", loader)
+    time.sleep(0.06)
+
+    # stale value comes back right away
+    assert cache.get_or_load("key", loader) == "old"
+    assert refreshed.wait(1)
+    time.sleep(0.01)
+    assert cache.get("key") == "new"
+
+
+def test_hard_expired_entry_reloads():
+    """
+    an entry older than the hard TTL is loaded synchronously
+    """
+
+    cache = Cache("hard", soft_ttl=0, hard_ttl=0.01, max_entries=2)
+    values = iter(["old", "new"])
+
+    cache.get_or_load("key", lambda: next(values))
+    time.sleep(0.02)
+
+    assert cache.get_or_load("key", lambda: next(values)) == "new"
+
+
+def test_lru_eviction(cache):
+    """
+    the least recently used entry is evicted when the cache is full
+    """
+
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_cached_service_and_invalidate(mocker):
+    """
+    cached services skip errors and are dropped on invalidation
+    """
+
+    query = mocker.Mock(return_value={"status": STATUS_OK, "data": [{"id": 1}]})
+
+    @cached("entity")
+    def svc_get():
+        return query()
+
+    svc_get()
+    svc_get()
+    assert query.call_count == 1
+
+    invalidate("entity")
+    svc_get()
+    assert query.call_count == 2
+
+    read_cache.clear()
+    query.return_value = {"status": STATUS_ERR, "error": "failed"}
+    svc_get()
+    svc_get()
+    assert query.call_count == 4
+
+
+def test_negative_cached_lookup(mocker):
+    """
+    a lookup that found nothing is not queried again until invalidated
+    """
+
+    query = mocker.Mock(return_value={"status": STATUS_OK, "data": []})
+
+    @cached("entity")
+    def svc_get_by_id(record_id):
+        return query(record_id)
+
+    assert svc_get_by_id(404)["data"] == []
+    assert svc_get_by_id(404)["data"] == []
+    assert query.call_count == 1
+
+    # creating the record drops the negative entry
+    invalidate("entity")
+    query.return_value = {"status": STATUS_OK, "data": [{"id": 404}]}
+    assert svc_get_by_id(404)["data"] == [{"id": 404}]
+    assert svc_get_by_id(404)["data"] == [{"id": 404}]
+    assert query.call_count == 2
+
+
+def test_empty_search_not_kept_in_read_cache(mocker):
+    """
+    empty search results only live in the negative cache
+    """
+
+    query = mocker.Mock(return_value={"status": STATUS_OK, "data": []})
+
+    @cached("entity")
+    def svc_like_search(payload):
+        return query(payload)
+
+    svc_like_search({"fields": []})
+    svc_like_search({"fields": []})
+
+    assert query.call_count == 1
+    assert not read_cache.entries
+
+
+def test_stats(cache):
+    """
+    stats report entries, counters and top keys
+    """
+
+    cache.get_or_load("a", lambda: [1, 2, 3])
+    cache.get_or_load("a", lambda: [1, 2, 3])
+    cache.get_or_load("b", lambda: "b")
+    cache.get_or_load("c", lambda: "c")
+    cache.get("b")
+
+    stats = cache.stats(top=1)
+
+    assert stats["entries"] == 2
+    assert stats["bytes"] > 0
+    assert stats["hits"] == 2
+    assert stats["misses"] == 3
+    assert stats["evictions"] == 1
+    assert stats["loads"] == 3
+    assert stats["top_keys"] == [{"key": "b", "hits": 1}]
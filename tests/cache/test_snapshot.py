@@ -0,0 +1,140 @@
+"""Snapshot Tests"""
+
+import json
+import time
+import pytest
+from cache import cache as cache_module
+from cache import snapshot as snapshot_module
+from cache.broadcast import Broadcast, events
+from cache.snapshot import Snapshot, SnapshotReader, write_snapshot
+
+
+def encode(row):
+    """encodes a row the way the snapshot builder does"""
+    return json.dumps(row, separators=(",", ":")).encode()
+
+
+@pytest.fixture()
+def tables():
+    """
+    returns a movie table and a movie_actor link table
+    """
+    movies = [
+        {"movie_id": movie_id, "title": f"movie {movie_id}"} for movie_id in (3, 1, 2)
+    ]
+    links = [{"movie_id": 1, "actor_id": actor_id} for actor_id in (7, 8)]
+
+    return {
+        "movie": [(row["movie_id"], encode(row)) for row in movies],
+        "movie_actor": [(row["movie_id"], encode(row)) for row in links],
+        "genre": [],
+    }
+
+
+def test_lookup_by_key(tmp_path, tables):
+    """
+    rows are found by key, including repeated keys of link tables
+    """
+
+    path = tmp_path / "reference.snap"
+    write_snapshot(path, tables, time.time_ns())
+    snapshot = Snapshot(path)
+
+    assert snapshot.rows("movie", 2) == [{"movie_id": 2, "title": "movie 2"}]
+    assert snapshot.rows("movie", 4) == []
+    assert [row["actor_id"] for row in snapshot.rows("movie_actor", 1)] == [7, 8]
+    assert snapshot.rows("genre", 1) == []
+
+
+def test_reader_swaps_to_new_snapshot(tmp_path, tables):
+    """
+    a newly published file is mapped on the next check
+    """
+
+    path = tmp_path / "reference.snap"
+    write_snapshot(path, tables, time.time_ns())
+    reader = SnapshotReader(path, check_interval=0)
+    assert reader.rows("movie", 4) == []
+
+    tables["movie"].append((4, encode({"movie_id": 4, "title": "movie 4"})))
+    write_snapshot(path, tables, time.time_ns())
+
+    assert reader.rows("movie", 4) == [{"movie_id": 4, "title": "movie 4"}]
+
+
+def test_dirty_keys_bypass_snapshot(tmp_path, tables):
+    """
+    only the keys written after the snapshot was built aren't served from
+    it, a write of unknown rows stops the whole table
+    """
+
+    path = tmp_path / "reference.snap"
+    write_snapshot(path, tables, time.time_ns())
+    reader = SnapshotReader(path, check_interval=0)
+
+    reader.mark_dirty(events(["movie"], [1], time.time_ns()))
+    reader.mark_dirty(events(["genre"], (), time.time_ns()))
+
+    assert reader.rows("movie", 1) is None
+    assert reader.rows("movie", 2) == [{"movie_id": 2, "title": "movie 2"}]
+    assert reader.rows("genre", 1) == []
+
+    reader.mark_dirty(events(["movie_actor"], None, time.time_ns()))
+    assert reader.rows("movie_actor", 1) is None
+    assert reader.stats()["dirty"] == ["movie_actor"]
+    assert reader.stats()["dirty_keys"] == 1
+
+
+def test_dirty_keys_collapse_to_table(tmp_path, tables):
+    """
+    past max_dirty_keys written rows the whole table is dirty instead, so
+    the entries stay bounded while no newer snapshot is published
+    """
+
+    path = tmp_path / "reference.snap"
+    write_snapshot(path, tables, time.time_ns())
+    reader = SnapshotReader(path, check_interval=0, max_dirty_keys=2)
+
+    reader.mark_dirty(events(["movie"], [1, 2], time.time_ns()))
+    assert reader.rows("movie", 3) == [{"movie_id": 3, "title": "movie 3"}]
+
+    reader.mark_dirty(events(["movie"], [4], time.time_ns()))
+    reader.mark_dirty(events(["movie_actor"], [1], time.time_ns()))
+
+    assert reader.rows("movie", 3) is None
+    assert list(reader.dirty) == ["movie", ("movie_actor", 1)]
+    assert reader.stats()["dirty"] == ["movie"]
+
+
+def test_old_snapshot_not_served(tmp_path, tables):
+    """
+    a snapshot older than max_age falls back to the database
+    """
+
+    path = tmp_path / "reference.snap"
+    write_snapshot(path, tables, time.time_ns() - 10 * 10**9)
+
+    assert SnapshotReader(path, check_interval=0, max_age=5).rows("movie", 2) is None
+    assert SnapshotReader(path, check_interval=0, max_age=60).rows("movie", 2)
+
+
+def test_write_in_other_worker_bypasses_snapshot(monkeypatch, tmp_path, tables):
+    """
+    a key written through another worker is read from the database
+    """
+
+    path = tmp_path / "reference.snap"
+    write_snapshot(path, tables, time.time_ns())
+    reader = SnapshotReader(path, check_interval=0)
+    monkeypatch.setattr(snapshot_module, "reader", reader)
+    monkeypatch.setattr(cache_module, "listeners", [reader.mark_dirty])
+    other_worker = Broadcast(cache_module.broadcast.path, 64)
+
+    @snapshot_module.from_snapshot("movie")
+    def svc_get_by_id(movie_id):
+        return {"status": 200, "data": [{"movie_id": movie_id, "title": "new"}]}
+
+    other_worker.publish(["movie"], [2])
+
+    assert svc_get_by_id(2)["data"] == [{"movie_id": 2, "title": "new"}]
+    assert svc_get_by_id(3)["data"] == [{"movie_id": 3, "title": "movie 3"}]
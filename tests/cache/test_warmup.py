@@ -0,0 +1,73 @@
+"""Warm-up Tests"""
+
+import os
+
+from blueprints.movie import service as movie_service
+from blueprints.movie_review import service as review_service
+from cache import warmup
+from cache.cache import cached, loaders, read_cache
+from constants.constants import STATUS_OK
+
+
+def test_save_and_replay_hot_keys(mocker, tmp_path):
+    """
+    recorded keys are replayed through the cached services
+    """
+
+    query = mocker.Mock(return_value={"status": STATUS_OK, "data": [{"id": 1}]})
+
+    @cached("warm")
+    def svc_like_search(payload):
+        return query(payload)
+
+    payload = {"fields": [{"field": "title", "value": "x"}]}
+    svc_like_search(payload)
+    svc_like_search(payload)
+
+    path = str(tmp_path / "hot_keys.json")
+    assert warmup.save_hot_keys(path, 10) == 1
+
+    # a fresh process starts with a cold cache
+    read_cache.clear()
+    assert warmup.replay(path, 2) == 1
+    assert query.call_count == 2
+
+    svc_like_search(payload)
+    assert query.call_count == 2
+
+
+def test_replay_skips_unknown_keys(tmp_path):
+    """
+    keys of services that no longer exist are ignored
+    """
+
+    path = tmp_path / "hot_keys.json"
+    (tmp_path / "hot_keys.json.1").write_text('{"gone:svc_get:[]": 3, "x": "y"}')
+
+    assert warmup.replay(str(path), 2) == 0
+
+
+def test_workers_keys_are_merged(tmp_path):
+    """
+    the files of every worker count, hits added up, stale ones are dropped
+    """
+
+    path = str(tmp_path / "hot_keys.json")
+    (tmp_path / "hot_keys.json.1").write_text('{"a": 5, "b": 1}')
+    (tmp_path / "hot_keys.json.2").write_text('{"b": 9, "c": 2}')
+    (tmp_path / "hot_keys.json.3").write_text('{"d": 100}')
+    (tmp_path / "hot_keys.json.3.tmp").write_text('{"e": 100}')
+    os.utime(tmp_path / "hot_keys.json.3", (0, 0))
+
+    assert warmup.load_hot_keys(path, 2) == ["b", "a"]
+    assert warmup.load_hot_keys(path, 10, max_age=1e12) == ["d", "b", "a", "c"]
+
+
+def test_lookups_by_id_are_recorded():
+    """
+    lookups by ID go through the read cache, so they are warmed too
+    """
+
+    # the snapshot is consulted first, the cache behind it
+    assert loaders["movie:svc_get_by_id"] is movie_service.svc_get_by_id.__wrapped__
+    assert loaders["movie_review:svc_get_by_id"] is review_service.svc_get_by_id
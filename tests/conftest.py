@@ -0,0 +1,19 @@
+"""Shared test fixtures"""
+
+import pytest
+from cache import cache as cache_module
+from cache.broadcast import Broadcast
+from cache.cache import caches
+
+
+@pytest.fixture(autouse=True)
+def clear_caches(monkeypatch, tmp_path):
+    """
+    starts every test with empty caches and its own invalidation file
+    """
+    monkeypatch.setattr(
+        cache_module, "broadcast", Broadcast(str(tmp_path / "cache_signal"), 64)
+    )
+    for cache in caches.values():
+        cache.clear()
+    yield
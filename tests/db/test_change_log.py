@@ -0,0 +1,146 @@
+"""Change log Tests"""
+
+import time
+
+import pytest
+from db import change_log
+from constants.constants import (
+    MOVIE,
+    MOVIE_ACTOR,
+    STATUS_BAD_REQUEST,
+    STATUS_GONE,
+    STATUS_NOT_FOUND,
+    STATUS_OK,
+)
+
+
+@pytest.fixture(autouse=True)
+def enabled(mocker):
+    """
+    the change log is installed and was just pruned
+    """
+    mocker.patch.object(change_log, "CHANGE_LOG_ENABLED", True)
+    mocker.patch.object(change_log, "pruned_at", time.monotonic())
+
+
+def test_ddl_has_a_trigger_per_table():
+    """
+    every table records its key columns
+    """
+
+    ddl = change_log.ddl("public")
+
+    for table in change_log.KEYS:
+        assert f"CREATE TRIGGER {table}_change_log" in ddl
+    assert "log_change('movie_id', 'actor_id')" in ddl
+
+
+def test_changes_since_token(mocker):
+    """
+    the latest change per key becomes an upsert or a tombstone
+    """
+
+    do_query = mocker.patch.object(change_log, "do_query")
+    do_query.side_effect = [
+        {"status": STATUS_OK, "data": [{"token": 120, "horizon": 90}]},
+        {
+            "status": STATUS_OK,
+            "data": [
+                {"op": "U", "row_key": {"movie_id": 1}, "row": {"movie_id": 1}},
+                {"op": "D", "row_key": {"movie_id": 2}, "row": None},
+                {"op": "U", "row_key": {"movie_id": 3}, "row": None},
+            ],
+        },
+    ]
+
+    result = change_log.changes_query(MOVIE_ACTOR, "100")
+
+    assert result == {
+        "status": STATUS_OK,
+        "data": {
+            "upserted": [{"movie_id": 1}],
+            "deleted": [{"movie_id": 2}, {"movie_id": 3}],
+            "token": "120",
+        },
+    }
+    sql, params = do_query.call_args.args
+    assert "t.actor_id = (l.row_key ->> 'actor_id')::bigint" in sql
+    assert params == {"entity": MOVIE_ACTOR, "since": 100, "token": 120}
+
+
+def test_full_sync_without_token(mocker):
+    """
+    without a token every row is upserted
+    """
+
+    do_query = mocker.patch.object(change_log, "do_query")
+    do_query.side_effect = [
+        {"status": STATUS_OK, "data": [{"token": 7, "horizon": 90}]},
+        {"status": STATUS_OK, "data": [{"movie_id": 1}]},
+    ]
+
+    result = change_log.changes_query(MOVIE, None)
+
+    assert result["data"] == {
+        "upserted": [{"movie_id": 1}],
+        "deleted": [],
+        "token": "7",
+    }
+
+
+def test_invalid_token(mocker):
+    """
+    a token that isn't a transaction id is rejected
+    """
+
+    do_query = mocker.patch.object(change_log, "do_query")
+
+    assert change_log.changes_query(MOVIE, "abc")["status"] == STATUS_BAD_REQUEST
+    assert change_log.changes_query(MOVIE, "-1")["status"] == STATUS_BAD_REQUEST
+    do_query.assert_not_called()
+
+
+def test_token_below_horizon_is_gone(mocker):
+    """
+    a token older than the pruned changes can't be served a delta
+    """
+
+    do_query = mocker.patch.object(change_log, "do_query")
+    do_query.return_value = {
+        "status": STATUS_OK,
+        "data": [{"token": 120, "horizon": 101}],
+    }
+
+    assert change_log.changes_query(MOVIE, "100")["status"] == STATUS_GONE
+    do_query.assert_called_once()
+
+
+def test_prune(mocker):
+    """
+    expired changes are deleted at most once per interval, moving the horizon
+    """
+
+    do_query = mocker.patch.object(change_log, "do_query")
+    mocker.patch.object(
+        change_log, "pruned_at", time.monotonic() - change_log.PRUNE_INTERVAL
+    )
+
+    change_log.prune()
+    change_log.prune()
+
+    sql, params = do_query.call_args.args
+    assert do_query.call_count == 1
+    assert "GREATEST(txid, (SELECT max(txid) + 1 FROM pruned))" in sql
+    assert params == {"retention": change_log.CHANGE_LOG_RETENTION}
+
+
+def test_disabled(mocker):
+    """
+    without the change log the endpoints answer 404 instead of failing
+    """
+
+    mocker.patch.object(change_log, "CHANGE_LOG_ENABLED", False)
+    do_query = mocker.patch.object(change_log, "do_query")
+
+    assert change_log.changes_query(MOVIE, "100")["status"] == STATUS_NOT_FOUND
+    do_query.assert_not_called()
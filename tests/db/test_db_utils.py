@@ -0,0 +1,207 @@
+"""Database utility Tests"""
+
+import time
+from datetime import date
+
+import pytest
+from flask import Flask
+from api.negotiation import csv_response, ndjson_response
+from db import db_utils
+from constants.constants import (
+    MOVIE,
+    MOVIE_REVIEW,
+    STATUS_BAD_REQUEST,
+    STATUS_NOT_FOUND,
+    STATUS_OK,
+)
+
+
+class FakeCursor:
+    """cursor whose COPY writes a header and two rows"""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def mogrify(self, sql, params):
+        """inlines the parameters"""
+        return (sql % {key: repr(value) for key, value in params.items()}).encode()
+
+    def copy_expert(self, sql, file, size):
+        """writes CSV lines to file"""
+        file.write(f"-- {sql}\n")
+        for row in self.rows:
+            file.write(row)
+
+
+class FakePool:
+    """pool handing out one fake connection"""
+
+    def __init__(self, rows):
+        self.conn = type("Conn", (), {})()
+        self.conn.cursor = lambda: FakeCursor(rows)
+        self.returned = []
+
+    def getconn(self):
+        return self.conn
+
+    def putconn(self, conn, close=False):
+        self.returned.append((conn, close))
+
+
+@pytest.fixture()
+def app():
+    """
+    returns a flask app context
+    """
+    flask_app = Flask(__name__)
+    with flask_app.app_context():
+        yield flask_app
+
+
+def test_filter_clause():
+    """
+    filters become parameterized conditions on known columns
+    """
+
+    sql, params = db_utils.filter_clause(MOVIE, {"title": "Up", "votes": "10"})
+
+    assert sql == " WHERE title = %(filter_0)s AND votes = %(filter_1)s"
+    assert params == {"filter_0": "Up", "filter_1": "10"}
+    assert db_utils.filter_clause(MOVIE, {}) == ("", {})
+
+    with pytest.raises(ValueError):
+        db_utils.filter_clause(MOVIE, {"title; DROP TABLE movie": "x"})
+
+
+class FakeStreamConn:
+    """connection whose server-side cursor yields rows"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.rolled_back = False
+
+    def cursor(self, name, cursor_factory):
+        """returns a cursor over the rows"""
+        cursor = type("Cursor", (list,), {"execute": lambda *args: None})(self.rows)
+        cursor.close = lambda: None
+        return cursor
+
+    def rollback(self):
+        """ends the cursor's transaction"""
+        self.rolled_back = True
+
+
+def test_stream_released_without_iteration(app):
+    """
+    a streamed response closed before its first chunk, as for a HEAD
+    request, still returns the cursor's connection to the pool
+    """
+
+    app.conn = FakePool([])
+    app.conn.conn = FakeStreamConn([{"movie_id": 1}])
+
+    result = db_utils.stream_query("SELECT * FROM movie", {})
+    response = ndjson_response(result)
+    response.get_app_iter({"REQUEST_METHOD": "HEAD"}).close()
+
+    assert app.conn.returned == [(app.conn.conn, False)]
+    assert app.conn.conn.rolled_back
+    assert not list(result["data"])
+
+
+def test_copy_query_streams_chunks(mocker, app):
+    """
+    COPY output is passed through and the connection returned to the pool
+    """
+
+    mocker.patch.object(db_utils, "COPY_CHUNK_SIZE", 8)
+    app.conn = FakePool(["1,Up\n", "2,Heat\n"])
+
+    result = db_utils.copy_query(
+        "SELECT * FROM movie WHERE title = %(t)s;", {"t": "Up"}
+    )
+    body = b"".join(result["data"])
+
+    assert result["status"] == STATUS_OK
+    assert body.startswith(
+        b"-- COPY (SELECT * FROM movie WHERE title = 'Up') TO STDOUT"
+    )
+    assert body.endswith(b"1,Up\n2,Heat\n")
+    assert app.conn.returned == [(app.conn.conn, False)]
+
+
+def test_copy_cancelled_without_iteration(mocker, app):
+    """
+    a CSV response closed before its first chunk, as for a HEAD request,
+    stops the COPY blocked on the full queue and releases its connection
+    """
+
+    mocker.patch.object(db_utils, "COPY_CHUNK_SIZE", 8)
+    mocker.patch.object(db_utils, "COPY_QUEUE_SIZE", 1)
+    app.conn = FakePool([f"{idx},Up\n" for idx in range(100)])
+
+    result = db_utils.copy_query("SELECT * FROM movie", {})
+    response = csv_response(result, "movie")
+    response.get_app_iter({"REQUEST_METHOD": "HEAD"}).close()
+
+    deadline = time.monotonic() + 5
+    while not app.conn.returned and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert app.conn.returned == [(app.conn.conn, True)]
+
+
+def test_bulk_delete_query_batches(mocker):
+    """
+    IDs are deduplicated and deleted one batch per statement
+    """
+
+    mocker_sql = mocker.patch("db.db_utils.do_query")
+    mocker_sql.side_effect = [
+        {"status": STATUS_OK, "data": [{"movie_id": 1}, {"movie_id": 2}]},
+        {"status": STATUS_OK, "data": [{"movie_id": 4}]},
+    ]
+
+    mocker.patch.object(db_utils, "BULK_DELETE_BATCH", 3)
+
+    result = db_utils.bulk_delete_query(
+        MOVIE, "movie_id", [MOVIE_REVIEW], [2, 1, 2, 3, 4]
+    )
+    sql, params = mocker_sql.call_args_list[0].args
+
+    assert result["status"] == STATUS_OK
+    assert result["data"] == {"deleted": [1, 2, 4], "not_found": [3]}
+    assert [call.args[1] for call in mocker_sql.call_args_list] == [
+        {"ids": [2, 1, 3]},
+        {"ids": [4]},
+    ]
+    assert f"DELETE FROM {db_utils.SCHEMA_NAME}.{MOVIE_REVIEW}" in sql
+    assert "RETURNING movie_id;" in sql
+    assert db_utils.bulk_delete_query(MOVIE, "movie_id", [], [])["status"] == (
+        STATUS_BAD_REQUEST
+    )
+
+
+def test_patch_query_types_values_by_column(mocker):
+    """
+    patched values are converted to the column types by the table row type
+    """
+
+    mocker_sql = mocker.patch("db.db_utils.do_query")
+    mocker_sql.return_value = {"status": STATUS_OK, "data": []}
+
+    result = db_utils.patch_query(
+        MOVIE, "movie_id", 1, {"metascore": 88, "movie_year": date(2014, 1, 1)}
+    )
+    sql, params = mocker_sql.call_args.args
+
+    assert result["status"] == STATUS_NOT_FOUND
+    # metascore is varchar: 88 is compared and stored as its text
+    assert f"NULL::{db_utils.SCHEMA_NAME}.{MOVIE}, %(changes)s::jsonb" in sql
+    assert "%(set_" not in sql
+    assert params["changes"] == '{"metascore": 88, "movie_year": "2014-01-01"}'
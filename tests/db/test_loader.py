@@ -0,0 +1,116 @@
+"""Dataset loader Tests"""
+
+import io
+
+import pytest
+from db import loader
+from constants.constants import (
+    ACTOR,
+    DIRECTOR,
+    GENRE,
+    MOVIE,
+    MOVIE_ACTOR,
+    MOVIE_DIRECTOR,
+    MOVIE_GENRE,
+)
+
+DATASET = """Rank,Title,Genre,Description,Director,Actors,Year,Runtime (Minutes),Rating,Votes,Revenue (Millions),Metascore
+1,Up,"Animation,Adventure",A house flies,Pete Docter,"Ed Asner, Jordan Nagai",2009,96,8.3,"1,041,025",293.00,88
+2,Heat,"Crime,Drama",A heist,Michael Mann,"Al Pacino,Robert De Niro, Al Pacino",1995,170,8.3,600000,,76
+"""
+
+
+def test_read_records():
+    """
+    dataset headers map to record fields and cells are cleaned up
+    """
+
+    records = list(loader.read_records(io.StringIO(DATASET)))
+
+    assert records[0]["genres"] == ["Animation", "Adventure"]
+    assert records[0]["movie_year"] == "2009-01-01"
+    assert records[0]["votes"] == "1041025"
+    assert records[1]["actors"] == ["Al Pacino", "Robert De Niro"]
+    assert records[1]["revenue"] is None
+    assert loader.split_person("Robert  De Niro") == ("Robert", "De Niro")
+
+
+def test_read_records_empty_file():
+    """
+    a file without a header row is reported instead of loading nothing
+    """
+
+    with pytest.raises(ValueError, match="empty"):
+        loader.read_records(io.StringIO(""))
+
+
+def test_copy_keeps_empty_strings():
+    """
+    empty cells are copied as empty strings, missing numbers as NULL
+    """
+
+    copied = []
+
+    class Cursor:
+        """cursor recording the COPY input"""
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            return False
+
+        def copy_expert(self, sql, file):
+            """reads the COPY input"""
+            copied.append(file.read())
+
+    class Pool:
+        """pool handing out one connection"""
+
+        def __init__(self):
+            self.conn = type(
+                "Conn", (), {"cursor": Cursor, "commit": lambda self: None}
+            )()
+
+        def getconn(self):
+            return self.conn
+
+        def putconn(self, conn, close=False):
+            assert not close
+
+    rows = [(1, "", "A heist", None)]
+    loaded = loader.Loader(Pool()).copy(MOVIE, ["movie_id", "title"], rows)
+
+    assert loaded == 1
+    assert copied == ['"1","","A heist",\n']
+
+
+def test_build_resolves_names():
+    """
+    names are deduplicated, existing rows reused and new IDs drawn once
+    """
+
+    counters = {}
+    calls = []
+
+    def allocate(table, count):
+        calls.append((table, count))
+        start = counters.get(table, 100)
+        counters[table] = start + count
+        return list(range(start, start + count))
+
+    existing = {GENRE: {"Drama": 7}, ACTOR: {("Al", "Pacino"): 3}}
+    rows = loader.build(loader.read_records(io.StringIO(DATASET)), existing, allocate)
+
+    assert rows[GENRE] == [(100, "Animation"), (101, "Adventure"), (102, "Crime")]
+    assert rows[DIRECTOR] == [(100, "Pete", "Docter"), (101, "Michael", "Mann")]
+    assert [row[1:] for row in rows[ACTOR]] == [
+        ("Ed", "Asner"),
+        ("Jordan", "Nagai"),
+        ("Robert", "De Niro"),
+    ]
+    assert [row[:2] for row in rows[MOVIE]] == [(100, "Up"), (101, "Heat")]
+    assert rows[MOVIE_GENRE] == [(100, 100), (100, 101), (101, 102), (101, 7)]
+    assert rows[MOVIE_DIRECTOR] == [(100, 100), (101, 101)]
+    assert rows[MOVIE_ACTOR] == [(100, 100), (100, 101), (101, 3), (101, 102)]
+    assert sorted(calls) == [(ACTOR, 3), (DIRECTOR, 2), (GENRE, 3), (MOVIE, 2)]
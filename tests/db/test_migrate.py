@@ -0,0 +1,107 @@
+"""Schema migration Tests"""
+
+import types
+
+from db import migrate
+
+
+class FakePool:
+    """one connection recording statements with the transaction mode they ran in"""
+
+    def __init__(self, applied=(), invalid=()):
+        self.applied = set(applied)
+        self.invalid = set(invalid)
+        self.statements = []
+        self.autocommit = True
+
+    def getconn(self):
+        return self
+
+    def putconn(self, conn):
+        pass
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.statements.append(("COMMIT", False))
+
+    def rollback(self):
+        self.statements.append(("ROLLBACK", False))
+
+
+class FakeCursor:
+    """cursor of FakePool"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.rows = []
+        self.description = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, sql, params=None):
+        sql = " ".join(sql.split())
+        self.pool.statements.append((sql, self.pool.autocommit))
+        self.description = None
+        if sql.startswith("SELECT version"):
+            self.description = True
+            self.rows = [(version,) for version in self.pool.applied]
+        elif sql.startswith("SELECT indisvalid"):
+            self.description = True
+            name = params["name"].split(".")[-1]
+            self.rows = [(False,)] if name in self.pool.invalid else []
+        elif sql.startswith("INSERT INTO s.schema_migration"):
+            self.pool.applied.add(params["version"])
+
+    def fetchall(self):
+        return self.rows
+
+
+MIGRATIONS = [
+    (1, "v0001_tables", types.SimpleNamespace(statements=lambda s: [f"CREATE {s}.a"])),
+    (2, "v0002_indexes", types.SimpleNamespace(INDEXES=(("a", ("b", "c")),))),
+    (3, "v0003_more", types.SimpleNamespace(statements=lambda s: [f"CREATE {s}.d"])),
+]
+
+
+def test_discover():
+    """
+    the migrations of the package are found in version order
+    """
+
+    found = migrate.discover()
+
+    assert [version for version, _, _ in found] == [1, 2, 3]
+    assert found[1][1] == "v0002_service_indexes"
+
+
+def test_migrate_applies_pending_in_order():
+    """
+    statements run in a transaction, indexes online, versions are recorded
+    """
+
+    pool = FakePool(applied={1}, invalid={"a_b_c"})
+    reports = []
+    done = migrate.Migrator(pool, "s").migrate(
+        MIGRATIONS, target=2, report=lambda name, _: reports.append(name)
+    )
+
+    assert done == [2]
+    assert reports == ["v0002_indexes"]
+    assert ("CREATE s.a", False) not in pool.statements
+    assert ("CREATE s.d", False) not in pool.statements
+    assert ("DROP INDEX CONCURRENTLY IF EXISTS s.a_b_c;", True) in pool.statements
+    assert (
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS a_b_c ON s.a (b, c);",
+        True,
+    ) in pool.statements
+    assert pool.statements[-1][0].startswith("SELECT pg_advisory_unlock")
+
+    done = migrate.Migrator(pool, "s").migrate(MIGRATIONS)
+    assert done == [3]
+    assert ("CREATE s.d", False) in pool.statements
@@ -0,0 +1,109 @@
+"""Write-behind Tests"""
+
+from db import write_behind
+from db.write_behind import FAILED, PENDING, PERSISTED, FlushFailed, WriteBehind
+from constants.constants import STATUS_NOT_FOUND, STATUS_OK
+
+
+def test_submit_rejects_when_full():
+    """
+    a full queue rejects rows instead of blocking
+    """
+
+    buffer = WriteBehind("review", lambda batch: {}, max_queue=2)
+
+    first = buffer.submit({"n": 1})
+    assert buffer.submit({"n": 2}) is not None
+    assert buffer.submit({"n": 3}) is None
+    assert buffer.states[first] == (PENDING, None)
+    assert len(buffer.states) == 2
+
+
+def test_batches_and_states():
+    """
+    queued rows are written in batches of batch_size, failed rows recorded
+    """
+
+    batches = []
+
+    def flush(batch):
+        batches.append([row["n"] for _, row in batch])
+        return {token: "bad row" for token, row in batch if row["n"] == 2}
+
+    buffer = WriteBehind("review", flush, batch_size=2, interval=0)
+    tokens = [buffer.submit({"n": n}) for n in range(1, 6)]
+
+    assert buffer.next_batch() and buffer.queue.qsize() == 3
+    assert buffer.drain() == 3
+    assert batches == [[3, 4], [5]]
+
+    buffer.write([(tokens[0], {"n": 1}), (tokens[1], {"n": 2})])
+    assert buffer.states[tokens[0]] == (PERSISTED, None)
+    assert buffer.states[tokens[1]] == (FAILED, "bad row")
+
+
+def test_failed_batch_is_retried_whole(mocker):
+    """
+    a batch the database rejects stays pending and is retried as a whole
+    after a growing backoff
+    """
+
+    batches = []
+
+    def flush(batch):
+        batches.append([row["n"] for _, row in batch])
+        if len(batches) < 3:
+            raise FlushFailed("connection refused")
+        buffer.stopped.set()
+        return {}
+
+    buffer = WriteBehind("review", flush, batch_size=2, interval=0)
+    waits = mocker.patch.object(buffer.stopped, "wait")
+    tokens = [buffer.submit({"n": n}) for n in (1, 2)]
+
+    assert buffer.try_write([(tokens[0], {"n": 1})]) is None
+    assert buffer.states[tokens[0]] == (PENDING, None)
+    batches.clear()
+
+    buffer.run()
+
+    assert batches == [[1, 2], [1, 2], [1, 2]]
+    assert [call.args[0] for call in waits.call_args_list] == [0.5, 1.0]
+    assert buffer.states[tokens[1]] == (PERSISTED, None)
+
+
+def test_close_flushes_queue():
+    """
+    rows still queued when the process exits are written
+    """
+
+    written = []
+    buffer = WriteBehind("review", lambda batch: written.extend(batch) or {})
+    buffer.submit({"n": 1})
+    buffer.submit({"n": 2})
+
+    buffer.close()
+
+    assert len(written) == 2
+    assert buffer.submit({"n": 3}) is None
+
+
+def test_status_reads_acks(mocker):
+    """
+    local states answer first, other tokens are looked up in write_ack
+    """
+
+    buffer = WriteBehind("review", lambda batch: {})
+    token = buffer.submit({"n": 1})
+    mocker_sql = mocker.patch.object(write_behind, "do_query")
+    mocker_sql.return_value = {"status": STATUS_OK, "data": []}
+
+    assert buffer.status(token)["data"]["state"] == PENDING
+    assert buffer.status("other")["status"] == STATUS_NOT_FOUND
+    assert mocker_sql.call_args.args[1] == {"token": "other", "entity": "review"}
+
+    mocker_sql.return_value = {
+        "status": STATUS_OK,
+        "data": [{"row_key": 7, "persisted_at": "2024-01-01T00:00:00"}],
+    }
+    assert buffer.status("other")["data"]["key"] == 7
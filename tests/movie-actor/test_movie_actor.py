@@ -158,3 +158,28 @@ def test_svc_exact_search(mocker, fields_payload, fake_data):
     assert data[0]["movie_id"] == fake_data["movie_id"]
     assert data[0]["actor_id"] == fake_data["actor_id"]
     assert data[0]["created_at"] == fake_data["created_at"]
+
+
+def test_svc_bulk_post(mocker):
+    """
+    Bulk POST service test function
+    """
+
+    mocker_sql = mocker.patch("db.db_utils.do_query")
+    mocker_sql.return_value = {
+        "status": STATUS_OK,
+        "data": [
+            {"movie_id": 1, "actor_id": 2, "error": None},
+            {"movie_id": 1, "actor_id": 3, "error": "unknown actor_id"},
+            {"movie_id": 1, "actor_id": 2, "error": "duplicate in request"},
+        ],
+    }
+
+    result = service.svc_bulk_post([(1, 2), (1, 3), (1, 2)])
+    sql, params = mocker_sql.call_args.args
+
+    assert result["status"] == STATUS_OK
+    assert result["data"]["inserted"] == 1
+    assert result["data"]["items"][1]["error"] == "unknown actor_id"
+    assert "unnest(%(first)s::bigint[], %(second)s::bigint[])" in sql
+    assert params == {"first": [1, 1, 1], "second": [2, 3, 2]}
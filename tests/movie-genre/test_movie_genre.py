@@ -158,3 +158,45 @@ def test_svc_exact_search(mocker, fields_payload, fake_data):
     assert data[0]["movie_id"] == fake_data["movie_id"]
     assert data[0]["genre_id"] == fake_data["genre_id"]
     assert data[0]["created_at"] == fake_data["created_at"]
+
+
+def test_svc_put_upserts(mocker, fake_ids):
+    """
+    PUT service moves a link with a single upsert statement
+    """
+
+    mocker_sql = mocker.patch.object(service, "do_query")
+    mocker_sql.return_value = {
+        "status": STATUS_OK,
+        "data": [{"movie_id": 1, "genre_id": 3}],
+    }
+
+    service.svc_put(fake_ids, {"movie_id": 1, "genre_id": 3})
+    sql, params = mocker_sql.call_args.args
+
+    assert mocker_sql.call_count == 1
+    assert "ON CONFLICT DO NOTHING" in sql
+    assert params["movie_id"] == 1 and params["genre_id"] == 3
+
+
+def test_svc_replace(mocker):
+    """
+    Replace service returns the applied difference, or 400 for unknown IDs
+    """
+
+    mocker_sql = mocker.patch("db.db_utils.do_query")
+    mocker_sql.return_value = {
+        "status": STATUS_OK,
+        "data": [{"parent_known": True, "unknown": [], "added": [4], "removed": [2]}],
+    }
+
+    result = service.svc_replace(1, [3, 4])
+    sql, params = mocker_sql.call_args.args
+
+    assert result == {"status": STATUS_OK, "data": {"added": [4], "removed": [2]}}
+    assert "genre_id <> ALL(%(ids)s::bigint[])" in sql
+    assert params == {"id": 1, "ids": [3, 4]}
+
+    mocker_sql.return_value["data"][0]["unknown"] = [9]
+
+    assert service.svc_replace(1, [3, 9])["status"] == 400
@@ -3,6 +3,7 @@
 import pytest
 from faker import Faker
 from blueprints.movie_review import service
+from db.write_behind import FlushFailed
 from constants.constants import STATUS_OK
 
 
@@ -207,3 +208,37 @@ def test_svc_exact_search(mocker, fields_payload, fake_data):
     assert data[0]["review_id"] == fake_data["review_id"]
     assert data[0]["review"] == fake_data["review"]
     assert data[0]["created_at"] == fake_data["created_at"]
+
+
+def test_flush_reviews_skips_unknown_movies(mocker):
+    """
+    reviews of unknown movies are left out of the batch and rejected
+    """
+
+    mocker_sql = mocker.patch.object(service, "do_query")
+    mocker_sql.return_value = {"status": STATUS_OK, "data": [{"token": "a"}]}
+    batch = [("a", {"movie_id": 1, "review": 5}), ("b", {"movie_id": 99, "review": 3})]
+
+    errors = service.flush_reviews(batch)
+    sql, params = mocker_sql.call_args.args
+
+    assert errors == {"b": "Unknown movie 99"}
+    assert mocker_sql.call_count == 1
+    assert params["tokens"] == ["a", "b"]
+    assert params["movie_ids"] == [1, 99]
+    assert "movie m ON m.movie_id = i.movie_id" in sql
+    assert "INSERT INTO" in sql and "write_ack (token, entity, row_key)" in sql
+
+
+def test_flush_reviews_failed_batch(mocker):
+    """
+    a batch the database rejects is raised whole, not retried row by row
+    """
+
+    mocker_sql = mocker.patch.object(service, "do_query")
+    mocker_sql.return_value = {"status": 500, "error": "connection refused"}
+    batch = [("a", {"movie_id": 1, "review": 5}), ("b", {"movie_id": 2, "review": 3})]
+
+    with pytest.raises(FlushFailed):
+        service.flush_reviews(batch)
+    assert mocker_sql.call_count == 1
@@ -2,8 +2,11 @@
 
 import pytest
 from faker import Faker
-from blueprints.movie import service
-from constants.constants import STATUS_OK
+from flask import Flask
+from api.bulk import RowSource
+from blueprints.movie import blueprint, service
+from blueprints.movie.blueprint import BulkMovieItem
+from constants.constants import STATUS_BAD_REQUEST, STATUS_OK
 
 
 @pytest.fixture
@@ -313,3 +316,135 @@ def test_svc_by_exact(mocker, fake_data, fields_payload):
     assert data[0]["revenue"] == fake_data["revenue"]
     assert data[0]["metascore"] == fake_data["metascore"]
     assert data[0]["created_at"] == fake_data["created_at"]
+
+
+def test_svc_get_stream(mocker, fake_data):
+    """
+    GET service test function for streamed results
+    """
+
+    # streaming goes to a server-side cursor instead of "do_query"
+    mocker_sql = mocker.patch.object(service, "do_query")
+    mocker_stream = mocker.patch.object(service, "stream_query")
+    mocker_stream.return_value = {"status": STATUS_OK, "data": iter([fake_data])}
+
+    result = service.svc_get(stream=True)
+    data = list(result["data"])
+
+    assert result["status"] == STATUS_OK
+    assert data[0]["movie_id"] == fake_data["movie_id"]
+    mocker_sql.assert_not_called()
+
+
+def test_svc_export(mocker):
+    """
+    CSV export service test function
+    """
+
+    mocker_copy = mocker.patch.object(service, "copy_query")
+    mocker_copy.return_value = {"status": STATUS_OK, "data": iter([b"movie_id\n"])}
+
+    result = service.svc_export({"movie_year": "2014-01-01"})
+    sql, params = mocker_copy.call_args.args
+
+    assert result["status"] == STATUS_OK
+    assert "WHERE movie_year = %(filter_0)s" in sql
+    assert params == {"filter_0": "2014-01-01"}
+
+    # unknown columns are rejected before reaching the database
+    assert service.svc_export({"nope": "1"})["status"] == 400
+
+
+def test_svc_bulk(mocker):
+    """
+    Bulk POST service test function
+    """
+
+    mocker_copy = mocker.patch.object(service, "copy_in_query")
+    mocker_copy.return_value = {
+        "status": STATUS_OK,
+        "data": [{"row": 1, "movie_id": 7}],
+    }
+    source = type("Source", (), {"columns": ["title", "votes"]})()
+
+    result = service.svc_bulk(source)
+    setup_sql, copy_sql, copy_source, merge_sql = mocker_copy.call_args.args
+
+    assert result["data"] == [{"row": 1, "movie_id": 7}]
+    assert "WITH NO DATA" in setup_sql
+    assert copy_sql == "COPY movie_staging (row_no, title, votes) FROM STDIN WITH CSV"
+    assert copy_source is source
+    assert "SELECT movie_id, title, votes FROM movie_staging" in merge_sql
+
+
+def test_bulk_movie_year_is_a_date():
+    """
+    bulk rows with a movie_year that isn't a date are rejected before COPY
+    """
+
+    row = {
+        "title": "Up",
+        "description": "A house flies",
+        "rating": 8.3,
+        "runtime": 96,
+        "votes": 10,
+        "revenue": 293.0,
+        "metascore": 88,
+    }
+    rows = iter(
+        [(1, {**row, "movie_year": "2009-05-29"}), (2, {**row, "movie_year": "2009"})]
+    )
+    source = RowSource(rows, BulkMovieItem)
+
+    assert source.read().startswith(b'"1","Up","A house flies","2009-05-29",')
+    assert [error["row"] for error in source.errors] == [2]
+
+
+def test_bulk_delete_validates_ids(mocker):
+    """
+    bulk delete IDs are validated as integers before reaching the service
+    """
+
+    app = Flask(__name__)
+    app.register_blueprint(blueprint.movie_blueprint)
+    client = app.test_client()
+    mocker_delete = mocker.patch.object(blueprint, "svc_bulk_delete")
+    mocker_delete.return_value = {
+        "status": STATUS_OK,
+        "data": {"deleted": [1, 2], "not_found": []},
+    }
+
+    response = client.post("/movie/bulk_delete", json={"ids": ["1", 2]})
+
+    assert response.status_code == STATUS_OK
+    mocker_delete.assert_called_once_with([1, 2])
+    assert client.post("/movie/bulk_delete", json={"ids": ["x"]}).status_code == 400
+
+
+def test_svc_patch(mocker):
+    """
+    PATCH service test function
+    """
+
+    mocker_sql = mocker.patch("db.db_utils.do_query")
+    mocker_sql.return_value = {
+        "status": STATUS_OK,
+        "data": [{"movie_id": 1, "votes": 10, "rating": 7.5, "changed": True}],
+    }
+
+    result = service.svc_patch({"votes": 10, "rating": 7.5}, 1)
+    sql, params = mocker_sql.call_args.args
+
+    assert result["status"] == STATUS_OK
+    assert result["data"] == {
+        "changed": True,
+        "row": {"movie_id": 1, "votes": 10, "rating": 7.5},
+    }
+    # votes is varchar, the number is converted by the movie row type
+    assert "jsonb_populate_record(" in sql
+    assert "SET votes = new.votes, rating = new.rating" in sql
+    assert "ROW(t.votes, t.rating) IS DISTINCT FROM ROW(new.votes, new.rating)" in sql
+    assert params == {"id": 1, "changes": '{"votes": 10, "rating": 7.5}'}
+
+    assert service.svc_patch({"movie_id": 2}, 1)["status"] == STATUS_BAD_REQUEST
+    assert service.svc_patch({}, 1)["status"] == STATUS_BAD_REQUEST
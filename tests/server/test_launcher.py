@@ -0,0 +1,65 @@
+"""Launcher Tests"""
+
+import pytest
+from server import launcher
+
+
+@pytest.fixture(autouse=True)
+def background(mocker):
+    """
+    two refresh workers and two warm-up threads query besides requests
+    """
+    mocker.patch.object(launcher, "CACHE_REFRESH_WORKERS", 2)
+    mocker.patch.object(launcher, "WARMUP_CONCURRENCY", 2)
+    mocker.patch.object(launcher, "JOB_WORKERS", 0)
+
+
+def test_pool_covers_threads():
+    """
+    without a budget the pool fits every request and background thread
+    """
+
+    assert launcher.plan(4, 8) == {"threads": 8, "minconn": 1, "maxconn": 12}
+
+
+def test_budget_limits_threads():
+    """
+    a connection budget is split across workers and caps their threads
+    """
+
+    assert launcher.plan(4, 8, budget=40) == {"threads": 6, "minconn": 1, "maxconn": 10}
+    assert launcher.plan(4, 8, budget=100)["threads"] == 8
+
+    with pytest.raises(ValueError):
+        launcher.plan(4, 8, budget=3)
+
+
+def test_budget_below_background_fails():
+    """
+    a worker whose share of the budget only covers its background threads
+    can't start
+    """
+
+    assert launcher.plan(4, 8, budget=20)["threads"] == 1
+
+    with pytest.raises(ValueError):
+        launcher.plan(4, 8, budget=16)
+
+
+def test_options():
+    """
+    the gunicorn settings follow the arguments and the sizing
+    """
+
+    args = launcher.parse_args(
+        ["--workers", "3", "--no-preload", "--max-requests", "50"]
+    )
+    settings = launcher.options(args, launcher.plan(args.workers, 4))
+
+    assert settings["workers"] == 3
+    assert settings["threads"] == 4
+    assert settings["worker_class"] == "gthread"
+    assert settings["preload_app"] is False
+    assert settings["max_requests"] == 50
+    assert callable(settings["post_worker_init"])
+    assert callable(settings["worker_exit"])